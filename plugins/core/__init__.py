@@ -1,3 +1,12 @@
-from .widgets import PLUGIN_META
+from typing import Any
 
 __all__ = ["PLUGIN_META"]
+
+
+def __getattr__(name: str) -> Any:
+    # NOTE widget code is only imported when needed, see 'plugin.toml'
+    if name == "PLUGIN_META":
+        from .widgets import PLUGIN_META
+
+        return PLUGIN_META
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
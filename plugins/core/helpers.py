@@ -1,20 +1,36 @@
+import asyncio
+import logging
+import os
+from collections.abc import Iterable
 from functools import lru_cache
+from hashlib import sha256
 from pathlib import Path
 from shutil import copytree
 from typing import NamedTuple
 from zipfile import ZipFile
 
 from pydantic_settings import BaseSettings
+from tortoise.exceptions import IntegrityError
+from tortoise.transactions import atomic
 
-from web_portal.plugin_api import get_plugin_data_path
+from web_portal.plugin_api import get_plugin_cache, get_plugin_data_path, invalidate_widget_cache
+
+from . import models
+
+logger = logging.getLogger("web-portal")
 
 ICONS_PATH = get_plugin_data_path("core") / "icons"
+# NOTE in priority order, when an icon is given in more than one format
+ICON_FORMATS = ("svg", "png")
 VALID_UPLOAD_EXTENSIONS = (".zip",)
+ADD_WIDGET_LINK_ATTEMPTS = 5
 
 
 class PluginSettings(BaseSettings):
     ALLOW_ICON_UPLOADS: bool | None = True
     OPEN_TO_NEW_TAB: bool | None = True
+    # seconds between checking the icon folders for changes
+    ICONS_CHECK_INTERVAL: float = 10
 
 
 @lru_cache
@@ -22,22 +38,307 @@ def get_settings():
     return PluginSettings()
 
 
+async def get_links_by_ids(link_ids: Iterable[int]) -> list[models.Link]:
+    """
+    Get links sorted by name, using the plugin cache
+
+        :param link_ids: The link ids, missing links are skipped
+        :return: The found links
+    """
+    link_ids = tuple(sorted(set(link_ids)))
+    if not link_ids:
+        return []
+    return await get_plugin_cache("core").get_or_compute(
+        ("links", link_ids),
+        lambda: models.Link.filter(id__in=link_ids).order_by("name").all(),
+    )
+
+
+async def get_widget_link_ids(widget_ids: Iterable[int]) -> dict[int, list[int]]:
+    """
+    Get the ids of links added to placed links widgets, in order
+
+        :param widget_ids: The placed widget ids
+        :return: The link ids, by placed widget id
+    """
+    link_ids: dict[int, list[int]] = {widget_id: [] for widget_id in widget_ids}
+    if not link_ids:
+        return {}
+    for widget_id, link_id in (
+        await models.WidgetLink.filter(dashboard_widget_id__in=link_ids.keys())
+        .order_by("position")
+        .values_list("dashboard_widget_id", "link_id")
+    ):
+        link_ids[widget_id].append(link_id)
+    return link_ids
+
+
+async def get_widget_links(widget_id: int) -> list[models.Link]:
+    """
+    Get the links added to a placed links widget, in order
+
+        :param widget_id: The placed widget id
+    """
+    return [
+        widget_link.link
+        for widget_link in await models.WidgetLink.filter(dashboard_widget_id=widget_id)
+        .order_by("position")
+        .select_related("link")
+    ]
+
+
+async def add_widget_link(widget_id: int, link_id: int) -> bool:
+    """
+    Add a link to the end of a placed links widget
+
+        :param widget_id: The placed widget id
+        :param link_id: The link id
+        :return: Whether it was added, False when already added
+    """
+    # NOTE positions are unique per widget, so adds racing for a position retry with the next one
+    for _ in range(ADD_WIDGET_LINK_ATTEMPTS):
+        if await models.WidgetLink.exists(dashboard_widget_id=widget_id, link_id=link_id):
+            return False
+        last_position = (
+            await models.WidgetLink.filter(dashboard_widget_id=widget_id)
+            .order_by("-position")
+            .first()
+            .values_list("position", flat=True)
+        )
+        try:
+            await models.WidgetLink.create(
+                dashboard_widget_id=widget_id,
+                link_id=link_id,
+                position=0 if last_position is None else last_position + 1,
+            )
+        except IntegrityError:
+            continue
+        invalidate_widget_cache(widget_id)
+        return True
+    return False
+
+
+async def remove_widget_link(widget_id: int, index: int) -> bool:
+    """
+    Remove a link from a placed links widget
+
+        :param widget_id: The placed widget id
+        :param index: The link's index in the widget
+        :return: Whether it was removed, False when not found
+    """
+    if index < 0:
+        return False
+    widget_link_id = (
+        await models.WidgetLink.filter(dashboard_widget_id=widget_id)
+        .order_by("position")
+        .offset(index)
+        .first()
+        .values_list("id", flat=True)
+    )
+    if widget_link_id is None or not await models.WidgetLink.filter(id=widget_link_id).delete():
+        return False
+    invalidate_widget_cache(widget_id)
+    return True
+
+
+@atomic()
+async def delete_link(link_id: int) -> list[int]:
+    """
+    Delete a link, removing it from the placed links widgets it was added to
+
+        :param link_id: The link id
+        :return: The ids of placed widgets the link was removed from
+    """
+    widget_ids = await models.WidgetLink.filter(link_id=link_id).values_list(
+        "dashboard_widget_id", flat=True
+    )
+    # NOTE widget links are removed by the cascade
+    await models.Link.filter(id=link_id).delete()
+    return list(widget_ids)
+
+
+async def get_search_engines_by_ids(
+    engine_ids: Iterable[int],
+) -> dict[int, models.SearchEngine]:
+    """
+    Get search engines by id, using the plugin cache
+
+        :param engine_ids: The search engine ids, missing engines are skipped
+        :return: The found engines, by id
+    """
+    engine_ids = tuple(sorted(set(engine_ids)))
+    if not engine_ids:
+        return {}
+
+    async def get_engines():
+        return {engine.id: engine for engine in await models.SearchEngine.filter(id__in=engine_ids)}
+
+    return await get_plugin_cache("core").get_or_compute(
+        ("search-engines", engine_ids), get_engines
+    )
+
+
+def invalidate_links_cache():
+    get_plugin_cache("core").delete_where(lambda key: key[0] == "links")
+
+
+def invalidate_search_engines_cache():
+    get_plugin_cache("core").delete_where(lambda key: key[0] == "search-engines")
+
+
 class IconsImportStats(NamedTuple):
     png_count: int
     svg_count: int
 
 
-def get_icon_names() -> set[str]:
+class IconEntry(NamedTuple):
+    format: str
+    path: Path
+    size: int
+    mtime: float
+    # sha256 of the file content
+    hash: str
+
+
+class IconIndex:
+    """
+    In-memory index of the icons in the icons folder, by name.
+    Rebuilt when the modification time of a format's folder changes,
+    only files with a changed size or modification time are read again.
+    """
+
+    def __init__(self, root: Path) -> None:
+        self.root = root
+        self._icons: dict[str, IconEntry] = {}
+        # every file found, including icons given in a higher priority format
+        self._files: dict[Path, IconEntry] = {}
+        # None until first built
+        self._folder_mtimes: dict[str, int | None] | None = None
+        self._build_lock = asyncio.Lock()
+
+    def _get_folder_mtimes(self) -> dict[str, int | None]:
+        folder_mtimes = {}
+        for icon_format in ICON_FORMATS:
+            try:
+                folder_mtimes[icon_format] = (self.root / icon_format).stat().st_mtime_ns
+            except FileNotFoundError:
+                folder_mtimes[icon_format] = None
+        return folder_mtimes
+
+    def _scan_folder(self, icon_format: str) -> Iterable[IconEntry]:
+        suffix = f".{icon_format}"
+        with os.scandir(self.root / icon_format) as entries:
+            for entry in entries:
+                if not entry.name.endswith(suffix) or not entry.is_file():
+                    continue
+                path = Path(entry.path)
+                stat = entry.stat()
+                previous = self._files.get(path)
+                if (
+                    previous is not None
+                    and previous.size == stat.st_size
+                    and previous.mtime == stat.st_mtime
+                ):
+                    yield previous
+                else:
+                    yield IconEntry(
+                        icon_format,
+                        path,
+                        stat.st_size,
+                        stat.st_mtime,
+                        sha256(path.read_bytes()).hexdigest(),
+                    )
+
+    def refresh(self, *, force: bool = False) -> bool:
+        """
+        Rebuild the index if an icon folder has changed
+
+            :param force: Rebuild even when no folder has changed,
+                          e.g. after files were replaced, defaults to False
+            :return: Whether the index was rebuilt
+        """
+        folder_mtimes = self._get_folder_mtimes()
+        if not force and folder_mtimes == self._folder_mtimes:
+            return False
+
+        icons = {}
+        files = {}
+        # NOTE lowest priority first, so higher priority formats replace them
+        for icon_format in reversed(ICON_FORMATS):
+            if folder_mtimes[icon_format] is None:
+                continue
+            for entry in self._scan_folder(icon_format):
+                icons[entry.path.stem] = entry
+                files[entry.path] = entry
+        self._icons = icons
+        self._files = files
+        self._folder_mtimes = folder_mtimes
+        logger.debug("rebuilt icon index::icon_count=%s", len(icons))
+        return True
+
+    async def ensure_built(self):
+        """
+        Build the index if it has not been built yet,
+        without blocking the event loop
+        """
+        if self._folder_mtimes is not None:
+            return
+        async with self._build_lock:
+            if self._folder_mtimes is None:
+                await asyncio.to_thread(self.refresh)
+
+    def get(self, icon_name: str) -> IconEntry | None:
+        return self._icons.get(icon_name)
+
+    def get_names(self) -> set[str]:
+        return set(self._icons)
+
+
+@lru_cache
+def get_icon_index() -> IconIndex:
+    """
+    returns the shared IconIndex obj
+    """
+    return IconIndex(ICONS_PATH)
+
+
+async def refresh_icon_index(*, force: bool = False):
+    """
+    Rebuild the icon index if an icon folder has changed
+
+        :param force: Rebuild even when no folder has changed,
+                      e.g. after files were replaced, defaults to False
+    """
+    # NOTE reads from disk, so kept off the event loop
+    await asyncio.to_thread(get_icon_index().refresh, force=force)
+
+
+async def get_icon_names() -> set[str]:
     """
     Gets all icon names found in the icons folder.
     Sort order unpredictable, will need sorting if needed.
 
         :return: Icon names
     """
-    return {path.stem for path in ICONS_PATH.glob("**/*")}
+    index = get_icon_index()
+    await index.ensure_built()
+    return index.get_names()
 
 
-def get_icon_path(icon_name: str) -> Path | None:
+async def get_icon_entry(icon_name: str) -> IconEntry | None:
+    """
+    Gets an icon's details, preferring svg when given in both formats,
+    returning None if none were found
+
+        :param icon_name: The icon's name
+        :return: The icon or None
+    """
+    index = get_icon_index()
+    await index.ensure_built()
+    return index.get(icon_name)
+
+
+async def get_icon_path(icon_name: str) -> Path | None:
     """
     Gets the icons image path,
     returning None if none were found
@@ -45,16 +346,8 @@ def get_icon_path(icon_name: str) -> Path | None:
         :param icon_name: The icon's name
         :return: The file path or None
     """
-    search_paths = [
-        # NOTE ensure svg is at first index for priority
-        ICONS_PATH / f"svg/{icon_name}.svg",
-        ICONS_PATH / f"png/{icon_name}.png",
-    ]
-
-    for path in search_paths:
-        if path.is_file():
-            return path
-    return None
+    icon = await get_icon_entry(icon_name)
+    return icon.path if icon is not None else None
 
 
 def copy_icons_from_import(src: Path) -> IconsImportStats:
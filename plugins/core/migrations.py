@@ -0,0 +1,66 @@
+from tortoise import Tortoise
+from tortoise.backends.base.client import BaseDBAsyncClient
+from tortoise.transactions import in_transaction
+
+from web_portal.plugin_api import Migration, create_model_index, create_model_table
+
+from . import models
+
+
+async def add_widget_links(conn: BaseDBAsyncClient):
+    """
+    Move the link ids stored in each links widget's config into their own table
+    """
+    await create_model_table(conn, models.WidgetLink)
+
+    dashboard_widget_model = Tortoise.apps["models"]["DashboardWidget"]
+    link_ids = set(await models.Link.all().values_list("id", flat=True))
+
+    async with in_transaction():
+        for widget_id, config in await dashboard_widget_model.filter(
+            widget__internal_name="core__links"
+        ).values_list("id", "config"):
+            if not isinstance(config, dict) or "links" not in config:
+                continue
+            # NOTE skips links deleted since they were added, along with any duplicates
+            widget_link_ids = [
+                link_id for link_id in dict.fromkeys(config.pop("links")) if link_id in link_ids
+            ]
+            await models.WidgetLink.filter(dashboard_widget_id=widget_id).delete()
+            await models.WidgetLink.bulk_create(
+                models.WidgetLink(dashboard_widget_id=widget_id, link_id=link_id, position=i)
+                for i, link_id in enumerate(widget_link_ids)
+            )
+            await dashboard_widget_model.filter(id=widget_id).update(config=config)
+
+
+async def add_unique_widget_link_positions(conn: BaseDBAsyncClient):
+    """
+    Make the positions of links unique per widget, renumbering widgets
+    given duplicate positions by links added at the same time
+    """
+    widget_links: dict[int, list[tuple[int, int]]] = {}
+    for widget_link_id, widget_id, position in (
+        await models.WidgetLink.all()
+        .order_by("position", "id")
+        .values_list("id", "dashboard_widget_id", "position")
+    ):
+        widget_links.setdefault(widget_id, []).append((widget_link_id, position))
+
+    async with in_transaction():
+        for rows in widget_links.values():
+            if len({position for _, position in rows}) == len(rows):
+                continue
+            for position, (widget_link_id, _) in enumerate(rows):
+                await models.WidgetLink.filter(id=widget_link_id).update(position=position)
+
+    # NOTE the previous (non unique) index is left, as it is not used by queries
+    await create_model_index(
+        conn, models.WidgetLink, ["dashboard_widget_id", "position"], unique=True
+    )
+
+
+MIGRATIONS = (
+    Migration(1, "widget links", add_widget_links),
+    Migration(2, "unique widget link positions", add_unique_widget_link_positions),
+)
@@ -1,6 +1,15 @@
 from enum import Enum
 
-from tortoise.fields import CharEnumField, CharField, IntField, TextField
+from tortoise.fields import (
+    CASCADE,
+    CharEnumField,
+    CharField,
+    ForeignKeyField,
+    ForeignKeyRelation,
+    IntField,
+    ReverseRelation,
+    TextField,
+)
 from tortoise.models import Model
 
 
@@ -16,10 +25,32 @@ class Link(Model):
     color_name = CharField(128)
     icon_name = CharField(128, null=True)
 
+    widget_links = ReverseRelation["WidgetLink"]
+
     class Meta:
         table = "core__link"
 
 
+class WidgetLink(Model):
+    """
+    A link added to a placed links widget,
+    removed with either the link or the widget
+    """
+
+    id = IntField(pk=True)
+    dashboard_widget: ForeignKeyRelation = ForeignKeyField(
+        "models.DashboardWidget", "core_widget_links", on_delete=CASCADE
+    )
+    link: ForeignKeyRelation[Link] = ForeignKeyField("core.Link", "widget_links", on_delete=CASCADE)
+    # orders the links of a widget, gaps are left by removed links
+    position = IntField(default=0)
+
+    class Meta:
+        table = "core__widgetlink"
+        unique_together = (("dashboard_widget", "link"), ("dashboard_widget", "position"))
+        indexes = (("link_id",),)
+
+
 class SearchEngine(Model):
     id = IntField(pk=True)
     name = CharField(128, unique=True)
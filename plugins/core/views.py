@@ -6,23 +6,31 @@ from quart import Blueprint, abort, flash, redirect, render_template, request, s
 
 from web_portal.plugin_api import (
     current_user,
-    get_widget_details,
-    get_widget_owner_id,
+    get_editable_widget_context,
+    invalidate_plugin_widget_cache,
+    invalidate_widget_cache,
     login_admin_required,
     login_required_if_secured,
     login_standard_required,
     redirect_using_back_to,
-    set_widget_config,
+    update_widget_config,
 )
 
 from . import models
 from .helpers import (
     VALID_UPLOAD_EXTENSIONS,
+    add_widget_link,
     copy_icons_from_import,
+    delete_link,
     extract_upload,
+    get_icon_entry,
     get_icon_names,
     get_icon_path,
     get_settings,
+    invalidate_links_cache,
+    invalidate_search_engines_cache,
+    refresh_icon_index,
+    remove_widget_link,
 )
 
 logger = logging.getLogger("web-portal")
@@ -38,11 +46,20 @@ async def get_index():
 @blueprint.get("/static/icons/<icon_name>")
 @login_required_if_secured
 async def get_icon(icon_name):
-    full_path = get_icon_path(icon_name)
-    if full_path is None:
+    icon = await get_icon_entry(icon_name)
+    if icon is None:
         abort(404)
 
-    return await send_file(full_path, attachment_filename=full_path.name)
+    try:
+        response = await send_file(
+            icon.path, attachment_filename=icon.path.name, add_etags=False, conditional=False
+        )
+    except FileNotFoundError:
+        # removed since the icon index was last refreshed
+        abort(404)
+    # NOTE made conditional once the etag is set, so a matching etag gives a 304
+    response.set_etag(icon.hash)
+    return await response.make_conditional(request)
 
 
 @blueprint.get("/upload-icons")
@@ -75,6 +92,8 @@ async def post_upload_icons():
         if upload_stats.png_count == 0 and upload_stats.svg_count == 0:
             await flash("detected no image files, did you put them in the correct format?", "error")
         else:
+            # NOTE replaced files do not change their folder's modification time
+            await refresh_icon_index(force=True)
             await flash(
                 f"uploaded icons (png={upload_stats.png_count}, \
                         svg={upload_stats.svg_count})",
@@ -133,6 +152,8 @@ async def post_engines_new():
         query_param=query_param,
         method=method,
     )
+    invalidate_search_engines_cache()
+    invalidate_plugin_widget_cache("core", "search")
 
     await flash(f"created engine with name '{name}'", "ok")
 
@@ -164,6 +185,8 @@ async def post_engines_edit(engine_id: int):
     )
 
     await engine.save()
+    invalidate_search_engines_cache()
+    invalidate_plugin_widget_cache("core", "search")
 
     await flash(f"updated engine with name '{name}'", "ok")
 
@@ -174,6 +197,8 @@ async def post_engines_edit(engine_id: int):
 @login_admin_required
 async def get_engines_delete(engine_id: int):
     await models.SearchEngine.filter(id=engine_id).delete()
+    invalidate_search_engines_cache()
+    invalidate_plugin_widget_cache("core", "search")
     await flash("deleted engine", "ok")
 
     return redirect(url_for(".get_engines_index"))
@@ -189,7 +214,7 @@ async def get_links_index():
 @blueprint.get("/links/new")
 @login_admin_required
 async def get_link_new():
-    icon_names = sorted(get_icon_names())
+    icon_names = sorted(await get_icon_names())
 
     return await render_template(
         "core/links/new.jinja",
@@ -200,7 +225,7 @@ async def get_link_new():
 @blueprint.get("/links/<int:link_id>/edit")
 @login_admin_required
 async def get_link_edit(link_id: int):
-    icon_names = sorted(get_icon_names())
+    icon_names = sorted(await get_icon_names())
     link = await models.Link.filter(id=link_id).get()
 
     return await render_template(
@@ -213,7 +238,9 @@ async def get_link_edit(link_id: int):
 @blueprint.get("/links/<int:link_id>/delete")
 @login_admin_required
 async def get_link_delete(link_id: int):
-    await models.Link.filter(id=link_id).delete()
+    for widget_id in await delete_link(link_id):
+        invalidate_widget_cache(widget_id)
+    invalidate_links_cache()
     await flash("deleted link", "ok")
 
     return redirect(url_for(".get_links_index"))
@@ -233,9 +260,9 @@ async def post_link_new():
         await flash("link name cannot be blank", "error")
         return redirect(url_for(".get_link_new"))
 
-    if icon_name and get_icon_path(icon_name) is None:
+    if icon_name and await get_icon_path(icon_name) is None:
         logger.warning(
-            "icon name requested not found, " "or permission to read is missing::name='%s'",
+            "icon name requested not found, or permission to read is missing::name='%s'",
             icon_name,
         )
         await flash("failed to find icon", "error")
@@ -247,6 +274,8 @@ async def post_link_new():
         color_name=color_name,
         icon_name=icon_name,
     )
+    invalidate_links_cache()
+    invalidate_plugin_widget_cache("core", "links")
 
     await flash(f"created link with name '{name}'", "ok")
 
@@ -269,9 +298,9 @@ async def post_link_edit(link_id: int):
         await flash("link name cannot be blank", "error")
         return redirect(url_for(".get_link_edit", link_id=link_id))
 
-    if icon_name and get_icon_path(icon_name) is None:
+    if icon_name and await get_icon_path(icon_name) is None:
         logger.warning(
-            "icon name requested not found, " "or permission to read is missing::name='%s'",
+            "icon name requested not found, or permission to read is missing::name='%s'",
             icon_name,
         )
         await flash("failed to find icon", "error")
@@ -287,6 +316,8 @@ async def post_link_edit(link_id: int):
     )
 
     await link.save()
+    invalidate_links_cache()
+    invalidate_plugin_widget_cache("core", "links")
 
     await flash(f"updated link with name '{name}'", "ok")
 
@@ -297,19 +328,19 @@ async def post_link_edit(link_id: int):
 @login_standard_required
 @redirect_using_back_to
 async def post_widget_update_search(widget_id: int):
-    if str(await get_widget_owner_id(widget_id)) != current_user.auth_id:
+    widget_context = await get_editable_widget_context(widget_id)
+
+    if str(widget_context.owner_id) != current_user.auth_id:
         abort(401)
 
     engine_id = (await request.form)["engine-id"]
 
     engine = await models.SearchEngine.get(id=engine_id)
 
-    widget_details = await get_widget_details(widget_id)
-
-    if widget_details.plugin_name != "core" or widget_details.internal_name != "search":
+    if widget_context.plugin_name != "core" or widget_context.internal_name != "search":
         abort(400)
 
-    await set_widget_config(widget_id, {"engine_id": engine.id})
+    await update_widget_config(widget_context, {"engine_id": engine.id})
 
     await flash(f"updated search engine to '{engine.name}'", "ok")
 
@@ -318,74 +349,61 @@ async def post_widget_update_search(widget_id: int):
 @login_standard_required
 @redirect_using_back_to
 async def post_widget_customise_link(widget_id: int):
-    if str(await get_widget_owner_id(widget_id)) != current_user.auth_id:
-        abort(401)
+    widget_context = await get_editable_widget_context(widget_id)
 
-    widget_details = await get_widget_details(widget_id)
+    if str(widget_context.owner_id) != current_user.auth_id:
+        abort(401)
 
-    if widget_details.plugin_name != "core" or widget_details.internal_name != "links":
+    if widget_context.plugin_name != "core" or widget_context.internal_name != "links":
         abort(400)
 
-    widget_config = widget_details.config
+    widget_config = widget_context.config
 
     if widget_config is None:
-        widget_config = {"links": []}
+        widget_config = {}
 
     is_compact = (await request.form).get("is_compact", False, bool)
 
     widget_config["is_compact"] = is_compact
 
-    await set_widget_config(widget_id, widget_config)
+    await update_widget_config(widget_context, widget_config)
 
 
 @blueprint.post("/widget/links/<int:widget_id>/add")
 @login_standard_required
 @redirect_using_back_to
 async def post_widget_add_link(widget_id: int):
-    if str(await get_widget_owner_id(widget_id)) != current_user.auth_id:
+    widget_context = await get_editable_widget_context(widget_id)
+
+    if str(widget_context.owner_id) != current_user.auth_id:
         abort(401)
 
     link_id = int((await request.form)["link-id"])
     link = await models.Link.get(id=link_id)
 
-    widget_details = await get_widget_details(widget_id)
-
-    if widget_details.plugin_name != "core" or widget_details.internal_name != "links":
+    if widget_context.plugin_name != "core" or widget_context.internal_name != "links":
         abort(400)
 
-    widget_config = widget_details.config
-
-    if widget_config is None:
-        widget_config = {"links": []}
-
-    if link_id in widget_config["links"]:
+    if not await add_widget_link(widget_context.widget_id, link.id):
         await flash("not adding link, as already added", "error")
     else:
-        widget_config["links"].append(link_id)
-        await set_widget_config(widget_id, widget_config)
-        await flash(f"added new link '{link.name}' to widget '{widget_details.human_name}'", "ok")
+        await flash(f"added new link '{link.name}' to widget '{widget_context.human_name}'", "ok")
 
 
 @blueprint.get("/widget/links/<int:widget_id>/<int:link_index>/delete")
 @login_standard_required
 @redirect_using_back_to
 async def get_widget_remove_link(widget_id: int, link_index: int):
-    if str(await get_widget_owner_id(widget_id)) != current_user.auth_id:
-        abort(401)
+    widget_context = await get_editable_widget_context(widget_id)
 
-    widget_details = await get_widget_details(widget_id)
+    if str(widget_context.owner_id) != current_user.auth_id:
+        abort(401)
 
-    if widget_details.plugin_name != "core" or widget_details.internal_name != "links":
+    if widget_context.plugin_name != "core" or widget_context.internal_name != "links":
         abort(400)
 
-    widget_config = widget_details.config
-
-    if widget_config is None or len(widget_config.get("links")) < link_index + 1:
+    if not await remove_widget_link(widget_context.widget_id, link_index):
         await flash("cannot find link to delete", "error")
         return
 
-    widget_config["links"].pop(link_index)
-
-    await set_widget_config(widget_id, widget_config)
-
-    await flash(f"removed link from widget '{widget_details.human_name}'", "ok")
+    await flash(f"removed link from widget '{widget_context.human_name}'", "ok")
@@ -1,19 +1,66 @@
 import asyncio
 import logging
+from collections.abc import Collection
+from typing import Any
 
 from quart import render_template
 
-from web_portal.plugin_api import PluginMeta
+from web_portal.plugin_api import PlacedWidget, PluginMeta
 
 from . import models, views
-from .helpers import get_settings
+from .helpers import (
+    get_links_by_ids,
+    get_search_engines_by_ids,
+    get_settings,
+    get_widget_link_ids,
+    get_widget_links,
+)
+from .migrations import MIGRATIONS
 
 logger = logging.getLogger("web-portal")
 
 
-async def render_widget_link(config: dict) -> str:
-    # TODO: auto remove links that haven't been found due to deletion
-    links = await models.Link.filter(id__in=config.get("links", [])).order_by("name").all()
+async def prefetch_widgets(widgets: Collection[PlacedWidget]) -> dict[int, Any]:
+    """
+    Load the links and search engines for all placed widgets at once
+    """
+    link_widget_ids = []
+    engine_ids = set()
+    for widget in widgets:
+        config = widget.config or {}
+        match widget.internal_name:
+            case "links":
+                link_widget_ids.append(widget.widget_id)
+            case "search":
+                engine_ids.add(config.get("engine_id"))
+
+    engine_ids.discard(None)
+
+    widget_link_ids, engines = await asyncio.gather(
+        get_widget_link_ids(link_widget_ids),
+        get_search_engines_by_ids(engine_ids),
+    )
+    links = await get_links_by_ids(
+        link_id for link_ids in widget_link_ids.values() for link_id in link_ids
+    )
+
+    prefetched = {}
+    for widget in widgets:
+        config = widget.config or {}
+        match widget.internal_name:
+            case "links":
+                link_ids = set(widget_link_ids[widget.widget_id])
+                prefetched[widget.widget_id] = [link for link in links if link.id in link_ids]
+            case "search":
+                prefetched[widget.widget_id] = engines.get(config.get("engine_id"))
+    return prefetched
+
+
+async def render_widget_link(
+    widget_id: int, config: dict, links: list[models.Link] | None = None
+) -> str:
+    if links is None:
+        links = await get_links_by_ids((await get_widget_link_ids((widget_id,)))[widget_id])
 
     return await render_template(
         "core/includes/widgets/link.jinja",
@@ -22,10 +69,9 @@ async def render_widget_link(config: dict) -> str:
     )
 
 
-async def render_widget_search(config: dict) -> str:
-    engine_id = config.get("engine_id")
-
-    engine = await models.SearchEngine.get_or_none(id=engine_id)
+async def render_widget_search(config: dict, engine: models.SearchEngine | None = None) -> str:
+    if engine is None and (engine_id := config.get("engine_id")) is not None:
+        engine = (await get_search_engines_by_ids((engine_id,))).get(engine_id)
 
     if not engine:
         return "No search engine selected..."
@@ -36,16 +82,18 @@ async def render_widget_search(config: dict) -> str:
     )
 
 
-async def render_widget(internal_name, widget_id: int, config: dict | None) -> str:
+async def render_widget(
+    internal_name, widget_id: int, config: dict | None, prefetched: Any = None
+) -> str:
     if config is None:
         config = {}
     match internal_name:
         case "clock":
             return await render_template("core/includes/widgets/clock.jinja", widget_id=widget_id)
         case "links":
-            return await render_widget_link(config)
+            return await render_widget_link(widget_id, config, prefetched)
         case "search":
-            return await render_widget_search(config)
+            return await render_widget_search(config, prefetched)
         case _:
             logger.error(
                 "widget not found in plugin::widget_name='%s',plugin_name='core'", internal_name
@@ -68,27 +116,14 @@ async def render_widget_edit_search(dash_widget_id: int, config: dict, back_to_u
 async def render_widget_edit_link(dash_widget_id: int, config: dict, back_to_url: str) -> str:
     available_links, added_links = await asyncio.gather(
         models.Link.all(),
-        models.Link.filter(id__in=config.get("links", [])).all(),
+        get_widget_links(dash_widget_id),
     )
 
-    # added links need sorting (and unavailable ones replaced with "None")
-    added_links_sorted = []
-    for link_id in config.get("links", []):
-        found_i = None
-        for i, link in enumerate(added_links):
-            if link.id == link_id:
-                found_i = i
-                break
-        if found_i is not None:
-            added_links_sorted.append(added_links.pop(found_i))
-        else:
-            added_links_sorted.append(None)
-
     return await render_template(
         "core/includes/widgets-editor/link.jinja",
         dash_widget_id=dash_widget_id,
         available_links=available_links,
-        added_links=added_links_sorted,
+        added_links=added_links,
         back_to_url=back_to_url,
         widget_config=config,
     )
@@ -180,10 +215,12 @@ PLUGIN_META = PluginMeta(
         "search": "Web Search",
     },
     db_models=[models],
+    db_migrations=MIGRATIONS,
     blueprints=[views.blueprint],
     index_route_url="core.get_index",
     get_rendered_widget=render_widget,
     get_rendered_widget_edit=render_widget_edit,
+    get_prefetched_widget_data=prefetch_widgets,
     get_settings=get_settings,
     get_injected_head=render_injected_head,
     do_demo_setup=demo_install,
@@ -0,0 +1,53 @@
+#!/bin/env python
+"""
+Measure how long password hash methods take on this host,
+to help pick a PASSWORD_HASH_METHOD that fits the login latency budget
+"""
+
+from argparse import ArgumentParser
+from statistics import mean
+from time import perf_counter
+
+from werkzeug.security import generate_password_hash
+
+DEFAULT_METHODS = (
+    "scrypt:8192:8:1",
+    "scrypt:16384:8:1",
+    "scrypt:32768:8:1",
+    "pbkdf2:sha256:260000",
+    "pbkdf2:sha256:600000",
+    "pbkdf2:sha256:1000000",
+)
+
+
+def time_method(method: str, rounds: int) -> float:
+    timings = []
+    for _ in range(rounds):
+        start = perf_counter()
+        generate_password_hash("benchmark-password", method)
+        timings.append(perf_counter() - start)
+    return mean(timings)
+
+
+def main():
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "methods",
+        nargs="*",
+        default=DEFAULT_METHODS,
+        help="hash methods to measure, as given to PASSWORD_HASH_METHOD",
+    )
+    parser.add_argument("--rounds", type=int, default=5, help="hashes to time per method")
+    args = parser.parse_args()
+
+    for method in args.methods:
+        try:
+            seconds = time_method(method, args.rounds)
+        except (ValueError, MemoryError) as err:
+            print(f"{method:<24} unsupported: {err}")
+            continue
+        print(f"{method:<24} {seconds * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
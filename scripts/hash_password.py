@@ -1,4 +1,5 @@
 #!/bin/env python
+import os
 from getpass import getpass
 
 from werkzeug.security import generate_password_hash
@@ -10,8 +11,9 @@ def main():
 
     if password != password_confirm:
         print("Passwords Do Not Match")
+        return
 
-    print(generate_password_hash(password))
+    print(generate_password_hash(password, os.environ.get("PASSWORD_HASH_METHOD", "scrypt")))
 
 
 if __name__ == "__main__":
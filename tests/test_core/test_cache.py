@@ -0,0 +1,221 @@
+import asyncio
+from contextvars import copy_context
+
+import pytest
+from web_portal.core.cache import (
+    CacheInvalidations,
+    LRUCache,
+    PageSnapshot,
+    PluginCacheStore,
+    WidgetRenderCache,
+    estimate_size,
+    get_plugin_cache,
+    get_public_snapshot,
+    get_widget_render_cache,
+    make_config_fingerprint,
+)
+
+
+class TestLRUCache:
+    def test_get_set(self):
+        cache = LRUCache(100)
+        cache.set("a", 1, size=10)
+        assert cache.get("a") == 1
+        assert cache.get("b") is None
+        assert cache.stats.hits == 1
+        assert cache.stats.misses == 1
+
+    def test_evicts_least_recently_used(self):
+        cache = LRUCache(30)
+        cache.set("a", 1, size=10)
+        cache.set("b", 2, size=10)
+        cache.set("c", 3, size=10)
+        cache.get("a")
+        cache.set("d", 4, size=10)
+        assert "a" in cache
+        assert "b" not in cache
+        assert cache.size == 30
+        assert cache.stats.evictions == 1
+
+    def test_too_large_not_stored(self):
+        cache = LRUCache(10)
+        cache.set("a", 1, size=5)
+        cache.set("b", 2, size=50)
+        assert "a" in cache
+        assert "b" not in cache
+
+    def test_expired(self):
+        cache = LRUCache(100, ttl=0)
+        cache.set("a", 1, size=10)
+        assert cache.get("a") is None
+        assert cache.size == 0
+
+    def test_pop_where(self):
+        cache = LRUCache(100)
+        for i in range(5):
+            cache.set(i, i, size=1)
+        assert cache.pop_where(lambda key, _: key % 2 == 0) == 3
+        assert len(cache) == 2
+        assert cache.size == 2
+
+    def test_measures_container_contents(self):
+        cache = LRUCache(10_000)
+        value = {"items": ["x" * 1000, "y" * 1000]}
+        cache.set("a", value)
+        assert cache.size == estimate_size(value)
+        assert cache.size > 2000
+
+
+def test_estimate_size_counts_shared_once():
+    item = "x" * 1000
+    assert estimate_size([item, item]) < estimate_size([item, "y" * 1000])
+
+
+class TestWidgetRenderCache:
+    def test_config_change_misses(self):
+        cache = WidgetRenderCache(10_000, None)
+        cache.set(1, {"links": [1, 2]}, "core", "links", "<p></p>")
+        assert cache.get(1, {"links": [1, 2]}) == "<p></p>"
+        assert cache.get(1, {"links": [2, 1]}) is None
+
+    def test_invalidate_plugin(self):
+        cache = WidgetRenderCache(10_000, None)
+        cache.set(1, None, "core", "links", "a")
+        cache.set(2, None, "core", "search", "b")
+        cache.set(3, None, "core_extras", "iframe", "c")
+        cache.invalidate_plugin("core", "links")
+        assert cache.get(1, None) is None
+        assert cache.get(2, None) == "b"
+        cache.invalidate_plugin("core")
+        assert cache.get(2, None) is None
+        assert cache.get(3, None) == "c"
+
+    def test_fingerprint_key_order(self):
+        assert make_config_fingerprint({"a": 1, "b": 2}) == make_config_fingerprint(
+            {"b": 2, "a": 1}
+        )
+
+
+class TestCacheInvalidations:
+    def test_collected_in_context(self):
+        def invalidate():
+            CacheInvalidations.collect()
+            cache = WidgetRenderCache(10_000, None)
+            cache.invalidate_widget(1)
+            cache.invalidate_widget(2, notify_workers=False)
+            cache.invalidate_plugin("core", "links")
+            return CacheInvalidations.pop()
+
+        assert copy_context().run(invalidate) == {
+            "CACHE:widget:1",
+            "CACHE:plugin-widgets:core:links",
+        }
+        # not collecting outside of that context
+        get_widget_render_cache().invalidate_widget(1)
+        assert CacheInvalidations.pop() == set()
+
+    def test_apply(self):
+        cache = get_widget_render_cache()
+        cache.set(1, None, "core", "links", "a")
+        cache.set(2, None, "core", "search", "b")
+        CacheInvalidations.apply("CACHE:plugin-widgets:core:links")
+        assert cache.get(1, None) is None
+        assert cache.get(2, None) == "b"
+        CacheInvalidations.apply("CACHE:widget:2")
+        assert cache.get(2, None) is None
+        with pytest.raises(ValueError):
+            CacheInvalidations.apply("CACHE:unknown")
+
+
+class TestPageSnapshot:
+    def test_set_get(self):
+        snapshot = PageSnapshot(None)
+        snapshot.set("<html></html>", snapshot.generation)
+        assert snapshot.get().content == "<html></html>"
+        assert snapshot.get().etag
+
+    def test_invalidated_while_rendering(self):
+        snapshot = PageSnapshot(None)
+        generation = snapshot.generation
+        snapshot.invalidate()
+        assert snapshot.set("<html></html>", generation).content == "<html></html>"
+        assert snapshot.get() is None
+
+    def test_invalidate(self):
+        snapshot = PageSnapshot(None)
+        snapshot.set("<html></html>", snapshot.generation)
+        snapshot.invalidate()
+        assert snapshot.get() is None
+
+    def test_invalidate_sent_to_workers(self):
+        def invalidate():
+            CacheInvalidations.collect()
+            PageSnapshot(None).invalidate()
+            return CacheInvalidations.pop()
+
+        assert copy_context().run(invalidate) == {"CACHE:snapshot"}
+        snapshot = get_public_snapshot()
+        snapshot.set("<html></html>", snapshot.generation)
+        CacheInvalidations.apply("CACHE:snapshot")
+        assert snapshot.get() is None
+
+
+class TestPluginCache:
+    def test_namespaces(self):
+        store = PluginCacheStore(100, None)
+        store.get_namespace("a").set("key", 1, size=10)
+        store.get_namespace("b").set("key", 2, size=10)
+        store.get_namespace("a").clear()
+        assert store.get_namespace("a").get("key") is None
+        assert store.get_namespace("b").get("key") == 2
+
+    def test_delete_sent_to_workers(self):
+        def delete():
+            CacheInvalidations.collect()
+            cache = PluginCacheStore(100, None).get_namespace("a")
+            cache.delete_where(lambda key: key[0] == "links")
+            cache.delete("key", notify_workers=False)
+            return CacheInvalidations.pop()
+
+        assert copy_context().run(delete) == {"CACHE:plugin-cache:a"}
+        cache = get_plugin_cache("a")
+        cache.set("key", 1, size=10)
+        CacheInvalidations.apply("CACHE:plugin-cache:a")
+        assert cache.get("key") is None
+
+    def test_shared_budget(self):
+        store = PluginCacheStore(20, None)
+        store.get_namespace("a").set("key", 1, size=10)
+        store.get_namespace("b").set("key", 2, size=10)
+        store.get_namespace("b").set("other", 3, size=10)
+        assert store.get_namespace("a").get("key") is None
+        assert store.get_namespace("a").stats.evictions == 1
+        assert store.get_namespace("b").stats.evictions == 0
+
+    @pytest.mark.asyncio
+    async def test_get_or_compute_single_flight(self):
+        cache = PluginCacheStore(1000, None).get_namespace("a")
+        calls = 0
+
+        async def compute():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.01)
+            return "value"
+
+        results = await asyncio.gather(*(cache.get_or_compute("key", compute) for _ in range(5)))
+        assert results == ["value"] * 5
+        assert calls == 1
+        assert await cache.get_or_compute("key", compute) == "value"
+        assert calls == 1
+
+    @pytest.mark.asyncio
+    async def test_get_or_compute_error_not_cached(self):
+        cache = PluginCacheStore(1000, None).get_namespace("a")
+
+        async def compute():
+            raise ValueError()
+
+        with pytest.raises(ValueError):
+            await cache.get_or_compute("key", compute)
+        assert cache.get("key") is None
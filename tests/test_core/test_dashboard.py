@@ -0,0 +1,30 @@
+import pytest
+from pydantic import ValidationError
+from web_portal.core.dashboard import (
+    AddWidgetOperation,
+    DashboardBatch,
+    MoveWidgetOperation,
+)
+
+
+def test_batch_operations():
+    batch = DashboardBatch.model_validate(
+        {
+            "operations": [
+                {"op": "add", "widget_id": 1, "name": " Clock ", "ref": "clock"},
+                {"op": "move", "widget": "clock", "position": 0},
+            ]
+        }
+    )
+    add, move = batch.operations
+    assert isinstance(add, AddWidgetOperation)
+    assert add.name == "Clock"
+    assert isinstance(move, MoveWidgetOperation)
+    assert move.widget == "clock"
+
+
+def test_batch_invalid():
+    with pytest.raises(ValidationError):
+        DashboardBatch.model_validate({"operations": [{"op": "unknown"}]})
+    with pytest.raises(ValidationError):
+        DashboardBatch.model_validate({"operations": [{"op": "rename", "widget": 1, "name": " "}]})
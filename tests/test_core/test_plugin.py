@@ -0,0 +1,115 @@
+import pytest
+from web_portal.core.plugin import (
+    LoadedPlugin,
+    PluginException,
+    PluginHandler,
+    PluginManifestException,
+    WidgetContext,
+    is_supported_version,
+    update_widget_config,
+)
+
+MANIFEST = """
+version_specifier = "~= 2.3"
+human_name = "Test"
+index_route_url = "test.get_index"
+meta_module = "widgets"
+
+[widgets]
+test = "Test Widget"
+
+[[blueprints]]
+target = "views:blueprint"
+"""
+
+
+def test_load_manifest(tmp_path):
+    path = tmp_path / "plugin.toml"
+    path.write_text(MANIFEST)
+    manifest = PluginHandler.load_manifest(path)
+    assert manifest.widgets == {"test": "Test Widget"}
+    assert manifest.blueprints[0].target == "views:blueprint"
+    assert manifest.blueprints[0].url_prefix is None
+    assert manifest.db_models == []
+
+
+def test_load_manifest_invalid(tmp_path):
+    path = tmp_path / "plugin.toml"
+    path.write_text('human_name = "Test"')
+    with pytest.raises(PluginManifestException):
+        PluginHandler.load_manifest(path)
+
+
+def test_meta_import_error(tmp_path, monkeypatch):
+    package = tmp_path / "broken_plugin"
+    package.mkdir()
+    (package / "__init__.py").touch()
+    (package / "widgets.py").write_text('raise RuntimeError("broken")')
+    (package / "plugin.toml").write_text(MANIFEST)
+    monkeypatch.syspath_prepend(str(tmp_path))
+    manifest = PluginHandler.load_manifest(package / "plugin.toml")
+    loaded_plugin = LoadedPlugin("broken_plugin", manifest=manifest)
+    with pytest.raises(PluginException):
+        loaded_plugin.meta  # noqa: B018
+    assert not loaded_plugin.is_meta_loaded
+
+
+def test_manifest_scheduled_jobs(tmp_path, monkeypatch):
+    package = tmp_path / "jobs_plugin"
+    package.mkdir()
+    (package / "__init__.py").touch()
+    (package / "widgets.py").write_text('raise RuntimeError("not lazy")')
+    (package / "helpers.py").write_text(
+        "from types import SimpleNamespace\n"
+        "async def refresh(): pass\n"
+        "def get_settings(): return SimpleNamespace(REFRESH_INTERVAL=30)\n"
+    )
+    (package / "plugin.toml").write_text(
+        'settings = "helpers:get_settings"\n'
+        + MANIFEST
+        + '[[scheduled_jobs]]\nname = "refresh"\ntarget = "helpers:refresh"\n'
+        + 'interval_setting = "REFRESH_INTERVAL"\nsingle_worker = false\n'
+    )
+    monkeypatch.syspath_prepend(str(tmp_path))
+    manifest = PluginHandler.load_manifest(package / "plugin.toml")
+    loaded_plugin = LoadedPlugin("jobs_plugin", manifest=manifest)
+    (job,) = loaded_plugin.scheduled_jobs
+    assert (job.name, job.interval, job.single_worker) == ("refresh", 30, False)
+    assert job.func.__name__ == "refresh"
+    assert not loaded_plugin.is_meta_loaded
+
+
+def test_is_supported_version():
+    assert is_supported_version("~= 2.3", "2.4.0")
+    assert not is_supported_version("~= 2.3", "3.0.0")
+
+
+@pytest.fixture
+def written_configs(monkeypatch) -> list:
+    written = []
+
+    async def set_widget_config(widget_id, config):
+        written.append((widget_id, config))
+
+    monkeypatch.setattr("web_portal.core.plugin.set_widget_config", set_widget_config)
+    return written
+
+
+@pytest.mark.asyncio
+async def test_update_widget_config_unchanged(written_configs):
+    context = WidgetContext("Links", "links", "core", {"links": [1]}, 1, 1)
+    assert not await update_widget_config(context, {"links": [1]})
+    assert written_configs == []
+
+
+@pytest.mark.asyncio
+async def test_update_widget_config_changed_in_place(written_configs):
+    context = WidgetContext("Links", "links", "core", {"links": [1]}, 1, 1)
+    context.config["links"].append(2)
+    assert await update_widget_config(context, context.config)
+    assert written_configs == [(1, {"links": [1, 2]})]
+    # the saved config is a copy, so later in place changes are still detected
+    assert not await update_widget_config(context, context.config)
+    context.config["links"].append(3)
+    assert await update_widget_config(context, context.config)
+    assert len(written_configs) == 2
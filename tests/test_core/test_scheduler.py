@@ -0,0 +1,79 @@
+import asyncio
+
+import pytest
+from quart import Quart
+from web_portal.core.scheduler import JobScheduler, ScheduledJob
+
+
+@pytest.mark.asyncio
+async def test_interval_job_without_overlap():
+    runs = 0
+    running = 0
+    max_running = 0
+
+    async def job():
+        nonlocal runs, running, max_running
+        runs += 1
+        running += 1
+        max_running = max(max_running, running)
+        await asyncio.sleep(0.02)
+        running -= 1
+
+    scheduler = JobScheduler(0)
+    async with Quart(__name__).app_context():
+        scheduler.start_plugin_jobs(
+            "my_plugin", [ScheduledJob("job", job, 0.001, single_worker=False)]
+        )
+        await asyncio.sleep(0.1)
+        await scheduler.stop_plugin_jobs("my_plugin")
+
+    assert runs > 1
+    assert max_running == 1
+    stopped_runs = runs
+    await asyncio.sleep(0.05)
+    assert runs == stopped_runs
+
+
+@pytest.mark.asyncio
+async def test_failing_job_keeps_running():
+    runs = 0
+
+    async def job():
+        nonlocal runs
+        runs += 1
+        raise RuntimeError()
+
+    scheduler = JobScheduler(0)
+    async with Quart(__name__).app_context():
+        scheduler.start_plugin_jobs(
+            "my_plugin", [ScheduledJob("job", job, 0.001, single_worker=False)]
+        )
+        await asyncio.sleep(0.05)
+        await scheduler.stop()
+
+    assert runs > 1
+
+
+@pytest.mark.asyncio
+async def test_job_cancelled_when_lease_lost(monkeypatch):
+    renewals = [True, False]
+    finished = False
+
+    async def acquire_lease(key, duration):
+        return renewals.pop(0)
+
+    async def job():
+        nonlocal finished
+        await asyncio.sleep(1)
+        finished = True
+
+    scheduler = JobScheduler(0.02)
+    monkeypatch.setattr(scheduler, "_acquire_lease", acquire_lease)
+    async with Quart(__name__).app_context():
+        scheduler.start_plugin_jobs("my_plugin", [ScheduledJob("job", job)])
+        await asyncio.sleep(0.1)
+        tasks = [task for _, task in scheduler._tasks["my_plugin"]]
+        assert all(task.done() for task in tasks)
+        await scheduler.stop_plugin_jobs("my_plugin")
+
+    assert not finished
@@ -0,0 +1,40 @@
+import asyncio
+
+import pytest
+from web_portal.core.security import (
+    PasswordHasher,
+    PasswordHasherBusyException,
+    get_full_hash_method,
+)
+
+
+@pytest.mark.asyncio
+async def test_hash_verify():
+    hasher = PasswordHasher("scrypt:1024:8:1", 1, 0)
+    password_hash = await hasher.hash("my-password")
+    assert await hasher.verify(password_hash, "my-password")
+    assert not await hasher.verify(password_hash, "wrong-password")
+    assert hasher.pending == 0
+
+
+@pytest.mark.asyncio
+async def test_busy_when_queue_full():
+    hasher = PasswordHasher("scrypt:1024:8:1", 1, 1)
+    results = await asyncio.gather(
+        *(hasher.hash("my-password") for _ in range(3)),
+        return_exceptions=True,
+    )
+    assert isinstance(results[2], PasswordHasherBusyException)
+    assert all(isinstance(result, bytes) for result in results[:2])
+
+
+@pytest.mark.asyncio
+async def test_needs_rehash():
+    hasher = PasswordHasher("scrypt:1024:8:1", 1, 0)
+    assert not hasher.needs_rehash(await hasher.hash("my-password"))
+    other_hasher = PasswordHasher("scrypt:2048:8:1", 1, 0)
+    assert other_hasher.needs_rehash(await hasher.hash("my-password"))
+
+
+def test_full_hash_method():
+    assert get_full_hash_method("scrypt") == "scrypt:32768:8:1"
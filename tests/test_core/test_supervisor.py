@@ -0,0 +1,77 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from web_portal.core.supervisor import (
+    BreakerState,
+    PluginCircuitOpenException,
+    PluginSupervisor,
+)
+
+PLUGIN = SimpleNamespace(internal_name="my_plugin", latency_budget=None)
+
+
+def make_supervisor(latency_budget=None, cooldown=60) -> PluginSupervisor:
+    return PluginSupervisor(
+        latency_budget=latency_budget, window=4, min_calls=3, failure_rate=0.5, cooldown=cooldown
+    )
+
+
+async def ok():
+    return "ok"
+
+
+async def fail():
+    raise RuntimeError("broken")
+
+
+async def slow():
+    await asyncio.sleep(0.05)
+    return "slow"
+
+
+@pytest.mark.asyncio
+async def test_trips_after_failures():
+    supervisor = make_supervisor()
+    assert await supervisor.call(PLUGIN, ok) == "ok"
+    with pytest.raises(RuntimeError):
+        await supervisor.call(PLUGIN, fail)
+    assert supervisor.get_health("my_plugin").state is BreakerState.CLOSED
+    with pytest.raises(RuntimeError):
+        await supervisor.call(PLUGIN, fail)
+    assert supervisor.get_health("my_plugin").state is BreakerState.OPEN
+    with pytest.raises(PluginCircuitOpenException):
+        await supervisor.call(PLUGIN, ok)
+    assert supervisor.get_health("my_plugin").total_calls == 3
+
+
+@pytest.mark.asyncio
+async def test_trial_call_closes():
+    supervisor = make_supervisor(cooldown=0)
+    for _ in range(3):
+        with pytest.raises(RuntimeError):
+            await supervisor.call(PLUGIN, fail)
+    assert supervisor.get_health("my_plugin").state is BreakerState.HALF_OPEN
+    assert await supervisor.call(PLUGIN, ok) == "ok"
+    assert supervisor.get_health("my_plugin").state is BreakerState.CLOSED
+
+
+@pytest.mark.asyncio
+async def test_over_budget_counts_as_failure():
+    supervisor = make_supervisor(latency_budget=0.01)
+    for _ in range(3):
+        assert await supervisor.call(PLUGIN, slow) == "slow"
+    assert supervisor.get_health("my_plugin").state is BreakerState.OPEN
+
+    plugin = SimpleNamespace(internal_name="patient_plugin", latency_budget=1)
+    for _ in range(3):
+        await supervisor.call(plugin, slow)
+    assert supervisor.get_health("patient_plugin").state is BreakerState.CLOSED
+
+
+@pytest.mark.asyncio
+async def test_timeout():
+    supervisor = make_supervisor()
+    with pytest.raises(TimeoutError):
+        await supervisor.call(PLUGIN, slow, timeout=0.01)
+    assert supervisor.get_health("my_plugin").last_error == "timed out"
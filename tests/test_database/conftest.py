@@ -0,0 +1,21 @@
+import pytest_asyncio
+from tortoise import Tortoise
+
+
+@pytest_asyncio.fixture(loop_scope="function")
+async def empty_db():
+    await Tortoise.init(
+        db_url="sqlite://:memory:",
+        modules={
+            "models": ["web_portal.database.models"],
+            "core": ["plugins.core.models"],
+        },
+    )
+    yield Tortoise.get_connection("default")
+    await Tortoise.close_connections()
+
+
+@pytest_asyncio.fixture(loop_scope="function")
+async def db(empty_db):
+    await Tortoise.generate_schemas()
+    return empty_db
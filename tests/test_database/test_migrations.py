@@ -0,0 +1,101 @@
+import asyncio
+
+import pytest
+from tortoise import Tortoise
+from web_portal.database import models
+from web_portal.database.migrations import (
+    CORE_MIGRATIONS,
+    Migration,
+    create_model_index,
+    has_column,
+    has_index,
+    has_table,
+    migrate_database,
+)
+
+
+def test_core_migration_versions():
+    versions = [migration.version for migration in CORE_MIGRATIONS]
+    assert versions == list(range(1, len(CORE_MIGRATIONS) + 1))
+
+
+def make_migrations(applied: list[int]) -> dict[str, tuple[Migration, ...]]:
+    def make_migration(version: int) -> Migration:
+        async def func(_):
+            applied.append(version)
+
+        return Migration(version, f"migration {version}", func)
+
+    return {"models": (make_migration(1), make_migration(2))}
+
+
+async def get_versions() -> dict[str, int]:
+    return dict(await models.SchemaVersion.all().values_list("app", "version"))
+
+
+@pytest.mark.asyncio
+async def test_migrate_new_database(empty_db):
+    applied = []
+    await migrate_database(make_migrations(applied))
+    assert applied == []
+    assert await get_versions() == {"models": 2, "core": 0}
+    assert await models.Dashboard.all().count() == 0
+
+
+@pytest.mark.asyncio
+async def test_migrate_database_before_recorded_versions(db):
+    await db.execute_script(f"DROP TABLE {models.SchemaVersion._meta.db_table}")
+    applied = []
+    await migrate_database(make_migrations(applied))
+    assert applied == [1, 2]
+    assert await get_versions() == {"models": 2, "core": 0}
+
+
+@pytest.mark.asyncio
+async def test_migrate_database_concurrently(db):
+    await db.execute_script(f"DROP TABLE {models.SchemaVersion._meta.db_table}")
+    applied = []
+    migrations = make_migrations(applied)
+    # the process that waited finds the database already migrated
+    await asyncio.gather(migrate_database(migrations), migrate_database(migrations))
+    assert applied == [1, 2]
+    assert await get_versions() == {"models": 2, "core": 0}
+    assert not await models.JobLease.exists()
+
+
+@pytest.mark.asyncio
+async def test_migrate_up_to_date_database(empty_db, monkeypatch):
+    applied = []
+    await migrate_database(make_migrations(applied))
+
+    generated = []
+
+    async def generate_schemas(*args, **kwargs):
+        generated.append(args)
+
+    monkeypatch.setattr(Tortoise, "generate_schemas", generate_schemas)
+    await migrate_database(make_migrations(applied))
+    assert generated == []
+    assert applied == []
+    assert await get_versions() == {"models": 2, "core": 0}
+
+
+@pytest.mark.asyncio
+async def test_create_model_index_exists(db):
+    table = models.Dashboard._meta.db_table
+    name = db.schema_generator(db)._generate_index_name("uid", table, ["owner_id", "name"])
+    # created by generate_schemas, from the model's Meta
+    assert await has_index(db, table, name)
+    await create_model_index(db, models.Dashboard, ["owner_id", "name"], unique=True)
+    await create_model_index(db, models.Dashboard, ["name"])
+    await create_model_index(db, models.Dashboard, ["name"])
+    assert not await has_index(db, table, "missing")
+
+
+@pytest.mark.asyncio
+async def test_has_table_and_column(db):
+    table = models.Dashboard._meta.db_table
+    assert await has_table(db, table)
+    assert not await has_table(db, "missing")
+    assert await has_column(db, table, "template_id")
+    assert not await has_column(db, table, "missing")
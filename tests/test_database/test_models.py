@@ -0,0 +1,229 @@
+import asyncio
+
+import pytest
+from plugins.core.helpers import add_widget_link, get_widget_link_ids, remove_widget_link
+from plugins.core.models import Link, WidgetLink
+from web_portal.core.dashboard import (
+    DashboardBatch,
+    DashboardOperationException,
+    apply_dashboard_operations,
+)
+from web_portal.database.models import Dashboard, DashboardWidget, Plugin, User, Widget
+
+
+def test_shift_i_left():
+    items = [1, 2, 3, 4]
+    Dashboard._shift_i_left(items, 2)
+    assert items == [1, 3, 2, 4]
+    Dashboard._shift_i_left(items, 1)
+    assert items == [3, 1, 2, 4]
+    # first item wraps around to the end
+    Dashboard._shift_i_left(items, 0)
+    assert items == [1, 2, 4, 3]
+
+
+async def create_inheriting_dashboard() -> tuple[Dashboard, Dashboard]:
+    public = await User.create(username="public")
+    user = await User.create(username="user")
+    widget = await Widget.create(
+        internal_name="links", plugin=await Plugin.create(internal_name="core")
+    )
+    link = await Link.create(name="Example", url="https://example.com", color_name="blue")
+    template = await Dashboard.create(owner=public, name="Template")
+    for position in range(2):
+        dashboard_widget = await DashboardWidget.create(
+            name="Links", dashboard=template, widget=widget, position=position
+        )
+        await WidgetLink.create(dashboard_widget=dashboard_widget, link=link)
+    dashboard = await Dashboard.create(owner=user, template=template)
+    return template, dashboard
+
+
+@pytest.mark.asyncio
+@pytest.mark.usefixtures("db")
+async def test_materialize_copies_once():
+    template, dashboard = await create_inheriting_dashboard()
+    template_widget_ids = set(
+        await DashboardWidget.filter(dashboard=template).values_list("id", flat=True)
+    )
+
+    copies = await dashboard.materialize()
+    assert copies.keys() == template_widget_ids
+    assert not dashboard.is_inheriting
+    assert await DashboardWidget.filter(dashboard=dashboard).count() == 2
+    assert await WidgetLink.filter(dashboard_widget_id__in=copies.values()).count() == 2
+
+    # a second edit, including from a stale copy of the dashboard, copies nothing
+    assert await dashboard.materialize() == {}
+    stale = await Dashboard.get(id=dashboard.id)
+    stale.template_id = template.id
+    assert await stale.materialize() == {}
+    assert await DashboardWidget.filter(dashboard=dashboard).count() == 2
+    assert await WidgetLink.all().count() == 4
+
+
+@pytest.mark.asyncio
+@pytest.mark.usefixtures("db")
+async def test_replace_widgets_from_itself():
+    _, dashboard = await create_inheriting_dashboard()
+    await dashboard.materialize()
+    widget_ids = set(await DashboardWidget.filter(dashboard=dashboard).values_list("id", flat=True))
+
+    await dashboard.replace_widgets(dashboard)
+    assert (
+        set(await DashboardWidget.filter(dashboard=dashboard).values_list("id", flat=True))
+        == widget_ids
+    )
+    assert await WidgetLink.all().count() == 4
+
+
+@pytest.mark.asyncio
+@pytest.mark.usefixtures("db")
+async def test_widget_link_positions():
+    template, _ = await create_inheriting_dashboard()
+    widget = await DashboardWidget.create(
+        name="Links", dashboard=template, widget=await Widget.first(), position=2
+    )
+    links = [
+        await Link.create(name=f"Link {i}", url="https://example.com", color_name="blue")
+        for i in range(3)
+    ]
+
+    # adds racing for the same position retry with the next one
+    assert all(await asyncio.gather(*(add_widget_link(widget.id, link.id) for link in links)))
+    assert not await add_widget_link(widget.id, links[0].id)
+    link_ids = (await get_widget_link_ids([widget.id]))[widget.id]
+    assert sorted(link_ids) == [link.id for link in links]
+
+    # removed by index, leaving a gap in positions
+    assert await remove_widget_link(widget.id, 1)
+    assert not await remove_widget_link(widget.id, 2)
+    assert await add_widget_link(widget.id, link_ids[1])
+    assert (await get_widget_link_ids([widget.id]))[widget.id] == [
+        link_ids[0],
+        link_ids[2],
+        link_ids[1],
+    ]
+
+
+@pytest.mark.asyncio
+@pytest.mark.usefixtures("db")
+async def test_append_widget_positions():
+    template, _ = await create_inheriting_dashboard()
+    widget = await Widget.first()
+
+    await asyncio.gather(
+        *(
+            template.append_widget(DashboardWidget(name="Links", dashboard=template, widget=widget))
+            for _ in range(3)
+        )
+    )
+    positions = await DashboardWidget.filter(dashboard=template).values_list("position", flat=True)
+    assert sorted(positions) == list(range(5))
+
+
+def make_operations(*operations: dict) -> list:
+    return DashboardBatch.model_validate({"operations": operations}).operations
+
+
+async def get_placed_widgets(dashboard: Dashboard) -> list[tuple[int, str, int]]:
+    return list(
+        await DashboardWidget.filter(dashboard=dashboard)
+        .order_by("position")
+        .values_list("id", "name", "position")
+    )
+
+
+@pytest.mark.asyncio
+@pytest.mark.usefixtures("db")
+async def test_apply_dashboard_operations():
+    template, _ = await create_inheriting_dashboard()
+    widget = await Widget.first()
+    first_id, second_id = await DashboardWidget.filter(dashboard=template).values_list(
+        "id", flat=True
+    )
+
+    widgets, refs = await apply_dashboard_operations(
+        template,
+        make_operations(
+            {"op": "add", "widget_id": widget.id, "name": "New", "ref": "new"},
+            {"op": "add", "widget_id": widget.id, "name": "Temporary", "ref": "temporary"},
+            {"op": "move", "widget": "new", "position": 0},
+            {"op": "rename", "widget": second_id, "name": "Renamed"},
+            {"op": "remove", "widget": first_id},
+            {"op": "remove", "widget": "temporary"},
+        ),
+    )
+    # widgets added then removed are never saved
+    assert refs.keys() == {"new"}
+    assert [placed.id for placed in widgets] == [refs["new"], second_id]
+    assert await get_placed_widgets(template) == [
+        (refs["new"], "New", 0),
+        (second_id, "Renamed", 1),
+    ]
+
+
+@pytest.mark.asyncio
+@pytest.mark.usefixtures("db")
+async def test_apply_dashboard_operations_rolled_back():
+    template, dashboard = await create_inheriting_dashboard()
+    widget = await Widget.first()
+    placed = await get_placed_widgets(template)
+
+    with pytest.raises(DashboardOperationException) as exc_info:
+        await apply_dashboard_operations(
+            dashboard,
+            make_operations(
+                {"op": "add", "widget_id": widget.id, "name": "New", "ref": "new"},
+                {"op": "move", "widget": "new", "position": 5},
+            ),
+        )
+    assert exc_info.value.index == 1
+    # still inheriting, as copying the template's widgets was also rolled back
+    assert dashboard.is_inheriting
+    assert (await Dashboard.get(id=dashboard.id)).template_id == template.id
+    assert await DashboardWidget.filter(dashboard=dashboard).count() == 0
+    assert await get_placed_widgets(template) == placed
+
+
+@pytest.mark.asyncio
+@pytest.mark.usefixtures("db")
+async def test_apply_dashboard_operations_other_owner():
+    template, dashboard = await create_inheriting_dashboard()
+    await dashboard.materialize()
+    other_id = await DashboardWidget.filter(dashboard=template).first().values_list("id", flat=True)
+
+    # the template's widgets are not the dashboard's once it has its own copies
+    with pytest.raises(DashboardOperationException):
+        await apply_dashboard_operations(
+            dashboard, make_operations({"op": "remove", "widget": other_id})
+        )
+    assert await DashboardWidget.filter(id=other_id).exists()
+    assert await DashboardWidget.filter(dashboard=dashboard).count() == 2
+
+
+@pytest.mark.asyncio
+@pytest.mark.usefixtures("db")
+async def test_apply_dashboard_operations_inheriting():
+    template, dashboard = await create_inheriting_dashboard()
+    widget = await Widget.first()
+    template_placed = await get_placed_widgets(template)
+    first_id, second_id = (placed[0] for placed in template_placed)
+
+    widgets, refs = await apply_dashboard_operations(
+        dashboard,
+        make_operations(
+            {"op": "add", "widget_id": widget.id, "name": "New", "ref": "new"},
+            {"op": "move", "widget": second_id, "position": 0},
+            {"op": "rename", "widget": second_id, "name": "Renamed"},
+            {"op": "remove", "widget": first_id},
+        ),
+    )
+    assert not dashboard.is_inheriting
+    placed = await get_placed_widgets(dashboard)
+    # template widget ids were given to their copies
+    assert [(name, position) for _, name, position in placed] == [("Renamed", 0), ("New", 1)]
+    assert [placed_id for placed_id, _, _ in placed] == [placed.id for placed in widgets]
+    assert placed[1][0] == refs["new"]
+    assert not {first_id, second_id} & {placed_id for placed_id, _, _ in placed}
+    assert await get_placed_widgets(template) == template_placed
@@ -3,47 +3,113 @@ Module to assist with authentication
 """
 
 from collections.abc import Callable
-from functools import wraps
-from typing import Any
+from dataclasses import dataclass
+from functools import lru_cache, wraps
+from typing import Any, ClassVar
 
 import quart_auth
 from quart import abort
+from tortoise.transactions import in_transaction
 
 from ..database import models
+from .cache import LRUCache
+from .config import get_settings
 from .constants import PUBLIC_ACCOUNT_USERNAME, SystemSettingKeys
-from .helpers import get_system_setting
+from .helpers import SystemSettingCache, get_system_setting
 
 
-class AuthUserEnhanced(quart_auth.AuthUser):
-    # cached public user id, loaded on first use
-    __public_user_id: str | None
+@dataclass
+class Principal:
+    """
+    What is known about a user for access checks
+    """
+
+    exists: bool
+    is_admin: bool
+    is_public: bool
 
-    def __init__(self, auth_id: str | None) -> None:
-        super().__init__(auth_id)
-        self.__public_user_id = None
+
+@lru_cache
+def get_principal_cache() -> LRUCache:
+    """
+    returns the shared cache of Principal objs, by user id
+    """
+    # each entry has a size of 1, so the budget is a number of users
+    return LRUCache(get_settings().PRINCIPAL_CACHE_SIZE, ttl=get_settings().PRINCIPAL_CACHE_TTL)
+
+
+async def get_principal(user_id: int | str, /) -> Principal:
+    """
+    Get a user's principal from cache or db
+
+        :param user_id: The user's id
+        :return: The principal
+    """
+    cache = get_principal_cache()
+    user_id = int(user_id)
+    principal: Principal | None = cache.get(user_id)
+    if principal is None:
+        rows = await models.User.filter(id=user_id).values_list("username", "is_admin")
+        if rows:
+            username, is_admin = rows[0]
+            principal = Principal(True, is_admin, username == PUBLIC_ACCOUNT_USERNAME)
+        else:
+            principal = Principal(False, False, False)
+        cache.set(user_id, principal, size=1)
+    return principal
+
+
+async def invalidate_principal(user_id: int | str, /):
+    """
+    Remove a user's principal from cache, other processes clear
+    their cached principals on their next system settings sync,
+    use when the user is changed or removed
+
+        :param user_id: The user's id
+    """
+    get_principal_cache().pop(int(user_id))
+    async with SystemSettingCache.write_lock, in_transaction():
+        revision = await SystemSettingCache.mark_changed(SystemSettingKeys.PRINCIPALS)
+    SystemSettingCache.mark_seen(revision)
+
+
+async def _on_principals_changed(_):
+    get_principal_cache().clear()
+
+
+def watch_principal_changes():
+    """
+    Clear cached principals when a user is changed by another process,
+    must be run at app launch
+    """
+    SystemSettingCache.add_listener(SystemSettingKeys.PRINCIPALS, _on_principals_changed)
+
+
+class AuthUserEnhanced(quart_auth.AuthUser):
+    # cached public user id, loaded on first use (account is never removed)
+    _public_user_id: ClassVar[str | None] = None
 
     async def get_public_user_id(self) -> str | None:
-        if self.__public_user_id is None:
+        if AuthUserEnhanced._public_user_id is None:
             public_user = (
                 await models.User.filter(username=PUBLIC_ACCOUNT_USERNAME).get_or_none().only("id")
             )
             if public_user:
-                self.__public_user_id = str(public_user.id)
-        return self.__public_user_id
+                AuthUserEnhanced._public_user_id = str(public_user.id)
+        return AuthUserEnhanced._public_user_id
 
     @property
     async def is_authenticated_admin(self):
-        if (await self.is_authenticated) and (
-            await models.User.filter(id=current_user.auth_id, is_admin=True).get_or_none()
-        ):
-            return True
-        return False
+        if not (await self.is_authenticated):
+            return False
+        principal = await get_principal(self.auth_id)  # type: ignore
+        return principal.exists and principal.is_admin
 
     @property
     async def is_public_user(self):
-        if self.auth_id is not None and str(self.auth_id) == await self.get_public_user_id():
-            return True
-        return False
+        if self.auth_id is None:
+            return False
+        return (await get_principal(self.auth_id)).is_public
 
 
 # NOTE Enables better IDE hints and creating a nice api
@@ -0,0 +1,645 @@
+"""
+In-memory caches shared by the app
+"""
+
+import asyncio
+import json
+import sys
+from collections import OrderedDict
+from collections.abc import Awaitable, Callable, Hashable
+from contextvars import ContextVar
+from dataclasses import dataclass
+from functools import lru_cache
+from hashlib import blake2b
+from time import monotonic
+from typing import Any, ClassVar, TypeVar
+
+from .config import get_settings
+from .constants import SystemSettingKeys
+
+T = TypeVar("T")
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+
+
+def estimate_size(value: Any, /) -> int:
+    """
+    Estimate the memory used by a value in bytes,
+    including the contents of containers and the attributes of objects
+
+        :param value: The value to measure
+        :return: The estimated size
+    """
+    seen = set()
+    size = 0
+    pending = [value]
+    while pending:
+        value = pending.pop()
+        # NOTE shared objects are only counted once
+        if id(value) in seen:
+            continue
+        seen.add(id(value))
+        size += sys.getsizeof(value)
+        if isinstance(value, dict):
+            pending.extend(value.keys())
+            pending.extend(value.values())
+        elif isinstance(value, list | tuple | set | frozenset):
+            pending.extend(value)
+        elif hasattr(value, "__dict__") and not isinstance(value, type):
+            pending.append(vars(value))
+    return size
+
+
+@dataclass
+class _CacheEntry:
+    value: Any
+    size: int
+    expires_at: float | None
+
+
+class LRUCache:
+    """
+    A least recently used cache, that evicts entries
+    once the total size of stored values exceeds the memory budget
+    """
+
+    def __init__(
+        self,
+        max_size: int,
+        *,
+        ttl: float | None = None,
+        on_evict: Callable[[Hashable], None] | None = None,
+    ) -> None:
+        """
+        :param max_size: The memory budget in bytes, 0 will disable the cache
+        :param ttl: Seconds an entry is valid for, defaults to None (no expiry)
+        :param on_evict: Called with the key of each entry evicted to stay within budget
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.on_evict = on_evict
+        self.size = 0
+        self.stats = CacheStats()
+        self._entries: OrderedDict[Hashable, _CacheEntry] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        entry = self._entries.get(key)
+        return entry is not None and not self._is_expired(entry)
+
+    @staticmethod
+    def _is_expired(entry: _CacheEntry) -> bool:
+        return entry.expires_at is not None and entry.expires_at <= monotonic()
+
+    def peek(self, key: Hashable, default: Any = None) -> Any:
+        """
+        Get a value from the cache, without marking it as used
+
+            :param key: The entry key
+            :param default: Returned when the key is missing or expired, defaults to None
+            :return: The cached value or the default
+        """
+        entry = self._entries.get(key)
+        if entry is None or self._is_expired(entry):
+            return default
+        return entry.value
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """
+        Get a value from the cache, marking it as recently used
+
+            :param key: The entry key
+            :param default: Returned when the key is missing or expired, defaults to None
+            :return: The cached value or the default
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            self.stats.misses += 1
+            return default
+        if self._is_expired(entry):
+            self.pop(key)
+            self.stats.misses += 1
+            return default
+        self._entries.move_to_end(key)
+        self.stats.hits += 1
+        return entry.value
+
+    def set(
+        self, key: Hashable, value: Any, /, *, size: int | None = None, ttl: float | None = None
+    ):
+        """
+        Store a value in the cache, evicting the least recently used entries if over budget
+
+            :param key: The entry key
+            :param value: The value to store
+            :param size: The size of the value in bytes, defaults to measuring the value
+            :param ttl: Override the cache's ttl for this entry, defaults to None
+        """
+        if size is None:
+            size = estimate_size(value)
+        if size > self.max_size:
+            # would never fit, so don't evict everything else
+            self.pop(key)
+            return
+        self.pop(key)
+        ttl = ttl if ttl is not None else self.ttl
+        self._entries[key] = _CacheEntry(
+            value,
+            size,
+            monotonic() + ttl if ttl is not None else None,
+        )
+        self.size += size
+        while self.size > self.max_size:
+            evicted_key, evicted = self._entries.popitem(last=False)
+            self.size -= evicted.size
+            self.stats.evictions += 1
+            if self.on_evict is not None:
+                self.on_evict(evicted_key)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        """
+        Remove an entry from the cache
+
+            :param key: The entry key
+            :param default: Returned when the key is missing, defaults to None
+            :return: The removed value or the default
+        """
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return default
+        self.size -= entry.size
+        return entry.value
+
+    def pop_where(self, predicate: Callable[[Hashable, Any], bool]) -> int:
+        """
+        Remove all entries matching a predicate
+
+            :param predicate: Given the key and value, returns whether to remove the entry
+            :return: Number of removed entries
+        """
+        keys = [key for key, entry in self._entries.items() if predicate(key, entry.value)]
+        for key in keys:
+            self.pop(key)
+        return len(keys)
+
+    def clear(self):
+        self._entries.clear()
+        self.size = 0
+
+
+def make_config_fingerprint(config: Any) -> str:
+    """
+    Create a stable fingerprint for a widget config
+
+        :param config: The JSON serialisable config
+        :return: The fingerprint
+    """
+    dumped = json.dumps(config, sort_keys=True, default=str)
+    return blake2b(dumped.encode(), digest_size=16).hexdigest()
+
+
+def make_content_etag(content: str) -> str:
+    """
+    Create a strong etag for rendered content
+
+        :param content: The rendered content
+        :return: The etag (unquoted)
+    """
+    return blake2b(content.encode(), digest_size=16).hexdigest()
+
+
+@dataclass
+class _RenderedWidgetEntry:
+    plugin_name: str
+    widget_name: str
+    fingerprint: str
+    content: str
+    expires_at: float | None
+
+    @property
+    def is_expired(self) -> bool:
+        return self.expires_at is not None and self.expires_at <= monotonic()
+
+
+class WidgetRenderCache:
+    """
+    Cache of rendered widget HTML,
+    keyed by dashboard widget id and fingerprint of its config.
+    Expired entries are kept (until evicted) as the last good render of a widget.
+    """
+
+    def __init__(self, max_size: int, ttl: float | None) -> None:
+        self.ttl = ttl
+        self._cache = LRUCache(max_size)
+
+    @property
+    def stats(self) -> CacheStats:
+        return self._cache.stats
+
+    def _get_entry(self, widget_id: int, config: Any) -> _RenderedWidgetEntry | None:
+        entry: _RenderedWidgetEntry | None = self._cache.get(widget_id)
+        if entry is None or entry.fingerprint != make_config_fingerprint(config):
+            return None
+        return entry
+
+    def get(self, widget_id: int, config: Any) -> str | None:
+        entry = self._get_entry(widget_id, config)
+        if entry is None or entry.is_expired:
+            return None
+        return entry.content
+
+    def get_last_good(self, widget_id: int, config: Any) -> str | None:
+        """
+        Get the last render of a widget, even if expired
+
+            :param widget_id: The placed widget's id
+            :param config: The widget's current config
+            :return: The rendered content, or None if never rendered with this config
+        """
+        entry = self._get_entry(widget_id, config)
+        return entry.content if entry is not None else None
+
+    def contains(self, widget_id: int, config: Any) -> bool:
+        entry: _RenderedWidgetEntry | None = self._cache.peek(widget_id)
+        return (
+            entry is not None
+            and not entry.is_expired
+            and entry.fingerprint == make_config_fingerprint(config)
+        )
+
+    def set(self, widget_id: int, config: Any, plugin_name: str, widget_name: str, content: str):
+        self._cache.set(
+            widget_id,
+            _RenderedWidgetEntry(
+                plugin_name,
+                widget_name,
+                make_config_fingerprint(config),
+                content,
+                monotonic() + self.ttl if self.ttl is not None else None,
+            ),
+            size=sys.getsizeof(content),
+        )
+
+    def invalidate_widget(self, widget_id: int, *, notify_workers: bool = True):
+        """
+        Remove a widget's rendered content
+
+            :param widget_id: The placed widget's id
+            :param notify_workers: Whether other processes also remove it, defaults to True
+        """
+        self._cache.pop(widget_id)
+        if notify_workers:
+            CacheInvalidations.add("widget", widget_id)
+        # NOTE other processes invalidate their snapshot along with the widgets
+        get_public_snapshot().invalidate(notify_workers=False)
+
+    def invalidate_plugin(
+        self, plugin_name: str, widget_name: str | None = None, *, notify_workers: bool = True
+    ):
+        """
+        Remove the rendered content of a plugin's widgets
+
+            :param plugin_name: The plugin's internal name
+            :param widget_name: Only remove this widget's content, defaults to all widgets
+            :param notify_workers: Whether other processes also remove it, defaults to True
+        """
+        self._cache.pop_where(
+            lambda _, entry: (
+                entry.plugin_name == plugin_name
+                and (widget_name is None or entry.widget_name == widget_name)
+            )
+        )
+        if notify_workers:
+            CacheInvalidations.add("plugin-widgets", plugin_name, widget_name or "")
+        # NOTE other processes invalidate their snapshot along with the widgets
+        get_public_snapshot().invalidate(notify_workers=False)
+
+    def clear(self, *, notify_workers: bool = True):
+        self._cache.clear()
+        if notify_workers:
+            CacheInvalidations.add("widgets")
+        # NOTE other processes invalidate their snapshot along with the widgets
+        get_public_snapshot().invalidate(notify_workers=False)
+
+
+@dataclass
+class Snapshot:
+    content: str
+    etag: str
+
+
+class PageSnapshot:
+    """
+    Holds a single fully rendered page,
+    which is dropped when anything it was rendered from changes
+    """
+
+    def __init__(self, ttl: float | None) -> None:
+        self.ttl = ttl
+        self.lock = asyncio.Lock()
+        self._generation = 0
+        self._snapshot: Snapshot | None = None
+        self._expires_at: float | None = None
+
+    @property
+    def generation(self) -> int:
+        """
+        Changes every time the snapshot is invalidated,
+        take before rendering and give to set()
+        """
+        return self._generation
+
+    def get(self) -> Snapshot | None:
+        if self._expires_at is not None and self._expires_at <= monotonic():
+            self._snapshot = None
+        return self._snapshot
+
+    def set(self, content: str, generation: int) -> Snapshot:
+        """
+        Store a new snapshot, unless invalidated since the given generation
+
+            :param content: The rendered page
+            :param generation: The generation taken before rendering began
+            :return: The snapshot (even if it was not stored)
+        """
+        snapshot = Snapshot(content, make_content_etag(content))
+        if generation == self._generation:
+            self._snapshot = snapshot
+            self._expires_at = monotonic() + self.ttl if self.ttl is not None else None
+        return snapshot
+
+    def invalidate(self, *, notify_workers: bool = True):
+        """
+        Drop the snapshot, use when anything it was rendered from changes
+
+            :param notify_workers: Whether other processes also drop theirs, defaults to True
+        """
+        self._generation += 1
+        self._snapshot = None
+        if notify_workers:
+            CacheInvalidations.add("snapshot")
+
+
+_MISSING = object()
+
+
+class PluginCache:
+    """
+    A plugin's own namespace within the shared plugin cache,
+    all plugins share the same memory budget
+    """
+
+    def __init__(self, store: "PluginCacheStore", namespace: str) -> None:
+        self._store = store
+        self.namespace = namespace
+        self.stats = CacheStats()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """
+        Get a cached value
+
+            :param key: The entry key
+            :param default: Returned when the key is missing or expired, defaults to None
+            :return: The cached value or the default
+        """
+        value = self._store.cache.get((self.namespace, key), _MISSING)
+        if value is _MISSING:
+            self.stats.misses += 1
+            return default
+        self.stats.hits += 1
+        return value
+
+    def set(
+        self, key: Hashable, value: Any, /, *, size: int | None = None, ttl: float | None = None
+    ):
+        """
+        Store a value, evicting least recently used entries (of any plugin) if over budget
+
+            :param key: The entry key
+            :param value: The value to store
+            :param size: The size of the value in bytes, defaults to measuring the value
+            :param ttl: Override the default ttl for this entry, defaults to None
+        """
+        self._store.cache.set((self.namespace, key), value, size=size, ttl=ttl)
+
+    def delete(self, key: Hashable, *, notify_workers: bool = True):
+        """
+        Remove an entry
+
+            :param key: The entry key
+            :param notify_workers: Whether other processes also remove it, defaults to True
+        """
+        self._store.cache.pop((self.namespace, key))
+        if notify_workers:
+            self._notify_workers()
+
+    def delete_where(
+        self, predicate: Callable[[Hashable], bool], *, notify_workers: bool = True
+    ) -> int:
+        """
+        Remove all entries with a key matching a predicate
+
+            :param predicate: Given the key, returns whether to remove the entry
+            :param notify_workers: Whether other processes also remove them, defaults to True
+            :return: Number of removed entries
+        """
+        removed = self._store.cache.pop_where(
+            lambda key, _: key[0] == self.namespace and predicate(key[1])
+        )
+        if notify_workers:
+            self._notify_workers()
+        return removed
+
+    def clear(self, *, notify_workers: bool = True):
+        """
+        Remove all entries
+
+            :param notify_workers: Whether other processes also remove them, defaults to True
+        """
+        self._store.cache.pop_where(lambda key, _: key[0] == self.namespace)
+        if notify_workers:
+            self._notify_workers()
+
+    def _notify_workers(self):
+        # NOTE keys and predicates can not be sent, so other processes clear the whole namespace
+        CacheInvalidations.add("plugin-cache", self.namespace)
+
+    async def get_or_compute(
+        self,
+        key: Hashable,
+        compute: Callable[[], Awaitable[T]],
+        /,
+        *,
+        size: int | None = None,
+        ttl: float | None = None,
+    ) -> T:
+        """
+        Get a cached value, or compute and store it when missing.
+        Concurrent calls for the same missing key wait for a single computation.
+
+            :param key: The entry key
+            :param compute: Called to create the value when missing
+            :param size: The size of the value in bytes, defaults to measuring the value
+            :param ttl: Override the default ttl for this entry, defaults to None
+            :return: The cached or computed value
+        """
+        if (value := self.get(key, _MISSING)) is not _MISSING:
+            return value
+
+        full_key = (self.namespace, key)
+        if (pending := self._store.pending.get(full_key)) is None:
+            # NOTE computed in its own task, so a caller going away does not cancel it for others
+            pending = asyncio.ensure_future(self._compute(key, compute, size, ttl))
+            pending.add_done_callback(_retrieve_exception)
+            self._store.pending[full_key] = pending
+        return await asyncio.shield(pending)
+
+    async def _compute(
+        self,
+        key: Hashable,
+        compute: Callable[[], Awaitable[T]],
+        size: int | None,
+        ttl: float | None,
+    ) -> T:
+        try:
+            value = await compute()
+        finally:
+            self._store.pending.pop((self.namespace, key), None)
+        self.set(key, value, size=size, ttl=ttl)
+        return value
+
+
+def _retrieve_exception(future: asyncio.Future):
+    # callers are given the error, so it does not need logging when they have gone away
+    if not future.cancelled():
+        future.exception()
+
+
+class PluginCacheStore:
+    """
+    Storage shared by all plugin caches
+    """
+
+    def __init__(self, max_size: int, ttl: float | None) -> None:
+        self.cache = LRUCache(max_size, ttl=ttl, on_evict=self._on_evict)
+        self.pending: dict[tuple[str, Hashable], asyncio.Future] = {}
+        self._namespaces: dict[str, PluginCache] = {}
+
+    def _on_evict(self, key: Hashable):
+        if (namespace := self._namespaces.get(key[0])) is not None:  # type: ignore
+            namespace.stats.evictions += 1
+
+    def get_namespace(self, namespace: str) -> PluginCache:
+        if (plugin_cache := self._namespaces.get(namespace)) is None:
+            plugin_cache = self._namespaces[namespace] = PluginCache(self, namespace)
+        return plugin_cache
+
+
+@lru_cache
+def get_plugin_cache_store() -> PluginCacheStore:
+    """
+    returns the shared PluginCacheStore obj
+    """
+    return PluginCacheStore(get_settings().PLUGIN_CACHE_SIZE, get_settings().PLUGIN_CACHE_TTL)
+
+
+def get_plugin_cache(plugin_name: str) -> PluginCache:
+    """
+    Get a plugin's cache, which is local to each process
+    (removing entries also clears the plugin's cache in other processes)
+
+        :param plugin_name: The plugin's internal name
+        :return: The plugin's cache
+    """
+    return get_plugin_cache_store().get_namespace(plugin_name)
+
+
+@lru_cache
+def get_public_snapshot() -> PageSnapshot:
+    """
+    returns the PageSnapshot obj for the public dashboard
+    """
+    return PageSnapshot(get_settings().WIDGET_CACHE_TTL)
+
+
+@lru_cache
+def get_widget_render_cache() -> WidgetRenderCache:
+    """
+    returns the shared WidgetRenderCache obj
+    """
+    return WidgetRenderCache(get_settings().WIDGET_CACHE_SIZE, get_settings().WIDGET_CACHE_TTL)
+
+
+class CacheInvalidations:
+    """
+    static class collecting the cache invalidations made while handling a request (or running a job),
+    which are sent to other processes once it has finished and its changes are committed
+    """
+
+    # NOTE a context var, so concurrent requests only send their own invalidations
+    _pending: ClassVar[ContextVar[set[str] | None]] = ContextVar(
+        "cache_invalidations", default=None
+    )
+
+    @staticmethod
+    def collect():
+        """
+        Start collecting invalidations made in the current context,
+        any made outside of a collecting context only apply to this process
+        """
+        CacheInvalidations._pending.set(set())
+
+    @staticmethod
+    def add(kind: str, *args: Any):
+        if (pending := CacheInvalidations._pending.get()) is not None:
+            key = ":".join(map(str, (kind, *args)))
+            pending.add(SystemSettingKeys.CACHE_INVALIDATION_PREFIX + key)
+
+    @staticmethod
+    def pop() -> set[str]:
+        """
+        Take the invalidations collected so far
+
+            :return: The system setting keys to mark as changed
+        """
+        pending = CacheInvalidations._pending.get()
+        if not pending:
+            return set()
+        keys = pending.copy()
+        pending.clear()
+        return keys
+
+    @staticmethod
+    def is_invalidation(key: str, /) -> bool:
+        return key.startswith(SystemSettingKeys.CACHE_INVALIDATION_PREFIX)
+
+    @staticmethod
+    def apply(key: str, /):
+        """
+        Make an invalidation sent by another process
+
+            :param key: The system setting key marked as changed
+        """
+        kind, *args = key.removeprefix(SystemSettingKeys.CACHE_INVALIDATION_PREFIX).split(":", 2)
+        match kind, args:
+            case "widget", [widget_id]:
+                get_widget_render_cache().invalidate_widget(int(widget_id), notify_workers=False)
+            case "plugin-widgets", [plugin_name, widget_name]:
+                get_widget_render_cache().invalidate_plugin(
+                    plugin_name, widget_name or None, notify_workers=False
+                )
+            case "widgets", []:
+                get_widget_render_cache().clear(notify_workers=False)
+            case "snapshot", []:
+                get_public_snapshot().invalidate(notify_workers=False)
+            case "plugin-cache", [namespace]:
+                get_plugin_cache(namespace).clear(notify_workers=False)
+            case _:
+                raise ValueError(f"unknown cache invalidation {key!r}")
@@ -20,6 +20,27 @@ class Settings(BaseSettings):
 
     UNATTENDED_DEMO_INSTALL: bool = False
 
+    WIDGET_RENDER_CONCURRENT: bool = True
+    WIDGET_RENDER_TIMEOUT: float | None = 10
+    STREAM_PORTAL: bool = False
+    PUBLIC_SNAPSHOT: bool = False
+    WIDGET_CACHE_SIZE: int = 8_388_608
+    WIDGET_CACHE_TTL: float | None = 300
+    PLUGIN_CACHE_SIZE: int = 8_388_608
+    PLUGIN_CACHE_TTL: float | None = 300
+    SCHEDULER_LEASE_GRACE: float = 30
+    SYSTEM_SETTINGS_SYNC_INTERVAL: float = 1
+    PRINCIPAL_CACHE_SIZE: int = 1024
+    PRINCIPAL_CACHE_TTL: float | None = 30
+    PASSWORD_HASH_METHOD: str = "scrypt"
+    PASSWORD_HASH_WORKERS: int = 2
+    PASSWORD_HASH_QUEUE_LIMIT: int = 16
+    PLUGIN_LATENCY_BUDGET: float | None = 2
+    PLUGIN_BREAKER_WINDOW: int = 20
+    PLUGIN_BREAKER_MIN_CALLS: int = 5
+    PLUGIN_BREAKER_FAILURE_RATE: float = 0.5
+    PLUGIN_BREAKER_COOLDOWN: float = 30
+
     @computed_field
     @property
     def log_level_as_int(self) -> int:
@@ -15,6 +15,9 @@ PUBLIC_ACCOUNT_USERNAME = "public"
 VALID_USERNAME_RE = r"^[a-zA-Z0-9]+$"
 MAX_USERNAME_LENGTH = 128
 
+MAX_WIDGET_NAME_LENGTH = 128
+MAX_DASHBOARD_OPERATIONS = 500
+
 MIN_PASSWORD_LENGTH = 8
 MAX_PASSWORD_LENGTH = 1024
 
@@ -32,3 +35,8 @@ class SystemSettingKeys:
     BRANDING = "BRANDING"
     DEMO_MODE = "DEMO_MODE"
     HAS_SETUP = "has_setup"
+    PLUGIN_RELOADS = "PLUGIN_RELOADS"
+    # never set, only marked as changed so other processes clear their cached principals
+    PRINCIPALS = "PRINCIPALS"
+    # never set, keys starting with this are marked as changed so other processes drop cache entries
+    CACHE_INVALIDATION_PREFIX = "CACHE:"
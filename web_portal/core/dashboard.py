@@ -0,0 +1,327 @@
+"""
+Module to assist with loading and editing dashboards,
+including batches of operations applied with a single load and write of the dashboard
+"""
+
+from typing import Annotated, Any, Literal
+
+from pydantic import BaseModel, Field, StringConstraints
+from quart import session
+from tortoise.functions import Count
+from tortoise.transactions import in_transaction
+
+from ..database import models
+from .auth import current_user
+from .cache import get_public_snapshot, get_widget_render_cache
+from .constants import MAX_DASHBOARD_OPERATIONS, MAX_WIDGET_NAME_LENGTH, PUBLIC_ACCOUNT_USERNAME
+from .plugin import WidgetContext, get_widget_context
+
+# session key of the copies made when the user's dashboard was last materialized
+WIDGET_COPIES_SESSION_KEY = "widget-copies"
+
+WidgetName = Annotated[
+    str, StringConstraints(strip_whitespace=True, min_length=1, max_length=MAX_WIDGET_NAME_LENGTH)
+]
+# a placed widget's id, or the ref of a widget added earlier in the same batch
+WidgetTarget = int | str
+
+
+class AddWidgetOperation(BaseModel):
+    op: Literal["add"]
+    # the widget type to place
+    widget_id: int
+    name: WidgetName
+    show_header: bool = False
+    config: Any = None
+    # allows later operations in the batch to target the new widget
+    ref: str | None = None
+
+
+class RemoveWidgetOperation(BaseModel):
+    op: Literal["remove"]
+    widget: WidgetTarget
+
+
+class RenameWidgetOperation(BaseModel):
+    op: Literal["rename"]
+    widget: WidgetTarget
+    name: WidgetName
+
+
+class SetWidgetHeaderOperation(BaseModel):
+    op: Literal["set_header"]
+    widget: WidgetTarget
+    show_header: bool
+
+
+class MoveWidgetOperation(BaseModel):
+    op: Literal["move"]
+    widget: WidgetTarget
+    # index the widget is moved to, in the order at that point in the batch
+    position: int
+
+
+class SetWidgetConfigOperation(BaseModel):
+    op: Literal["set_config"]
+    widget: WidgetTarget
+    config: Any
+
+
+DashboardOperation = Annotated[
+    AddWidgetOperation
+    | RemoveWidgetOperation
+    | RenameWidgetOperation
+    | SetWidgetHeaderOperation
+    | MoveWidgetOperation
+    | SetWidgetConfigOperation,
+    Field(discriminator="op"),
+]
+
+
+class DashboardBatch(BaseModel):
+    operations: Annotated[list[DashboardOperation], Field(max_length=MAX_DASHBOARD_OPERATIONS)]
+
+
+async def get_public_dashboard() -> models.Dashboard:
+    """
+    Get the public account's dashboard, shown to users without their own
+    """
+    public_account = await models.User.filter(username=PUBLIC_ACCOUNT_USERNAME).get().only("id")
+    return (await models.Dashboard.get_or_create(owner=public_account, name=""))[0]
+
+
+async def get_dashboard_templates() -> list[models.Dashboard]:
+    """
+    Get the named dashboard templates ordered by name,
+    annotated with their widget_count and user_count
+    """
+    return await (
+        models.Dashboard.filter(owner__username=PUBLIC_ACCOUNT_USERNAME, name__not="")
+        .annotate(
+            widget_count=Count("widgets", distinct=True),
+            user_count=Count("inheritors", distinct=True),
+        )
+        .order_by("name")
+    )
+
+
+async def get_dashboard_template(template_id: int) -> models.Dashboard | None:
+    """
+    Get a named dashboard template
+
+        :param template_id: The template's dashboard id
+        :return: The template, or None when not found
+    """
+    return await models.Dashboard.get_or_none(
+        id=template_id, owner__username=PUBLIC_ACCOUNT_USERNAME, name__not=""
+    )
+
+
+async def materialize_dashboard(dashboard: models.Dashboard, /) -> dict[int, int]:
+    """
+    Copy the template's widgets into the current user's dashboard, remembering
+    the copies in the session so pages still showing the template's widgets can find them
+
+        :param dashboard: The current user's dashboard
+        :return: The id of each copy, by the id of the template widget it was copied from
+    """
+    copies = await dashboard.materialize()
+    if copies:
+        session[WIDGET_COPIES_SESSION_KEY] = {str(key): value for key, value in copies.items()}
+    return copies
+
+
+async def get_editable_dashboard() -> tuple[models.Dashboard, dict[int, int]]:
+    """
+    Get the current user's dashboard, first copying the widgets of its template
+    so they can be changed, the copies are given by template widget id
+
+        :raises DoesNotExist: When the user has no dashboard
+    """
+    dashboard = await models.Dashboard.get(owner_id=current_user.auth_id, name="")
+    return dashboard, await materialize_dashboard(dashboard)
+
+
+async def get_widget_copy_id(dashboard: models.Dashboard, widget_id: int, /) -> int | None:
+    """
+    Get the id of the copy made of a template widget,
+    when the current user's dashboard was last materialized
+
+        :param dashboard: The current user's dashboard
+        :param widget_id: The template widget's id
+        :return: The copy's id, or None when not copied or since removed
+    """
+    copy_id = session.get(WIDGET_COPIES_SESSION_KEY, {}).get(str(widget_id))
+    if copy_id is None:
+        return None
+    if not await models.DashboardWidget.filter(id=copy_id, dashboard_id=dashboard.id).exists():
+        return None
+    return copy_id
+
+
+async def get_editable_widget_context(widget_id: int, /) -> WidgetContext:
+    """
+    Get a widget's context so it can be changed, when the widget is inherited
+    by the current user's dashboard, the template's widgets are first copied
+    to the dashboard and the context of the widget's copy is given instead
+
+        :param widget_id: The widget's id
+        :raises DoesNotExist: When the widget does not exist
+        :return: The widget context, its owner must still be checked
+    """
+    context = await get_widget_context(widget_id)
+    if str(context.owner_id) == current_user.auth_id:
+        return context
+    dashboard = await models.Dashboard.get_or_none(owner_id=current_user.auth_id, name="")
+    if dashboard is None:
+        return context
+    if dashboard.is_inheriting:
+        is_inherited = await models.DashboardWidget.filter(
+            id=widget_id, dashboard_id=dashboard.template_id
+        ).exists()
+        copy_id = (await materialize_dashboard(dashboard)).get(widget_id) if is_inherited else None
+    else:
+        # copied by an earlier change, made from a page showing the template's widgets
+        copy_id = await get_widget_copy_id(dashboard, widget_id)
+    if copy_id is None:
+        return context
+    return await get_widget_context(copy_id)
+
+
+class DashboardOperationException(ValueError):
+    """
+    Raised when an operation in a batch cannot be applied,
+    none of the batch's operations are applied
+    """
+
+    def __init__(self, index: int, message: str) -> None:
+        super().__init__(f"operation {index}: {message}")
+        self.index = index
+
+
+async def apply_dashboard_operations(
+    dashboard: models.Dashboard, operations: list[DashboardOperation], /
+) -> tuple[list[models.DashboardWidget], dict[str, int]]:
+    """
+    Apply operations to a dashboard's placed widgets in order, as one transaction.
+    Operations are applied to the widgets in memory, then only added, removed
+    or changed widgets are written, with positions kept dense.
+
+        :param dashboard: The dashboard to edit
+        :param operations: The operations to apply, in order
+        :raises DashboardOperationException: When an operation is invalid,
+                                             leaving the dashboard unchanged
+        :return: The placed widgets in their new order and the ids of widgets added with a ref
+    """
+    template_id = dashboard.template_id
+    try:
+        return await _apply_dashboard_operations(dashboard, operations)
+    except Exception:
+        # still inheriting, as copying the template's widgets was rolled back
+        dashboard.template_id = template_id
+        raise
+
+
+async def _apply_dashboard_operations(
+    dashboard: models.Dashboard, operations: list[DashboardOperation], /
+) -> tuple[list[models.DashboardWidget], dict[str, int]]:
+    widget_type_ids = {operation.widget_id for operation in operations if operation.op == "add"}
+    if widget_type_ids:
+        widget_type_ids &= set(
+            await models.Widget.filter(id__in=widget_type_ids).values_list("id", flat=True)
+        )
+
+    async with in_transaction():
+        # operations can target the template's widgets, which are replaced by their copies
+        copies = await dashboard.materialize()
+        widgets = list(
+            await models.DashboardWidget.filter(dashboard_id=dashboard.id).order_by(
+                "position", "id"
+            )
+        )
+        by_id = {widget.id: widget for widget in widgets}
+        by_ref: dict[str, models.DashboardWidget] = {}
+        changed: set[int] = set()
+        removed: list[int] = []
+
+        def get_index(widget: models.DashboardWidget) -> int | None:
+            # NOTE by identity, as unsaved widgets are all equal to each other
+            return next((i for i, placed in enumerate(widgets) if placed is widget), None)
+
+        def get_target(index: int, target: WidgetTarget) -> tuple[int, models.DashboardWidget]:
+            if isinstance(target, str):
+                widget = by_ref.get(target)
+            else:
+                widget = by_id.get(copies.get(target, target))
+            if widget is None or (widget_index := get_index(widget)) is None:
+                raise DashboardOperationException(index, f"widget '{target}' not found")
+            if widget.id is not None:
+                changed.add(widget.id)
+            return widget_index, widget
+
+        for index, operation in enumerate(operations):
+            match operation:
+                case AddWidgetOperation():
+                    if operation.widget_id not in widget_type_ids:
+                        raise DashboardOperationException(
+                            index, f"widget type '{operation.widget_id}' not found"
+                        )
+                    if operation.ref is not None and operation.ref in by_ref:
+                        raise DashboardOperationException(
+                            index, f"ref '{operation.ref}' already used"
+                        )
+                    widget = models.DashboardWidget(
+                        name=operation.name,
+                        show_header=operation.show_header,
+                        config=operation.config,
+                        dashboard_id=dashboard.id,
+                        widget_id=operation.widget_id,
+                    )
+                    widgets.append(widget)
+                    if operation.ref is not None:
+                        by_ref[operation.ref] = widget
+                case RemoveWidgetOperation():
+                    widget_index, widget = get_target(index, operation.widget)
+                    del widgets[widget_index]
+                    if widget.id is not None:
+                        removed.append(widget.id)
+                case RenameWidgetOperation():
+                    _, widget = get_target(index, operation.widget)
+                    widget.name = operation.name
+                case SetWidgetHeaderOperation():
+                    _, widget = get_target(index, operation.widget)
+                    widget.show_header = operation.show_header
+                case MoveWidgetOperation():
+                    widget_index, widget = get_target(index, operation.widget)
+                    if not 0 <= operation.position < len(widgets):
+                        raise DashboardOperationException(
+                            index, f"position '{operation.position}' out of range"
+                        )
+                    widgets.insert(operation.position, widgets.pop(widget_index))
+                case SetWidgetConfigOperation():
+                    _, widget = get_target(index, operation.widget)
+                    widget.config = operation.config
+
+        if removed:
+            await models.DashboardWidget.filter(dashboard_id=dashboard.id, id__in=removed).delete()
+
+        to_update = []
+        for position, widget in enumerate(widgets):
+            if widget.id is None:
+                widget.position = position
+                await widget.save()
+            elif widget.id in changed or widget.position != position:
+                widget.position = position
+                to_update.append(widget)
+        if to_update:
+            await models.DashboardWidget.bulk_update(
+                to_update, fields=["name", "show_header", "config", "position"]
+            )
+
+    cache = get_widget_render_cache()
+    for widget_id in (*removed, *changed):
+        cache.invalidate_widget(widget_id)
+    get_public_snapshot().invalidate()
+
+    # widgets added then removed in the same batch were never saved
+    return widgets, {ref: widget.id for ref, widget in by_ref.items() if widget.id is not None}
@@ -5,6 +5,7 @@ from tortoise.transactions import atomic
 from ..core.constants import SystemSettingKeys
 from ..core.helpers import set_system_setting
 from ..core.plugin import PluginHandler
+from ..core.supervisor import get_plugin_supervisor
 from ..database import models
 
 
@@ -14,19 +15,21 @@ async def do_demo_install():
         username="admin",
         is_admin=True,
     )
-    admin_user.set_password("admin")
+    await admin_user.set_password_async("admin")
 
     demo_user = models.User(
         username="demo",
         is_admin=False,
     )
-    demo_user.set_password("demo")
+    await demo_user.set_password_async("demo")
 
     plugins_to_setup = []
 
     for plugin in PluginHandler.get_loaded_plugin_values():
         if plugin.meta.do_demo_setup is not None:
-            plugins_to_setup.append(plugin.meta.do_demo_setup())  # noqa: PERF401
+            plugins_to_setup.append(  # noqa: PERF401
+                get_plugin_supervisor().call(plugin, plugin.meta.do_demo_setup)
+            )
 
     # This is a a lot of asyncio gathering!!!
     await asyncio.gather(
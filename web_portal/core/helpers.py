@@ -2,13 +2,181 @@
 Misc functions that will assist with other modules
 """
 
-from collections.abc import Callable
+import asyncio
+import logging
+from collections.abc import Awaitable, Callable
 from functools import wraps
-from typing import Any
+from time import monotonic
+from typing import Any, ClassVar
 
 from quart import Response, current_app, redirect, request, url_for
+from tortoise.expressions import F, Q
+from tortoise.transactions import in_transaction
 
 from ..database import models
+from .cache import CacheInvalidations, get_public_snapshot
+from .config import get_settings
+
+logger = logging.getLogger("web-portal")
+
+
+class SystemSettingCache:
+    """
+    static class for the in-memory system settings cache (values are stored in the app config),
+    kept in sync between processes by a global revision stored in the db
+    that every write increments
+    """
+
+    GLOBAL_KEY: ClassVar[str] = "*"
+    # writes may be gathered inside another transaction, their savepoints must not interleave
+    write_lock: ClassVar[asyncio.Lock] = asyncio.Lock()
+    _revision: ClassVar[int | None] = None
+    _next_check_at: ClassVar[float] = 0
+    # settings known to not be set, so a lookup does not need the db
+    _missing_keys: ClassVar[set[str]] = set()
+    # key prefixes where every set setting has been loaded, "" meaning all settings
+    _loaded_prefixes: ClassVar[set[str]] = set()
+    _listeners: ClassVar[dict[str, list[Callable[[Any], Awaitable]]]] = {}
+
+    @staticmethod
+    def add_listener(key: str, listener: Callable[[Any], Awaitable], /):
+        """
+        Run a function when a setting is changed by another process
+
+            :param key: The setting's key
+            :param listener: Given the new value (None if removed)
+        """
+        SystemSettingCache._listeners.setdefault(key, []).append(listener)
+
+    @staticmethod
+    def is_known_missing(key: str, /) -> bool:
+        return key in SystemSettingCache._missing_keys or any(
+            key.startswith(prefix) for prefix in SystemSettingCache._loaded_prefixes
+        )
+
+    @staticmethod
+    def store(key: str, value: Any, /):
+        """
+        Store a setting in cache
+
+            :param key: The setting's key
+            :param value: The setting's value, None if it is not set
+        """
+        if value is None:
+            current_app.config.pop(key, None)
+            SystemSettingCache._missing_keys.add(key)
+        else:
+            current_app.config[key] = value
+            SystemSettingCache._missing_keys.discard(key)
+
+    @staticmethod
+    def mark_prefix_loaded(prefix: str, /):
+        SystemSettingCache._loaded_prefixes.add(prefix)
+
+    @staticmethod
+    async def get_revision() -> int:
+        revisions = await models.SystemSettingRevision.filter(
+            key=SystemSettingCache.GLOBAL_KEY
+        ).values_list("revision", flat=True)
+        return revisions[0] if revisions else 0
+
+    @staticmethod
+    async def mark_changed(*keys: str) -> int:
+        """
+        Increment the global revision and record it against the changed settings,
+        should be run in the same transaction as the change
+
+            :param keys: The settings' keys
+            :return: The new revision
+        """
+        global_revision = models.SystemSettingRevision.filter(key=SystemSettingCache.GLOBAL_KEY)
+        if not await global_revision.update(revision=F("revision") + 1):
+            await models.SystemSettingRevision.get_or_create(key=SystemSettingCache.GLOBAL_KEY)
+            await global_revision.update(revision=F("revision") + 1)
+        revision = await SystemSettingCache.get_revision()
+        for key in keys:
+            await models.SystemSettingRevision.update_or_create(
+                key=key, defaults={"revision": revision}
+            )
+        return revision
+
+    @staticmethod
+    def mark_seen(revision: int, /):
+        """
+        Skip reloading a change made by this process,
+        unless changes from other processes happened in between
+
+            :param revision: The revision of the change
+        """
+        if SystemSettingCache._revision == revision - 1:
+            SystemSettingCache._revision = revision
+
+    @staticmethod
+    async def sync(*, force: bool = False):
+        """
+        Reload cached system settings that have been changed by other processes,
+        only checks once per SYSTEM_SETTINGS_SYNC_INTERVAL
+
+            :param force: Check even if checked within the interval, defaults to False
+        """
+        now = monotonic()
+        if not force and now < SystemSettingCache._next_check_at:
+            return
+        SystemSettingCache._next_check_at = now + get_settings().SYSTEM_SETTINGS_SYNC_INTERVAL
+
+        revision = await SystemSettingCache.get_revision()
+        if SystemSettingCache._revision is None:
+            # first sync, nothing has been cached yet
+            await models.SystemSettingRevision.get_or_create(key=SystemSettingCache.GLOBAL_KEY)
+            SystemSettingCache._revision = revision
+            return
+        if revision == SystemSettingCache._revision:
+            return
+
+        changed_keys = await (
+            models.SystemSettingRevision.filter(revision__gt=SystemSettingCache._revision)
+            .exclude(key=SystemSettingCache.GLOBAL_KEY)
+            .values_list("key", flat=True)
+        )
+        invalidations = [key for key in changed_keys if CacheInvalidations.is_invalidation(key)]
+        changed_keys = [key for key in changed_keys if key not in invalidations]
+        values = dict(
+            await models.SystemSetting.filter(key__in=changed_keys).values_list("key", "value")
+        )
+        for key in changed_keys:
+            # a missing value means the setting was removed
+            SystemSettingCache.store(key, values.get(key))
+        for key in invalidations:
+            try:
+                CacheInvalidations.apply(key)
+            except Exception:
+                logger.exception("cache invalidation failed::key='%s'", key)
+        for key in changed_keys:
+            for listener in SystemSettingCache._listeners.get(key, ()):
+                try:
+                    await listener(values.get(key))
+                except Exception:
+                    logger.exception("system setting listener failed::key='%s'", key)
+
+        SystemSettingCache._revision = revision
+        if changed_keys or invalidations:
+            get_public_snapshot().invalidate(notify_workers=False)
+
+
+async def broadcast_cache_invalidations():
+    """
+    Send the cache invalidations collected in the current context to other processes,
+    must be run once the changes that caused them are committed
+    """
+    if not (keys := CacheInvalidations.pop()):
+        return
+    try:
+        async with SystemSettingCache.write_lock, in_transaction():
+            revision = await SystemSettingCache.mark_changed(*sorted(keys))
+    except Exception:
+        logger.exception("unable to send cache invalidations::keys='%s'", ",".join(keys))
+        return
+    SystemSettingCache.mark_seen(revision)
 
 
 async def get_system_setting(
@@ -22,30 +190,90 @@ async def get_system_setting(
         :param skip_cache: Whether the skip cache and load from db directly, defaults to False
         :return: The loaded value or None
     """
-    value = None
-
     if not skip_cache:
         value = current_app.config.get(key)
+        if value is not None or SystemSettingCache.is_known_missing(key):
+            return value if value is not None else default
 
-    if value is None:
-        setting_row = await models.SystemSetting.get_or_none(key=key)
-        if setting_row is not None:
-            value = setting_row.value
-            # update cache for next time
-            current_app.config[key] = value
+    setting_row = await models.SystemSetting.get_or_none(key=key)
+    value = setting_row.value if setting_row is not None else None
+    # update cache for next time
+    SystemSettingCache.store(key, value)
 
     return value if value is not None else default
 
 
+def system_setting_prefix_filter(prefix: str, /) -> Q:
+    """
+    Filter system settings on keys starting with a prefix,
+    given as a range of the primary key so it is an index lookup (unlike LIKE)
+
+        :param prefix: The key prefix
+    """
+    # NOTE keys are ascii, so the range ends before any key sorting after the prefix's keys
+    return Q(key__gte=prefix, key__lt=f"{prefix}\uffff")
+
+
+async def preload_system_settings(prefix: str | None = None, /):
+    """
+    Load system settings into cache using a single query,
+    any setting not loaded will then be known to not be set
+
+        :param prefix: Only load settings with keys starting with this, defaults to all settings
+    """
+    query = models.SystemSetting.all()
+    if prefix:
+        query = query.filter(system_setting_prefix_filter(prefix))
+    for key, value in await query.values_list("key", "value"):
+        SystemSettingCache.store(key, value)
+    SystemSettingCache.mark_prefix_loaded(prefix or "")
+
+
 async def set_system_setting(key: str, value: Any, /):
     """
-    Set a system setting stored in db and updates cache
+    Set a system setting stored in db and updates cache,
+    other processes will pick up the change on their next sync
 
         :param key: The setting's key
         :param value: Value to update setting to
     """
-    await models.SystemSetting.update_or_create(key=key, defaults={"value": value})
-    current_app.config[key] = value
+    async with SystemSettingCache.write_lock, in_transaction():
+        await models.SystemSetting.update_or_create(key=key, defaults={"value": value})
+        revision = await SystemSettingCache.mark_changed(key)
+    SystemSettingCache.store(key, value)
+    SystemSettingCache.mark_seen(revision)
+    # NOTE other processes drop theirs when syncing the setting
+    get_public_snapshot().invalidate(notify_workers=False)
+
+
+async def update_system_setting(
+    key: str, update: Callable[[Any], Any], /, *, default: Any = None
+) -> Any:
+    """
+    Set a system setting based on its current value stored in db,
+    without losing changes made at the same time by this or other processes
+
+        :param key: The setting's key
+        :param update: Given the current value, returns the new value
+        :param default: Current value given when the setting is not set, defaults to None
+        :return: The new value
+    """
+    # NOTE the row must exist for other processes to wait on its lock
+    await models.SystemSetting.get_or_create(key=key, defaults={"value": default})
+    async with SystemSettingCache.write_lock, in_transaction():
+        current = (
+            await models.SystemSetting.select_for_update()
+            .get(key=key)
+            .values_list("value", flat=True)
+        )
+        value = update(current)
+        await models.SystemSetting.filter(key=key).update(value=value)
+        revision = await SystemSettingCache.mark_changed(key)
+    SystemSettingCache.store(key, value)
+    SystemSettingCache.mark_seen(revision)
+    # NOTE other processes drop theirs when syncing the setting
+    get_public_snapshot().invalidate(notify_workers=False)
+    return value
 
 
 async def remove_system_setting(key: str, /):
@@ -54,8 +282,13 @@ async def remove_system_setting(key: str, /):
 
         :param key: The setting's key
     """
-    await models.SystemSetting.filter(key=key).delete()
-    current_app.config.pop(key, None)
+    async with SystemSettingCache.write_lock, in_transaction():
+        await models.SystemSetting.filter(key=key).delete()
+        revision = await SystemSettingCache.mark_changed(key)
+    SystemSettingCache.store(key, None)
+    SystemSettingCache.mark_seen(revision)
+    # NOTE other processes drop theirs when syncing the setting
+    get_public_snapshot().invalidate(notify_workers=False)
 
 
 def redirect_using_back_to(func: Callable) -> Callable:
@@ -2,22 +2,38 @@
 Module to assist plugin functionalities
 """
 
+import importlib
 import importlib.util
 import logging
 import sys
-from collections.abc import Awaitable, Callable, Collection, Generator, Iterable
-from dataclasses import dataclass
+import tomllib
+from collections.abc import AsyncGenerator, Awaitable, Callable, Collection, Generator, Iterable
+from copy import deepcopy
+from dataclasses import dataclass, field
 from pathlib import Path
 from types import ModuleType
 from typing import Any, ClassVar
 
 from packaging.specifiers import InvalidSpecifier, SpecifierSet
-from quart import Blueprint
+from pydantic import BaseModel, ValidationError
+from quart import Blueprint, current_app, has_request_context, render_template
+from tortoise.exceptions import IntegrityError
+from tortoise.transactions import atomic
 
 from ..database import models as app_models
+from ..database.migrations import Migration
+from .cache import get_plugin_cache, get_widget_render_cache
 from .config import get_settings
-from .constants import RESTRICTED_PLUGIN_NAMES
-from .helpers import get_system_setting, remove_system_setting, set_system_setting
+from .constants import RESTRICTED_PLUGIN_NAMES, SystemSettingKeys
+from .helpers import (
+    SystemSettingCache,
+    get_system_setting,
+    remove_system_setting,
+    set_system_setting,
+    update_system_setting,
+)
+from .scheduler import ScheduledJob, get_job_scheduler
+from .supervisor import PluginCircuitOpenException, get_plugin_supervisor
 
 logger = logging.getLogger("web-portal")
 
@@ -38,6 +54,29 @@ class PluginRestrictedNameException(PluginException):
     pass
 
 
+class PluginManifestException(PluginException):
+    pass
+
+
+def is_supported_version(version_specifier: str, app_version: str) -> bool:
+    """
+    Check whether a plugin's version requirement matches the given app version
+
+        :param version_specifier: The version requirement, given as a PEP 440 specifier
+        :param app_version: The app version, given as a semantic version number
+        :raises PluginVersionException: When the version specifier is invalid
+        :return: Whether it is supported
+    """
+    try:
+        ver_specifier = SpecifierSet(version_specifier)
+    except InvalidSpecifier:
+        raise PluginVersionException(
+            "unexpected version specifier, please use format from PEP 440 e.g. '== 2'"
+        ) from None
+    else:
+        return app_version in ver_specifier
+
+
 @dataclass
 class WidgetDetails:
     """
@@ -51,11 +90,56 @@ class WidgetDetails:
     config: Any | None
 
 
+@dataclass
+class WidgetContext(WidgetDetails):
+    """
+    Used for storing information about a widget and its owner,
+    returned by get_widget_context()
+    """
+
+    widget_id: int
+    owner_id: int
+    # config as loaded or last saved, so unchanged configs are not written
+    saved_config: Any | None = field(init=False, repr=False)
+
+    def __post_init__(self):
+        self.saved_config = deepcopy(self.config)
+
+
+@dataclass
+class PlacedWidget:
+    """
+    A widget placed on a dashboard,
+    given to a plugin's get_prefetched_widget_data()
+    """
+
+    internal_name: str
+    widget_id: int
+    config: Any | None
+
+
 @dataclass
 class PluginMeta:
     """
     Class used when creating a plugin,
     stores all information about a plugin and what it supports.
+
+    When get_prefetched_widget_data is given, it is called once with all of the plugin's
+    widgets that are about to be rendered, returning data for each widget by id.
+    get_rendered_widget is then given the widget's data as a fourth argument
+    (None if no data was returned for the widget).
+
+    The output of get_injected_head is rendered once at app launch and reused for every page,
+    set is_injected_head_dynamic when it must be rendered for each page instead.
+
+    Jobs given in scheduled_jobs are run in the background once the app has launched.
+
+    Changes to the tables of db_models must be given as db_migrations,
+    pending migrations are run at app launch (tables of new models are created without one).
+
+    Hook calls taking longer than latency_budget seconds count as failed,
+    too many failures will stop the plugin's hooks being called for a while.
+    Defaults to the app's PLUGIN_LATENCY_BUDGET.
     """
 
     version_specifier: str
@@ -64,11 +148,20 @@ class PluginMeta:
     db_models: Collection[str | ModuleType]
     blueprints: Collection[Blueprint]
     index_route_url: str
-    get_rendered_widget: Callable[[str, int, dict | None], Awaitable[str]] | None = None
+    get_rendered_widget: Callable[..., Awaitable[str]] | None = None
     get_rendered_widget_edit: Callable[[str, int, dict | None, str], Awaitable[str]] | None = None
     get_settings: Callable[[], dict] | None = None
     get_injected_head: Callable[[], Awaitable[str]] | None = None
+    is_injected_head_dynamic: bool = False
     do_demo_setup: Callable[[], Awaitable] | None = None
+    uncached_widgets: Collection[str] = ()
+    lazy_widgets: Collection[str] = ()
+    get_prefetched_widget_data: (
+        Callable[[Collection[PlacedWidget]], Awaitable[dict[int, Any]]] | None
+    ) = None
+    latency_budget: float | None = None
+    scheduled_jobs: Collection[ScheduledJob] = ()
+    db_migrations: Collection[Migration] = ()
 
     def is_supported_version(self, app_version: str) -> bool:
         """
@@ -77,20 +170,232 @@ class PluginMeta:
             :param app_version: The app version, given as a semantic version number
             :return: Whether it is supported
         """
-        try:
-            ver_specifier = SpecifierSet(self.version_specifier)
-        except InvalidSpecifier:
-            raise PluginVersionException(
-                "unexpected version specifier, " "please use format from PEP 440 e.g. '== 2'"
-            ) from None
-        else:
-            return app_version in ver_specifier
+        return is_supported_version(self.version_specifier, app_version)
+
+
+class PluginManifestBlueprint(BaseModel):
+    # import path of the blueprint, e.g. "views:blueprint"
+    target: str
+    url_prefix: str | None = None
+
+
+class PluginManifestScheduledJob(BaseModel):
+    name: str
+    # import path of the job's function, e.g. "helpers:refresh_data"
+    target: str
+    interval: float | None = None
+    # name of a plugin setting giving the interval, used instead of interval
+    interval_setting: str | None = None
+    delay: float = 0
+    jitter: float = 0
+    single_worker: bool = True
+
+
+class PluginManifest(BaseModel):
+    """
+    A plugin's declared details, loaded from its 'plugin.toml'.
+    Allows a plugin to be registered without importing its widget code,
+    the meta module is only imported once the plugin's PluginMeta is first needed.
+    Import paths are relative to the plugin package.
+    """
+
+    version_specifier: str
+    human_name: str
+    widgets: dict[str, str]
+    index_route_url: str
+    # module providing PLUGIN_META
+    meta_module: str
+    db_models: list[str] = []
+    blueprints: list[PluginManifestBlueprint] = []
+    # import path of a function returning the plugin settings, e.g. "helpers:get_settings"
+    settings: str | None = None
+    # rendered in place of get_injected_head
+    injected_head_template: str | None = None
+    latency_budget: float | None = None
+    # started at launch without importing the meta module
+    scheduled_jobs: list[PluginManifestScheduledJob] = []
+    # whether the meta module must be imported at launch to start its scheduled jobs
+    has_scheduled_jobs: bool = False
+    # import path of the plugin's database migrations, e.g. "migrations:MIGRATIONS"
+    db_migrations: str | None = None
 
 
-@dataclass
 class LoadedPlugin:
-    internal_name: str
-    meta: PluginMeta
+    """
+    A loaded plugin, when loaded from a manifest
+    the plugin's meta module is imported on first access of meta
+    """
+
+    def __init__(
+        self,
+        internal_name: str,
+        meta: PluginMeta | None = None,
+        manifest: PluginManifest | None = None,
+    ) -> None:
+        if meta is None and manifest is None:
+            raise ValueError("either meta or manifest must be given")
+        self.internal_name = internal_name
+        self.manifest = manifest
+        self._meta = meta
+
+    def _import(self, path: str) -> Any:
+        module_name, _, attribute = path.partition(":")
+        module = importlib.import_module(f"{self.internal_name}.{module_name}")
+        return getattr(module, attribute) if attribute else module
+
+    @property
+    def is_meta_loaded(self) -> bool:
+        return self._meta is not None
+
+    @property
+    def meta(self) -> PluginMeta:
+        """
+        The plugin's meta, importing it if not yet loaded
+
+            :raises PluginException: When the meta module could not be imported
+        """
+        if self._meta is None:
+            manifest: PluginManifest = self.manifest  # type: ignore
+            logger.debug("importing plugin meta::plugin_name='%s'", self.internal_name)
+            try:
+                meta: PluginMeta = self._import(manifest.meta_module).PLUGIN_META
+            except Exception as err:
+                # NOTE any error raised by the plugin's code makes it unavailable
+                logger.exception(
+                    "unable to import plugin meta::plugin_name='%s'", self.internal_name
+                )
+                raise PluginException(
+                    f"plugin '{self.internal_name}' meta could not be imported"
+                ) from err
+            if meta.widgets.keys() != manifest.widgets.keys():
+                logger.error(
+                    "plugin meta widgets do not match manifest::plugin_name='%s'",
+                    self.internal_name,
+                )
+            self._meta = meta
+        return self._meta
+
+    @property
+    def human_name(self) -> str:
+        return self.manifest.human_name if self.manifest else self.meta.human_name
+
+    @property
+    def widgets(self) -> dict[str, str]:
+        return self.manifest.widgets if self.manifest else self.meta.widgets
+
+    @property
+    def index_route_url(self) -> str:
+        return self.manifest.index_route_url if self.manifest else self.meta.index_route_url
+
+    @property
+    def latency_budget(self) -> float | None:
+        return self.manifest.latency_budget if self.manifest else self.meta.latency_budget
+
+    @property
+    def scheduled_jobs(self) -> Collection[ScheduledJob]:
+        """
+        The plugin's scheduled jobs, only importing the meta module
+        when the manifest says it has scheduled jobs
+
+            :raises PluginException: When a job or the meta module could not be imported
+        """
+        if self.manifest is None:
+            return self.meta.scheduled_jobs
+        jobs = [self._get_manifest_job(entry) for entry in self.manifest.scheduled_jobs]
+        if self.manifest.has_scheduled_jobs:
+            jobs.extend(self.meta.scheduled_jobs)
+        return jobs
+
+    def _get_manifest_job(self, entry: PluginManifestScheduledJob) -> ScheduledJob:
+        try:
+            func = self._import(entry.target)
+            interval = entry.interval
+            if entry.interval_setting is not None:
+                interval = getattr(self.get_settings(), entry.interval_setting)
+        except Exception as err:
+            logger.exception(
+                "unable to load plugin scheduled job::plugin_name='%s', job_name='%s'",
+                self.internal_name,
+                entry.name,
+            )
+            raise PluginException(
+                f"plugin '{self.internal_name}' scheduled job '{entry.name}' could not be loaded"
+            ) from err
+        return ScheduledJob(
+            entry.name,
+            func,
+            interval,
+            delay=entry.delay,
+            jitter=entry.jitter,
+            single_worker=entry.single_worker,
+        )
+
+    def get_blueprints(self) -> list[tuple[Blueprint, str | None]]:
+        """
+        Get the plugin's blueprints and their url prefix (relative to the plugin's prefix)
+        """
+        if self.manifest is None:
+            return [(blueprint, blueprint.url_prefix) for blueprint in self.meta.blueprints]
+        blueprints = []
+        for entry in self.manifest.blueprints:
+            blueprint: Blueprint = self._import(entry.target)
+            blueprints.append((blueprint, entry.url_prefix or blueprint.url_prefix))
+        return blueprints
+
+    def get_registered_module_names(self) -> set[str]:
+        """
+        Get the names of modules containing blueprints and database models,
+        these are registered with the app at launch so cannot be reloaded
+        """
+        if self.manifest is None:
+            names = {blueprint.import_name for blueprint in self.meta.blueprints}
+            for db_model in self.meta.db_models:
+                names.add(db_model.__name__ if isinstance(db_model, ModuleType) else db_model)
+            return names
+        names = {
+            f"{self.internal_name}.{entry.target.partition(':')[0]}"
+            for entry in self.manifest.blueprints
+        }
+        names.update(
+            f"{self.internal_name}.{module_name}" for module_name in self.manifest.db_models
+        )
+        if self.manifest.settings:
+            names.add(f"{self.internal_name}.{self.manifest.settings.partition(':')[0]}")
+        if self.manifest.db_migrations:
+            names.add(f"{self.internal_name}.{self.manifest.db_migrations.partition(':')[0]}")
+        return names
+
+    def get_db_models(self) -> Collection[str | ModuleType]:
+        if self.manifest is None:
+            return self.meta.db_models
+        return [f"{self.internal_name}.{module_name}" for module_name in self.manifest.db_models]
+
+    def get_db_migrations(self) -> Collection[Migration]:
+        if self.manifest is None:
+            return self.meta.db_migrations
+        if self.manifest.db_migrations is None:
+            return ()
+        return self._import(self.manifest.db_migrations)
+
+    def get_settings(self) -> Any | None:
+        if self.manifest is None:
+            return self.meta.get_settings() if self.meta.get_settings else None
+        if self.manifest.settings is None:
+            return None
+        return self._import(self.manifest.settings)()
+
+    async def get_injected_head(self) -> str | None:
+        if self.manifest is not None:
+            if self.manifest.injected_head_template is None:
+                return None
+            return await render_template(self.manifest.injected_head_template)
+        if self.meta.get_injected_head is None:
+            return None
+        return await self.meta.get_injected_head()
+
+    @property
+    def is_injected_head_dynamic(self) -> bool:
+        return self.manifest is None and self.meta.is_injected_head_dynamic
 
 
 class PluginHandler:
@@ -99,6 +404,8 @@ class PluginHandler:
     """
 
     _loaded_plugins: ClassVar[dict[str, LoadedPlugin]] = {}
+    # number of times each plugin has been reloaded across all processes
+    _reload_revisions: ClassVar[dict[str, int]] = {}
 
     @staticmethod
     def get_plugins_path() -> Path:
@@ -112,16 +419,45 @@ class PluginHandler:
                 logger.debug("found possible plugin::name='%s'", name)
                 yield name
 
+    @staticmethod
+    def load_manifest(path: Path) -> PluginManifest:
+        """
+        Load and validate a plugin manifest
+
+            :param path: The path to the 'plugin.toml'
+            :raises PluginManifestException: When the manifest is invalid
+            :return: The manifest
+        """
+        try:
+            with path.open("rb") as fo:
+                return PluginManifest.model_validate(tomllib.load(fo))
+        except (tomllib.TOMLDecodeError, ValidationError) as err:
+            raise PluginManifestException(f"invalid manifest: {err}") from None
+
     @staticmethod
     def load_plugin(name: str, app_version: str) -> LoadedPlugin:
-        spec = importlib.util.spec_from_file_location(
-            name, PluginHandler.get_plugins_path() / name / "__init__.py"
-        )
+        plugin_path = PluginHandler.get_plugins_path() / name
+        spec = importlib.util.spec_from_file_location(name, plugin_path / "__init__.py")
         if not spec:
             raise PluginException(f"plugin '{name}' could not be found")
+
+        manifest = None
+        if (manifest_path := plugin_path / "plugin.toml").is_file():
+            manifest = PluginHandler.load_manifest(manifest_path)
+            # ensure version requested matches app version, before running any plugin code
+            if not is_supported_version(manifest.version_specifier, app_version):
+                raise PluginVersionException(
+                    f"running web-portal=={app_version}, "
+                    f"but plugin is wanting web-portal{manifest.version_specifier.strip()}"
+                )
+
         imported_module = importlib.util.module_from_spec(spec)
         sys.modules[spec.name] = imported_module
         spec.loader.exec_module(imported_module)  # type: ignore
+
+        if manifest is not None:
+            return LoadedPlugin(internal_name=name, manifest=manifest)
+
         plugin_meta: PluginMeta = imported_module.PLUGIN_META
 
         # ensure version requested matches app version
@@ -136,6 +472,58 @@ class PluginHandler:
             meta=plugin_meta,
         )
 
+    @staticmethod
+    def reload_plugin(name: str, app_version: str) -> LoadedPlugin:
+        """
+        Import a loaded plugin again, replacing the loaded plugin once imported.
+        Modules containing blueprints and database models are kept,
+        as they are registered with the app at launch.
+
+            :param name: The plugin's internal name
+            :param app_version: The app version, given as a semantic version number
+            :raises PluginException: When the plugin is not loaded or could not be imported
+            :return: The new loaded plugin
+        """
+        old_plugin = PluginHandler._loaded_plugins.get(name)
+        if old_plugin is None:
+            raise PluginException(f"plugin '{name}' is not loaded, adding plugins needs a restart")
+
+        def is_reloadable(module_name: str) -> bool:
+            return (module_name == name or module_name.startswith(f"{name}.")) and (
+                module_name not in kept_modules
+            )
+
+        kept_modules = old_plugin.get_registered_module_names()
+        old_modules = {
+            module_name: module
+            for module_name, module in sys.modules.items()
+            if is_reloadable(module_name)
+        }
+        for module_name in old_modules:
+            del sys.modules[module_name]
+
+        try:
+            new_plugin = PluginHandler.load_plugin(name, app_version)
+            # import now, so errors are found before the old plugin is replaced
+            new_plugin.meta  # noqa: B018
+        except Exception as err:
+            for module_name in [
+                module_name for module_name in sys.modules if is_reloadable(module_name)
+            ]:
+                del sys.modules[module_name]
+            sys.modules.update(old_modules)
+            raise PluginException(f"plugin '{name}' could not be reloaded: {err}") from err
+
+        if new_plugin.get_registered_module_names() != kept_modules:
+            logger.warning(
+                "plugin blueprints or database models changed, these need a restart::plugin_name='%s'",
+                name,
+            )
+
+        PluginHandler._loaded_plugins[name] = new_plugin
+        logger.info("reloaded plugin::plugin_name='%s'", name)
+        return new_plugin
+
     @staticmethod
     def validate_plugin_name(name: str) -> None:
         """
@@ -187,6 +575,12 @@ class PluginHandler:
                     name,
                     err.args[0],
                 )
+            except PluginManifestException as err:
+                logger.exception(
+                    "unable to load plugin, manifest invalid::plugin_name='%s', err='%s'",
+                    name,
+                    err.args[0],
+                )
 
     @staticmethod
     def loaded_plugins() -> dict[str, LoadedPlugin]:
@@ -214,6 +608,71 @@ class PluginHandler:
         return PluginHandler._loaded_plugins.keys()
 
 
+class InjectedHeadHandler:
+    """
+    static class for storing the rendered head injects of loaded plugins
+    """
+
+    # rendered static injects (combined when next to each other) and plugins with dynamic injects
+    _parts: ClassVar[list[str | LoadedPlugin] | None] = None
+
+    @staticmethod
+    async def _render_parts() -> list[str | LoadedPlugin]:
+        parts: list[str | LoadedPlugin] = []
+        for plugin in PluginHandler.get_loaded_plugin_values():
+            if plugin.is_injected_head_dynamic:
+                parts.append(plugin)
+                continue
+            try:
+                rendered = await get_plugin_supervisor().call(plugin, plugin.get_injected_head)
+            except Exception:
+                logger.exception(
+                    "unable to render injected head::plugin_name='%s'", plugin.internal_name
+                )
+                continue
+            if rendered is None:
+                continue
+            if parts and isinstance(parts[-1], str):
+                parts[-1] += rendered
+            else:
+                parts.append(rendered)
+        return parts
+
+    @staticmethod
+    async def rebuild():
+        """
+        Render the head injects of all loaded plugins and store them,
+        must be run inside the app context
+        """
+        if has_request_context():
+            InjectedHeadHandler._parts = await InjectedHeadHandler._render_parts()
+            return
+        # templates need a request to build urls
+        async with current_app.test_request_context("/"):
+            InjectedHeadHandler._parts = await InjectedHeadHandler._render_parts()
+
+    @staticmethod
+    async def get_injects() -> AsyncGenerator[str, None]:
+        """
+        Get the head injects of all loaded plugins,
+        rendering only the dynamic injects
+        """
+        if InjectedHeadHandler._parts is None:
+            await InjectedHeadHandler.rebuild()
+        for part in InjectedHeadHandler._parts:  # type: ignore
+            if isinstance(part, str):
+                yield part
+                continue
+            try:
+                yield await get_plugin_supervisor().call(part, part.get_injected_head) or ""
+            except PluginCircuitOpenException:
+                continue
+            except Exception:
+                logger.exception(
+                    "unable to render injected head::plugin_name='%s'", part.internal_name
+                )
+
+
 def make_combined_widget_name(plugin_name: str, widget_name: str) -> str:
     return f"{plugin_name}__{widget_name}"
 
@@ -239,7 +698,7 @@ async def get_plugin_system_setting(
         :return: The loaded value or None
     """
     full_key = make_system_setting_plugin_key(plugin_name, key)
-    return get_system_setting(full_key, default=default, skip_cache=skip_cache)
+    return await get_system_setting(full_key, default=default, skip_cache=skip_cache)
 
 
 async def set_plugin_system_setting(plugin_name: str, key: str, value: Any, /):
@@ -272,8 +731,9 @@ async def get_widget_owner_id(widget_id: int, /) -> int:
         :param widget_id: The widgets id
         :return: The owner id
     """
-    widget = await app_models.DashboardWidget.get(id=widget_id).prefetch_related("dashboard")
-    return widget.dashboard.owner_id
+    return await app_models.DashboardWidget.get(id=widget_id).values_list(
+        "dashboard__owner_id", flat=True
+    )  # type: ignore
 
 
 async def get_widget_details(widget_id: int, /) -> WidgetDetails:
@@ -283,15 +743,37 @@ async def get_widget_details(widget_id: int, /) -> WidgetDetails:
         :param widget_id: The widgets id
         :return: The details
     """
-    widget = await app_models.DashboardWidget.get(id=widget_id).prefetch_related(
-        "widget",
-        "widget__plugin",
-    )
+    context = await get_widget_context(widget_id)
     return WidgetDetails(
-        widget.name,
-        deconstruct_widget_name(widget.widget.plugin.internal_name, widget.widget.internal_name),
-        widget.widget.plugin.internal_name,
-        widget.config,
+        context.human_name,
+        context.internal_name,
+        context.plugin_name,
+        context.config,
+    )
+
+
+async def get_widget_context(widget_id: int, /) -> WidgetContext:
+    """
+    Get a widgets details and owner, loaded in one query
+
+        :param widget_id: The widgets id
+        :raises DoesNotExist: When the widget does not exist
+        :return: The widget context
+    """
+    row = await app_models.DashboardWidget.get(id=widget_id).values(
+        "name",
+        "config",
+        owner_id="dashboard__owner_id",
+        widget_name="widget__internal_name",
+        plugin_name="widget__plugin__internal_name",
+    )
+    return WidgetContext(
+        row["name"],
+        deconstruct_widget_name(row["plugin_name"], row["widget_name"]),
+        row["plugin_name"],
+        row["config"],
+        widget_id,
+        row["owner_id"],
     )
 
 
@@ -302,9 +784,58 @@ async def set_widget_config(widget_id: int, config: Any | None, /):
         :param widget_id: The widgets id
         :param config: The config to update to
     """
-    widget = await app_models.DashboardWidget.get(id=widget_id)
-    widget.config = config
-    await widget.save()
+    await app_models.DashboardWidget.filter(id=widget_id).update(config=config)
+    invalidate_widget_cache(widget_id)
+
+
+async def update_widget_config(context: WidgetContext, config: Any | None, /) -> bool:
+    """
+    Set a widgets config, only writing when it differs
+    from the config loaded with the context.
+    Changes made elsewhere since the context was loaded are not checked for,
+    so they are overwritten when written (or kept when unchanged here).
+
+        :param context: The widget context, from get_widget_context()
+        :param config: The config to update to (can be the context's config changed in place)
+        :return: Whether the config was written
+    """
+    context.config = config
+    if config == context.saved_config:
+        return False
+    await set_widget_config(context.widget_id, config)
+    context.saved_config = deepcopy(config)
+    return True
+
+
+def invalidate_widget_cache(widget_id: int, /):
+    """
+    Remove a widget's rendered content from cache,
+    use when data the widget renders has changed (not needed after set_widget_config),
+    other processes remove it once the current request (or scheduled job) has finished
+
+        :param widget_id: The widgets id
+    """
+    get_widget_render_cache().invalidate_widget(widget_id)
+
+
+def invalidate_plugin_widget_cache(plugin_name: str, widget_name: str | None = None, /):
+    """
+    Remove rendered content from cache for all placed widgets of a plugin,
+    use when shared data rendered by many widgets has changed,
+    other processes remove it once the current request (or scheduled job) has finished
+
+        :param plugin_name: The plugin's internal name
+        :param widget_name: Only remove widgets with this internal name, defaults to all widgets
+    """
+    get_widget_render_cache().invalidate_plugin(plugin_name, widget_name)
+
+
+async def rebuild_injected_head():
+    """
+    Render the head injects of all loaded plugins again,
+    use when what a plugin's static head inject renders has changed
+    """
+    await InjectedHeadHandler.rebuild()
 
 
 def get_plugin_data_path(plugin_name: str) -> Path:
@@ -322,19 +853,167 @@ def get_plugin_data_path(plugin_name: str) -> Path:
     return data_path
 
 
-async def register_loaded_plugins():
+@dataclass
+class PluginRegistrationReport:
+    """
+    What was changed in the database when registering loaded plugins
+    """
+
+    created_plugins: list[str] = field(default_factory=list)
+    created_widgets: list[str] = field(default_factory=list)
+    # widgets that were registered under a different plugin
+    moved_widgets: list[str] = field(default_factory=list)
+
+    @property
+    def has_changes(self) -> bool:
+        return bool(self.created_plugins or self.created_widgets or self.moved_widgets)
+
+
+@atomic()
+async def _sync_loaded_plugins() -> PluginRegistrationReport:
+    report = PluginRegistrationReport()
+    loaded_plugins = PluginHandler.loaded_plugins()
+
+    plugin_ids: dict[str, int] = dict(
+        await app_models.Plugin.all().values_list("internal_name", "id")
+    )
+    report.created_plugins = [name for name in loaded_plugins if name not in plugin_ids]
+    if report.created_plugins:
+        await app_models.Plugin.bulk_create(
+            app_models.Plugin(internal_name=name) for name in report.created_plugins
+        )
+        # not all databases return created ids
+        plugin_ids.update(
+            await app_models.Plugin.filter(internal_name__in=report.created_plugins).values_list(
+                "internal_name", "id"
+            )
+        )
+
+    existing_widgets: dict[str, tuple[int, int]] = {
+        name: (widget_id, plugin_id)
+        for widget_id, name, plugin_id in await app_models.Widget.all().values_list(
+            "id", "internal_name", "plugin_id"
+        )
+    }
+    to_create = []
+    to_move = []
+    for plugin in loaded_plugins.values():
+        plugin_id = plugin_ids[plugin.internal_name]
+        for widget_name in plugin.widgets:
+            name = make_combined_widget_name(plugin.internal_name, widget_name)
+            if (existing := existing_widgets.get(name)) is None:
+                to_create.append(app_models.Widget(internal_name=name, plugin_id=plugin_id))
+            elif existing[1] != plugin_id:
+                to_move.append(
+                    app_models.Widget(id=existing[0], internal_name=name, plugin_id=plugin_id)
+                )
+
+    if to_create:
+        await app_models.Widget.bulk_create(to_create)
+    if to_move:
+        await app_models.Widget.bulk_update(to_move, fields=("plugin_id",))
+    report.created_widgets = [widget.internal_name for widget in to_create]
+    report.moved_widgets = [widget.internal_name for widget in to_move]
+
+    return report
+
+
+async def register_loaded_plugins() -> PluginRegistrationReport:
     """
     Register loaded plugins in the database,
     can be safely run at every app launch.
+    Reads the registered plugins and widgets once,
+    creating any that are missing in bulk within a single transaction.
+
+        :return: What was changed
+    """
+    try:
+        return await _sync_loaded_plugins()
+    except IntegrityError:
+        # another worker registered the same plugins at the same time, its changes are now visible
+        logger.debug("plugins registered concurrently, retrying registration")
+        return await _sync_loaded_plugins()
+
+
+def _clear_plugin_template_cache(plugin_name: str):
+    cache = current_app.jinja_env.cache
+    if cache is None:
+        return
+    # plugin templates are stored under a folder named after the plugin
+    for key in [key for key in cache if key[1].startswith(f"{plugin_name}/")]:
+        del cache[key]
+
+
+async def reload_plugin(plugin_name: str, /, *, notify_workers: bool = True) -> LoadedPlugin:
     """
-    for plugin in PluginHandler.loaded_plugins().values():
-        plugin_model, _ = await app_models.Plugin.update_or_create(
-            internal_name=plugin.internal_name
+    Reload a plugin's code without restarting the app,
+    flushing caches of the plugin's rendered widgets and templates.
+    Changes to blueprints and database models still need a restart.
+    Must be run inside the app context.
+
+        :param plugin_name: The plugin's internal name
+        :param notify_workers: Whether other processes should also reload, defaults to True
+        :raises PluginException: When the plugin is not loaded or could not be imported
+        :return: The new loaded plugin
+    """
+    plugin = PluginHandler.reload_plugin(plugin_name, current_app.config["__VERSION__"])
+
+    if (plugin_settings := plugin.get_settings()) is not None:
+        current_app.config[f"plugin__{plugin_name}"] = plugin_settings
+    await register_loaded_plugins()
+    invalidate_plugin_widget_cache(plugin_name)
+    _clear_plugin_template_cache(plugin_name)
+    # give the new code a fresh start
+    get_plugin_supervisor().reset(plugin_name)
+    get_plugin_cache(plugin_name).clear()
+    await get_job_scheduler().stop_plugin_jobs(plugin_name)
+    get_job_scheduler().start_plugin_jobs(plugin_name, plugin.scheduled_jobs)
+    await InjectedHeadHandler.rebuild()
+
+    if notify_workers:
+        revisions = await update_system_setting(
+            SystemSettingKeys.PLUGIN_RELOADS,
+            lambda revisions: revisions | {plugin_name: revisions.get(plugin_name, 0) + 1},
+            default={},
         )
+        PluginHandler._reload_revisions[plugin_name] = revisions[plugin_name]
 
-        for widget_name in plugin.meta.widgets:
-            name = make_combined_widget_name(plugin.internal_name, widget_name)
-            await app_models.Widget.update_or_create(
-                internal_name=name,
-                defaults={"plugin": plugin_model},
-            )
+    return plugin
+
+
+async def _on_plugin_reloads_changed(revisions: dict[str, int] | None):
+    for plugin_name, revision in (revisions or {}).items():
+        if revision <= PluginHandler._reload_revisions.get(plugin_name, 0):
+            continue
+        PluginHandler._reload_revisions[plugin_name] = revision
+        if plugin_name not in PluginHandler.loaded_plugins():
+            continue
+        try:
+            await reload_plugin(plugin_name, notify_workers=False)
+        except PluginException:
+            logger.exception("unable to reload plugin::plugin_name='%s'", plugin_name)
+
+
+async def watch_plugin_reloads():
+    """
+    Reload plugins when they are reloaded by another process,
+    must be run at app launch after system settings have been loaded
+    """
+    PluginHandler._reload_revisions = dict(
+        await get_system_setting(SystemSettingKeys.PLUGIN_RELOADS, default={})
+    )
+    SystemSettingCache.add_listener(SystemSettingKeys.PLUGIN_RELOADS, _on_plugin_reloads_changed)
+
+
+def start_scheduled_jobs():
+    """
+    Start the scheduled jobs of all loaded plugins,
+    must be run inside the app context
+    """
+    scheduler = get_job_scheduler()
+    for plugin in PluginHandler.get_loaded_plugin_values():
+        try:
+            jobs = plugin.scheduled_jobs
+        except PluginException:
+            continue
+        scheduler.start_plugin_jobs(plugin.internal_name, jobs)
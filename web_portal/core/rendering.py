@@ -0,0 +1,334 @@
+"""
+Module to assist with rendering dashboard widgets
+"""
+
+import asyncio
+import logging
+from collections.abc import AsyncIterator, Collection, Iterable
+from dataclasses import dataclass
+from enum import Enum
+from time import monotonic
+from typing import Any
+
+from ..database import models
+from .cache import get_widget_render_cache
+from .config import get_settings
+from .plugin import (
+    LoadedPlugin,
+    PlacedWidget,
+    PluginException,
+    PluginHandler,
+    deconstruct_widget_name,
+)
+from .supervisor import PluginCircuitOpenException, get_plugin_supervisor
+
+logger = logging.getLogger("web-portal")
+
+
+class WidgetRenderStatus(str, Enum):
+    OK = "ok"
+    FAILED = "failed"
+    TIMED_OUT = "timed-out"
+    DEFERRED = "deferred"
+    SUSPENDED = "suspended"
+
+
+@dataclass
+class RenderedWidget:
+    """
+    Result of rendering a placed dashboard widget
+    """
+
+    dashboard_widget: models.DashboardWidget
+    status: WidgetRenderStatus
+    content: str | None = None
+    is_cacheable: bool = False
+
+    @property
+    def is_ok(self) -> bool:
+        return self.status is WidgetRenderStatus.OK
+
+    @property
+    def is_failed(self) -> bool:
+        return self.status is WidgetRenderStatus.FAILED
+
+    @property
+    def is_timed_out(self) -> bool:
+        return self.status is WidgetRenderStatus.TIMED_OUT
+
+    @property
+    def is_deferred(self) -> bool:
+        return self.status is WidgetRenderStatus.DEFERRED
+
+    @property
+    def is_suspended(self) -> bool:
+        return self.status is WidgetRenderStatus.SUSPENDED
+
+
+def _get_widget_plugin(
+    dashboard_widget: models.DashboardWidget,
+) -> tuple[str, str, LoadedPlugin | None]:
+    widget: models.Widget = dashboard_widget.widget
+    plugin_name = widget.plugin.internal_name
+    widget_name = deconstruct_widget_name(plugin_name, widget.internal_name)
+    loaded_plugin = PluginHandler.get_loaded_plugin(plugin_name)
+    if loaded_plugin is not None and not loaded_plugin.is_meta_loaded:
+        try:
+            # plugins loaded from a manifest import their widget code on first render
+            loaded_plugin.meta  # noqa: B018
+        except PluginException:
+            return plugin_name, widget_name, None
+    return plugin_name, widget_name, loaded_plugin
+
+
+async def _get_prefetched_widget_data(
+    loaded_plugin: LoadedPlugin, widgets: Collection[PlacedWidget], timeout: float | None
+) -> dict[int, Any]:
+    try:
+        return await get_plugin_supervisor().call(
+            loaded_plugin,
+            loaded_plugin.meta.get_prefetched_widget_data,  # type: ignore
+            widgets,
+            timeout=timeout,
+        )
+    except PluginCircuitOpenException:
+        return {}
+    except Exception:
+        # widgets can still load their own data, so don't fail them
+        logger.exception(
+            "unable to prefetch widget data::plugin_name='%s'", loaded_plugin.internal_name
+        )
+        return {}
+
+
+def start_widget_prefetches(
+    dashboard_widgets: Iterable[models.DashboardWidget], /, *, timeout: float | None = None
+) -> dict[str, asyncio.Task[dict[int, Any]]]:
+    """
+    Start loading data for placed widgets in one batch per plugin,
+    for plugins that support it. Skips widgets that are cached or deferred.
+
+        :param dashboard_widgets: The placed widgets that will be rendered
+        :param timeout: Seconds each plugin has to load the data, defaults to None
+        :return: The running prefetch for each plugin, by plugin name
+    """
+    cache = get_widget_render_cache()
+    supervisor = get_plugin_supervisor()
+    to_prefetch: dict[str, tuple[LoadedPlugin, list[PlacedWidget]]] = {}
+
+    for dashboard_widget in dashboard_widgets:
+        plugin_name, widget_name, loaded_plugin = _get_widget_plugin(dashboard_widget)
+        if (
+            loaded_plugin is None
+            or loaded_plugin.meta.get_prefetched_widget_data is None
+            or widget_name in loaded_plugin.meta.lazy_widgets
+            or not supervisor.is_available(plugin_name)
+        ):
+            continue
+        if widget_name not in loaded_plugin.meta.uncached_widgets and cache.contains(
+            dashboard_widget.id, dashboard_widget.config
+        ):
+            continue
+        to_prefetch.setdefault(plugin_name, (loaded_plugin, []))[1].append(
+            PlacedWidget(widget_name, dashboard_widget.id, dashboard_widget.config)
+        )
+
+    return {
+        plugin_name: asyncio.create_task(
+            _get_prefetched_widget_data(loaded_plugin, widgets, timeout)
+        )
+        for plugin_name, (loaded_plugin, widgets) in to_prefetch.items()
+    }
+
+
+async def _get_rendered_widget(
+    loaded_plugin: LoadedPlugin,
+    widget_name: str,
+    dashboard_widget: models.DashboardWidget,
+    prefetch: asyncio.Future[dict[int, Any]] | None,
+    timeout: float | None,
+) -> str:
+    args: list[Any] = [widget_name, dashboard_widget.id, dashboard_widget.config]
+
+    if loaded_plugin.meta.get_prefetched_widget_data is not None:
+        started_at = monotonic()
+        if prefetch is not None:
+            # shared with other widgets, so a timeout here must not cancel it
+            prefetched = await asyncio.shield(prefetch)
+        else:
+            prefetched = await _get_prefetched_widget_data(
+                loaded_plugin,
+                (PlacedWidget(widget_name, dashboard_widget.id, dashboard_widget.config),),
+                timeout,
+            )
+        args.append(prefetched.get(dashboard_widget.id))
+        if timeout is not None:
+            # prefetching counts towards the widget's timeout
+            timeout = max(timeout - (monotonic() - started_at), 0)
+
+    return await get_plugin_supervisor().call(
+        loaded_plugin,
+        loaded_plugin.meta.get_rendered_widget,  # type: ignore
+        *args,
+        timeout=timeout,
+    )
+
+
+def _get_suspended_widget(
+    dashboard_widget: models.DashboardWidget,
+) -> RenderedWidget:
+    # show the last good render while the plugin is disabled, but never snapshot it
+    content = get_widget_render_cache().get_last_good(dashboard_widget.id, dashboard_widget.config)
+    if content is not None:
+        return RenderedWidget(dashboard_widget, WidgetRenderStatus.OK, content)
+    return RenderedWidget(dashboard_widget, WidgetRenderStatus.SUSPENDED)
+
+
+async def render_dashboard_widget(
+    dashboard_widget: models.DashboardWidget,
+    /,
+    *,
+    timeout: float | None = None,
+    defer_lazy: bool = False,
+    prefetch: asyncio.Future[dict[int, Any]] | None = None,
+) -> RenderedWidget:
+    """
+    Render a single placed dashboard widget using its plugin,
+    widget and plugin relations must be already fetched.
+    While the plugin is disabled by the supervisor the widget's
+    last good render is used, if there is one.
+
+        :param dashboard_widget: The placed widget to render
+        :param timeout: Seconds the plugin has to render before giving up, defaults to None
+        :param defer_lazy: Skip rendering widgets marked as lazy (unless cached),
+                           so the browser can load them later, defaults to False
+        :param prefetch: The plugin's running prefetch from start_widget_prefetches(),
+                         defaults to prefetching just this widget (if supported by the plugin)
+        :return: The render result
+    """
+    plugin_name, widget_name, loaded_plugin = _get_widget_plugin(dashboard_widget)
+
+    if loaded_plugin is None or loaded_plugin.meta.get_rendered_widget is None:
+        return RenderedWidget(dashboard_widget, WidgetRenderStatus.FAILED)
+
+    is_cacheable = widget_name not in loaded_plugin.meta.uncached_widgets
+    cache = get_widget_render_cache()
+
+    if (
+        is_cacheable
+        and (content := cache.get(dashboard_widget.id, dashboard_widget.config)) is not None
+    ):
+        return RenderedWidget(dashboard_widget, WidgetRenderStatus.OK, content, is_cacheable)
+
+    if not get_plugin_supervisor().is_available(plugin_name):
+        return _get_suspended_widget(dashboard_widget)
+
+    if defer_lazy and widget_name in loaded_plugin.meta.lazy_widgets:
+        return RenderedWidget(dashboard_widget, WidgetRenderStatus.DEFERRED)
+
+    try:
+        content = await _get_rendered_widget(
+            loaded_plugin, widget_name, dashboard_widget, prefetch, timeout
+        )
+        if is_cacheable:
+            cache.set(
+                dashboard_widget.id, dashboard_widget.config, plugin_name, widget_name, content
+            )
+        return RenderedWidget(dashboard_widget, WidgetRenderStatus.OK, content, is_cacheable)
+    except TimeoutError:
+        logger.warning(
+            "widget render timed out::plugin_name='%s', widget_name='%s', widget_id=%s",
+            plugin_name,
+            widget_name,
+            dashboard_widget.id,
+        )
+        return RenderedWidget(dashboard_widget, WidgetRenderStatus.TIMED_OUT)
+    except PluginCircuitOpenException:
+        # another widget is already making the trial call
+        return _get_suspended_widget(dashboard_widget)
+    except ValueError:
+        return RenderedWidget(dashboard_widget, WidgetRenderStatus.FAILED)
+    except Exception:
+        logger.exception(
+            "widget render failed::plugin_name='%s', widget_name='%s', widget_id=%s",
+            plugin_name,
+            widget_name,
+            dashboard_widget.id,
+        )
+        return RenderedWidget(dashboard_widget, WidgetRenderStatus.FAILED)
+
+
+async def render_dashboard_widgets(
+    dashboard_widgets: Iterable[models.DashboardWidget], /
+) -> list[RenderedWidget]:
+    """
+    Render placed dashboard widgets, keeping the given order.
+    Widgets marked as lazy are deferred for the browser to load.
+    Uses the app config to decide whether widgets are rendered
+    concurrently and how long each widget has to render.
+
+        :param dashboard_widgets: The placed widgets to render (in display order)
+        :return: The render results, in the same order as given
+    """
+    timeout = get_settings().WIDGET_RENDER_TIMEOUT
+    dashboard_widgets = tuple(dashboard_widgets)
+    prefetches = start_widget_prefetches(dashboard_widgets, timeout=timeout)
+
+    def render(widget: models.DashboardWidget):
+        return render_dashboard_widget(
+            widget,
+            timeout=timeout,
+            defer_lazy=True,
+            prefetch=prefetches.get(widget.widget.plugin.internal_name),
+        )
+
+    if get_settings().WIDGET_RENDER_CONCURRENT:
+        return list(await asyncio.gather(*(render(widget) for widget in dashboard_widgets)))
+
+    return [await render(widget) for widget in dashboard_widgets]
+
+
+def stream_dashboard_widgets(
+    dashboard_widgets: Iterable[models.DashboardWidget], /
+) -> AsyncIterator[RenderedWidget]:
+    """
+    Render placed dashboard widgets, yielding each one in the given order once rendered.
+    Widgets marked as lazy are deferred for the browser to load.
+    When rendering concurrently all renders are started straight away,
+    so later widgets are ready by the time earlier ones have been sent.
+
+        :param dashboard_widgets: The placed widgets to render (in display order)
+        :return: The render results, in the same order as given
+    """
+    timeout = get_settings().WIDGET_RENDER_TIMEOUT
+    dashboard_widgets = tuple(dashboard_widgets)
+    prefetches = start_widget_prefetches(dashboard_widgets, timeout=timeout)
+
+    def render(widget: models.DashboardWidget):
+        return render_dashboard_widget(
+            widget,
+            timeout=timeout,
+            defer_lazy=True,
+            prefetch=prefetches.get(widget.widget.plugin.internal_name),
+        )
+
+    if not get_settings().WIDGET_RENDER_CONCURRENT:
+
+        async def render_in_turn():
+            for widget in dashboard_widgets:
+                yield await render(widget)
+
+        return render_in_turn()
+
+    tasks = [asyncio.create_task(render(widget)) for widget in dashboard_widgets]
+
+    async def render_in_order():
+        try:
+            for task in tasks:
+                yield await task
+        finally:
+            # client may have gone away before all widgets were sent
+            for task in (*tasks, *prefetches.values()):
+                task.cancel()
+
+    return render_in_order()
@@ -0,0 +1,231 @@
+"""
+Module to run background jobs given by plugins,
+outside of any request
+"""
+
+import asyncio
+import logging
+import random
+from collections.abc import AsyncGenerator, Awaitable, Callable, Collection
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from datetime import timedelta
+from functools import lru_cache
+from os import getpid
+from secrets import token_hex
+from socket import gethostname
+from time import monotonic
+
+from quart import Quart, current_app
+from tortoise import timezone
+from tortoise.exceptions import IntegrityError
+from tortoise.expressions import Q
+
+from ..database import models
+from .cache import CacheInvalidations
+from .config import get_settings
+from .helpers import broadcast_cache_invalidations
+
+logger = logging.getLogger("web-portal")
+
+
+@dataclass
+class ScheduledJob:
+    """
+    A background job run by the app, outside of any request.
+    Runs every interval seconds (after the previous run has finished),
+    or once each time the app is launched when interval is None.
+    """
+
+    name: str
+    func: Callable[[], Awaitable]
+    interval: float | None = None
+    # seconds to wait after launch before the first run
+    delay: float = 0
+    # up to this many random seconds are added to each wait, so jobs don't all run at once
+    jitter: float = 0
+    # only run by one of the app's processes at a time
+    single_worker: bool = True
+
+
+class JobScheduler:
+    """
+    Runs scheduled jobs in the background,
+    using database leases so a job is only run by one process at a time
+    """
+
+    def __init__(self, lease_grace: float) -> None:
+        """
+        :param lease_grace: Seconds added to a job lease,
+                            allowing for the owner to be late in renewing it
+        """
+        self.lease_grace = lease_grace
+        self.owner_id = f"{gethostname()}:{getpid()}:{token_hex(4)}"
+        self._tasks: dict[str, list[tuple[ScheduledJob, asyncio.Task]]] = {}
+        self._app: Quart | None = None
+
+    @staticmethod
+    def _get_lease_key(plugin_name: str, job: ScheduledJob) -> str:
+        return f"{plugin_name}:{job.name}"
+
+    def _get_lease_duration(self, job: ScheduledJob) -> float:
+        return (job.interval or 0) + job.jitter + self.lease_grace
+
+    async def _acquire_lease(self, key: str, duration: float) -> bool:
+        now = timezone.now()
+        expires_at = now + timedelta(seconds=duration)
+        updated = await models.JobLease.filter(
+            Q(owner=self.owner_id) | Q(expires_at__lte=now), key=key
+        ).update(owner=self.owner_id, expires_at=expires_at)
+        if updated:
+            return True
+        try:
+            await models.JobLease.create(key=key, owner=self.owner_id, expires_at=expires_at)
+        except IntegrityError:
+            # held by another process
+            return False
+        return True
+
+    @asynccontextmanager
+    async def hold_lease(
+        self, key: str, duration: float, /, *, retry_interval: float = 1
+    ) -> AsyncGenerator[None, None]:
+        """
+        Hold a lease while running work that must only run in one process at a time,
+        waiting while another process holds it. The lease is renewed until the work has finished.
+
+            :param key: The lease key, must not be the key of a scheduled job
+            :param duration: Seconds the lease is held for between renewals
+            :param retry_interval: Seconds to wait between attempts to acquire it, defaults to 1
+        """
+        while not await self._acquire_lease(key, duration):
+            logger.debug("waiting for lease held by another process::key='%s'", key)
+            await asyncio.sleep(retry_interval)
+        keep_lease = asyncio.create_task(self._keep_lease(key, duration))
+        try:
+            yield
+        finally:
+            keep_lease.cancel()
+            await asyncio.gather(keep_lease, return_exceptions=True)
+            await models.JobLease.filter(key=key, owner=self.owner_id).delete()
+
+    async def _keep_lease(self, key: str, duration: float):
+        # NOTE returns once the lease could not be renewed, so the job can be stopped
+        while True:
+            await asyncio.sleep(duration / 2)
+            try:
+                renewed = await self._acquire_lease(key, duration)
+            except Exception:
+                logger.exception("unable to renew job lease::key='%s'", key)
+                return
+            if not renewed:
+                logger.warning("lost lease of running job::key='%s'", key)
+                return
+
+    async def _call_job(self, job: ScheduledJob):
+        async with self._app.app_context():  # type: ignore
+            CacheInvalidations.collect()
+            try:
+                await job.func()
+            finally:
+                # NOTE also when the job failed, as changes it committed may be cached elsewhere
+                await broadcast_cache_invalidations()
+
+    async def _run_once(self, plugin_name: str, job: ScheduledJob):
+        key = self._get_lease_key(plugin_name, job)
+        keep_lease = None
+
+        if job.single_worker:
+            duration = self._get_lease_duration(job)
+            try:
+                if not await self._acquire_lease(key, duration):
+                    logger.debug("job is running in another process::key='%s'", key)
+                    return
+            except Exception:
+                logger.exception("unable to acquire job lease::key='%s'", key)
+                return
+            # NOTE renewed while running, so a slow run does not overlap with another process
+            keep_lease = asyncio.create_task(self._keep_lease(key, duration))
+
+        started_at = monotonic()
+        run = asyncio.create_task(self._call_job(job))
+        tasks = [run] if keep_lease is None else [run, keep_lease]
+        try:
+            await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            # stops the job when its lease was lost, or this run was cancelled
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        if run.cancelled():
+            logger.warning("cancelled job that lost its lease::key='%s'", key)
+        elif (err := run.exception()) is not None:
+            logger.error("scheduled job failed::key='%s'", key, exc_info=err)
+        else:
+            logger.debug(
+                "scheduled job finished::key='%s', duration=%.2f", key, monotonic() - started_at
+            )
+
+    async def _run(self, plugin_name: str, job: ScheduledJob):
+        await asyncio.sleep(job.delay + random.uniform(0, job.jitter))
+        while True:
+            await self._run_once(plugin_name, job)
+            if job.interval is None:
+                return
+            await asyncio.sleep(job.interval + random.uniform(0, job.jitter))
+
+    def start_plugin_jobs(self, plugin_name: str, jobs: Collection[ScheduledJob]):
+        """
+        Start running a plugin's jobs in the background,
+        must be run inside the app context
+
+            :param plugin_name: The plugin's internal name
+            :param jobs: The plugin's jobs
+        """
+        if self._app is None:
+            self._app = current_app._get_current_object()  # type: ignore
+        tasks = self._tasks.setdefault(plugin_name, [])
+        for job in jobs:
+            logger.debug("starting scheduled job::key='%s'", self._get_lease_key(plugin_name, job))
+            task = asyncio.create_task(
+                self._run(plugin_name, job),
+                name=f"scheduled-job:{self._get_lease_key(plugin_name, job)}",
+            )
+            tasks.append((job, task))
+
+    async def stop_plugin_jobs(self, plugin_name: str):
+        """
+        Cancel a plugin's jobs and release their leases,
+        so another process can take over
+
+            :param plugin_name: The plugin's internal name
+        """
+        tasks = self._tasks.pop(plugin_name, [])
+        for _, task in tasks:
+            task.cancel()
+        await asyncio.gather(*(task for _, task in tasks), return_exceptions=True)
+        lease_keys = [
+            self._get_lease_key(plugin_name, job) for job, _ in tasks if job.single_worker
+        ]
+        if not lease_keys:
+            return
+        try:
+            await models.JobLease.filter(key__in=lease_keys, owner=self.owner_id).delete()
+        except Exception:
+            logger.exception("unable to release job leases::plugin_name='%s'", plugin_name)
+
+    async def stop(self):
+        """
+        Cancel all running jobs and release their leases
+        """
+        for plugin_name in tuple(self._tasks):
+            await self.stop_plugin_jobs(plugin_name)
+
+
+@lru_cache
+def get_job_scheduler() -> JobScheduler:
+    """
+    returns the shared JobScheduler obj
+    """
+    return JobScheduler(get_settings().SCHEDULER_LEASE_GRACE)
@@ -0,0 +1,100 @@
+"""
+Module to assist with password hashing,
+without blocking the event loop
+"""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+from .config import get_settings
+
+
+class PasswordHasherBusyException(Exception):
+    """
+    Raised when too many passwords are waiting to be hashed
+    """
+
+
+def get_full_hash_method(method: str) -> str:
+    """
+    Get a hash method with all of its parameters,
+    filling in werkzeug's defaults e.g. 'scrypt' gives 'scrypt:32768:8:1'
+
+        :param method: The hash method, as given to werkzeug
+        :raises ValueError: When the method is not supported
+        :return: The full hash method, as stored at the start of a hash
+    """
+    return generate_password_hash("", method).split("$", 1)[0]
+
+
+class PasswordHasher:
+    """
+    Hashes and verifies passwords in a thread pool,
+    refusing new work once the pool and its queue are full
+    """
+
+    def __init__(self, method: str, max_workers: int, max_queued: int) -> None:
+        """
+        :param method: The hash method (with parameters) to use for new hashes
+        :param max_workers: Number of passwords that can be hashed at the same time
+        :param max_queued: Number of passwords that can wait for a free worker
+        """
+        self.method = get_full_hash_method(method)
+        self.max_workers = max_workers
+        self.max_queued = max_queued
+        self.pending = 0
+        self._executor = ThreadPoolExecutor(max_workers, thread_name_prefix="password-hasher")
+
+    async def _run(self, func, *args):
+        if self.pending >= self.max_workers + self.max_queued:
+            raise PasswordHasherBusyException("too many passwords waiting to be hashed")
+        self.pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+        finally:
+            self.pending -= 1
+
+    async def hash(self, password: str) -> bytes:
+        """
+        Create a hash of a password
+
+            :param password: The plain text password
+            :raises PasswordHasherBusyException: When the queue is full
+            :return: The password hash
+        """
+        return (await self._run(generate_password_hash, password, self.method)).encode()
+
+    async def verify(self, password_hash: bytes, password: str) -> bool:
+        """
+        Check a password matches a hash
+
+            :param password_hash: The stored password hash
+            :param password: The plain text password to check
+            :raises PasswordHasherBusyException: When the queue is full
+            :return: Whether it matches
+        """
+        return await self._run(check_password_hash, password_hash.decode(), password)
+
+    def needs_rehash(self, password_hash: bytes) -> bool:
+        """
+        Check whether a hash was created with a different method or parameters
+
+            :param password_hash: The stored password hash
+            :return: Whether it should be replaced
+        """
+        return password_hash.decode().split("$", 1)[0] != self.method
+
+
+@lru_cache
+def get_password_hasher() -> PasswordHasher:
+    """
+    returns the shared PasswordHasher obj
+    """
+    return PasswordHasher(
+        get_settings().PASSWORD_HASH_METHOD,
+        get_settings().PASSWORD_HASH_WORKERS,
+        get_settings().PASSWORD_HASH_QUEUE_LIMIT,
+    )
@@ -0,0 +1,242 @@
+"""
+Module to isolate the app from misbehaving plugins,
+tracking the health of each plugin's hooks and stopping calls to failing plugins
+"""
+
+import asyncio
+import logging
+from collections import deque
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass, field
+from enum import Enum
+from functools import lru_cache
+from time import monotonic
+from typing import TYPE_CHECKING, ParamSpec, TypeVar
+
+from .config import get_settings
+
+if TYPE_CHECKING:
+    from .plugin import LoadedPlugin
+
+logger = logging.getLogger("web-portal")
+
+P = ParamSpec("P")
+T = TypeVar("T")
+
+
+class PluginCircuitOpenException(Exception):
+    """
+    Raised when a plugin hook is not called because the plugin's breaker is tripped
+    """
+
+
+class BreakerState(str, Enum):
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+
+@dataclass
+class PluginHealth:
+    """
+    Recent hook calls of a plugin and the state of its breaker
+    """
+
+    # whether each recent call failed (raised, timed out or went over budget)
+    outcomes: deque[bool]
+    state: BreakerState = BreakerState.CLOSED
+    opened_at: float | None = None
+    is_trial_running: bool = False
+    total_calls: int = 0
+    total_failures: int = 0
+    last_latency: float | None = None
+    last_error: str | None = None
+    latencies: deque[float] = field(default_factory=lambda: deque(maxlen=100))
+
+    @property
+    def failure_rate(self) -> float:
+        if not self.outcomes:
+            return 0
+        return sum(self.outcomes) / len(self.outcomes)
+
+    @property
+    def average_latency(self) -> float | None:
+        if not self.latencies:
+            return None
+        return sum(self.latencies) / len(self.latencies)
+
+
+class PluginSupervisor:
+    """
+    Calls plugin hooks, tracking latency and errors for each plugin.
+    When too many recent calls fail the plugin's breaker trips and its hooks
+    are not called until the cooldown has passed, then a single trial call
+    decides whether to close the breaker or keep it tripped.
+    """
+
+    def __init__(
+        self,
+        *,
+        latency_budget: float | None,
+        window: int,
+        min_calls: int,
+        failure_rate: float,
+        cooldown: float,
+    ) -> None:
+        """
+        :param latency_budget: Seconds a hook call can take before counting as failed,
+                               unless the plugin gives its own, None for no budget
+        :param window: Number of recent calls used to work out the failure rate
+        :param min_calls: Number of recent calls needed before the breaker can trip
+        :param failure_rate: Fraction of recent calls that must fail to trip the breaker
+        :param cooldown: Seconds before a tripped breaker allows a trial call
+        """
+        self.latency_budget = latency_budget
+        self.window = window
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.cooldown = cooldown
+        self._health: dict[str, PluginHealth] = {}
+
+    def get_health(self, plugin_name: str) -> PluginHealth:
+        """
+        Get the health of a plugin, updating its breaker state if the cooldown has passed
+
+            :param plugin_name: The plugin's internal name
+            :return: The plugin's health
+        """
+        health = self._health.get(plugin_name)
+        if health is None:
+            health = self._health[plugin_name] = PluginHealth(deque(maxlen=self.window))
+        if (
+            health.state is BreakerState.OPEN
+            and health.opened_at is not None
+            and monotonic() - health.opened_at >= self.cooldown
+        ):
+            health.state = BreakerState.HALF_OPEN
+        return health
+
+    def is_available(self, plugin_name: str) -> bool:
+        """
+        Check whether a plugin's hooks would be called
+
+            :param plugin_name: The plugin's internal name
+            :return: Whether the breaker is closed or ready for a trial call
+        """
+        health = self.get_health(plugin_name)
+        return health.state is BreakerState.CLOSED or (
+            health.state is BreakerState.HALF_OPEN and not health.is_trial_running
+        )
+
+    def reset(self, plugin_name: str):
+        """
+        Forget the health of a plugin, closing its breaker
+
+            :param plugin_name: The plugin's internal name
+        """
+        self._health.pop(plugin_name, None)
+
+    def _record(
+        self,
+        plugin_name: str,
+        health: PluginHealth,
+        latency: float,
+        error: str | None,
+        budget: float | None,
+    ):
+        if error is None and budget is not None and latency > budget:
+            error = f"took {latency:.2f}s, over budget of {budget:.2f}s"
+        is_failure = error is not None
+
+        health.outcomes.append(is_failure)
+        health.latencies.append(latency)
+        health.last_latency = latency
+        health.total_calls += 1
+        if is_failure:
+            health.total_failures += 1
+            health.last_error = error
+
+        if health.state is BreakerState.HALF_OPEN:
+            if is_failure:
+                self._trip(plugin_name, health)
+            else:
+                health.state = BreakerState.CLOSED
+                health.opened_at = None
+                health.outcomes.clear()
+                logger.info("plugin breaker closed::plugin_name='%s'", plugin_name)
+        elif (
+            health.state is BreakerState.CLOSED
+            and len(health.outcomes) >= self.min_calls
+            and health.failure_rate >= self.failure_rate
+        ):
+            self._trip(plugin_name, health)
+
+    def _trip(self, plugin_name: str, health: PluginHealth):
+        health.state = BreakerState.OPEN
+        health.opened_at = monotonic()
+        logger.warning(
+            "plugin breaker tripped::plugin_name='%s', last_error='%s'",
+            plugin_name,
+            health.last_error,
+        )
+
+    async def call(
+        self,
+        plugin: "LoadedPlugin",
+        hook: Callable[P, Awaitable[T]],
+        /,
+        *args: P.args,
+        timeout: float | None = None,
+    ) -> T:
+        """
+        Call a plugin hook, recording how it went
+
+            :param plugin: The plugin the hook belongs to
+            :param hook: The plugin hook to call
+            :param args: Arguments given to the hook
+            :param timeout: Seconds the hook has before giving up, defaults to None
+            :raises PluginCircuitOpenException: When the plugin's breaker is tripped
+            :raises TimeoutError: When the hook took longer than the timeout
+            :return: The hook's result
+        """
+        plugin_name = plugin.internal_name
+        budget = plugin.latency_budget if plugin.latency_budget is not None else self.latency_budget
+        health = self.get_health(plugin_name)
+        if not self.is_available(plugin_name):
+            raise PluginCircuitOpenException(f"plugin '{plugin_name}' is temporarily disabled")
+
+        is_trial = health.state is BreakerState.HALF_OPEN
+        if is_trial:
+            health.is_trial_running = True
+        started_at = monotonic()
+        try:
+            result = await asyncio.wait_for(hook(*args), timeout)
+        except asyncio.CancelledError:
+            # caller went away, so the plugin is not to blame
+            raise
+        except TimeoutError:
+            self._record(plugin_name, health, monotonic() - started_at, "timed out", budget)
+            raise
+        except Exception as err:
+            self._record(plugin_name, health, monotonic() - started_at, repr(err), budget)
+            raise
+        else:
+            self._record(plugin_name, health, monotonic() - started_at, None, budget)
+            return result
+        finally:
+            if is_trial:
+                health.is_trial_running = False
+
+
+@lru_cache
+def get_plugin_supervisor() -> PluginSupervisor:
+    """
+    returns the shared PluginSupervisor obj
+    """
+    return PluginSupervisor(
+        latency_budget=get_settings().PLUGIN_LATENCY_BUDGET,
+        window=get_settings().PLUGIN_BREAKER_WINDOW,
+        min_calls=get_settings().PLUGIN_BREAKER_MIN_CALLS,
+        failure_rate=get_settings().PLUGIN_BREAKER_FAILURE_RATE,
+        cooldown=get_settings().PLUGIN_BREAKER_COOLDOWN,
+    )
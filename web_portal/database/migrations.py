@@ -0,0 +1,338 @@
+"""
+Versioned migrations of the database schema, for the app and each plugin with database models.
+The version applied for each is recorded, so launching with an up to date database
+skips all schema work.
+"""
+
+import logging
+from collections.abc import Awaitable, Callable, Collection, Mapping
+from dataclasses import dataclass
+
+from tortoise import Tortoise
+from tortoise.backends.base.client import BaseDBAsyncClient
+from tortoise.exceptions import OperationalError
+from tortoise.models import Model
+from tortoise.transactions import in_transaction
+
+from ..core.scheduler import get_job_scheduler
+from . import models
+
+logger = logging.getLogger("web-portal")
+
+# tortoise app label of the app's own models
+CORE_APP_LABEL = "models"
+# job lease held while migrating, so only one process migrates at a time
+MIGRATIONS_LEASE_KEY = "migrate-database"
+MIGRATIONS_LEASE_DURATION = 60
+
+
+@dataclass
+class Migration:
+    """
+    A change to the database schema (or data) of an app,
+    versions start at 1 and increase by 1 for each new migration.
+
+    Migrations also run on databases created before migrations were recorded,
+    so they must check whether their change was already made. Each migration is run
+    in a transaction with recording its version, but as schema changes cannot be
+    rolled back on all databases they must still be safe to run again.
+    A failed query ends the transaction on some databases, so check the schema
+    with has_table(), has_column() and has_index() instead of trying a query.
+    Models may have fields added by later migrations, so only query the needed fields.
+    Tables of new models are created once all migrations have run,
+    use create_model_table() when a migration needs one sooner.
+    """
+
+    version: int
+    name: str
+    func: Callable[[BaseDBAsyncClient], Awaitable]
+
+
+async def has_table(conn: BaseDBAsyncClient, table: str) -> bool:
+    """
+    Check whether a table exists
+
+        :param conn: The connection to use
+        :param table: The table name
+    """
+    match conn.capabilities.dialect:
+        case "sqlite":
+            query = "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?"
+        case "mysql":
+            query = (
+                "SELECT 1 FROM information_schema.tables"
+                " WHERE table_schema = DATABASE() AND table_name = %s"
+            )
+        case _:
+            query = (
+                "SELECT 1 FROM information_schema.tables"
+                " WHERE table_schema = current_schema() AND table_name = $1"
+            )
+    _, rows = await conn.execute_query(query, [table])
+    return bool(rows)
+
+
+async def has_column(conn: BaseDBAsyncClient, table: str, column: str) -> bool:
+    """
+    Check whether a table has a column
+
+        :param conn: The connection to use
+        :param table: The table name
+        :param column: The column name
+    """
+    match conn.capabilities.dialect:
+        case "sqlite":
+            query = "SELECT 1 FROM pragma_table_info(?) WHERE name = ?"
+        case "mysql":
+            query = (
+                "SELECT 1 FROM information_schema.columns"
+                " WHERE table_schema = DATABASE() AND table_name = %s AND column_name = %s"
+            )
+        case _:
+            query = (
+                "SELECT 1 FROM information_schema.columns"
+                " WHERE table_schema = current_schema() AND table_name = $1 AND column_name = $2"
+            )
+    _, rows = await conn.execute_query(query, [table, column])
+    return bool(rows)
+
+
+async def has_index(conn: BaseDBAsyncClient, table: str, name: str) -> bool:
+    """
+    Check whether a table has an index
+
+        :param conn: The connection to use
+        :param table: The table name
+        :param name: The index name
+    """
+    values = [table, name]
+    match conn.capabilities.dialect:
+        case "sqlite":
+            # NOTE unique together constraints are part of the table, not named indexes
+            query = (
+                "SELECT 1 FROM sqlite_master WHERE tbl_name = ?"
+                " AND ((type = 'index' AND name = ?) OR (type = 'table' AND instr(sql, ?) > 0))"
+            )
+            values.append(f'CONSTRAINT "{name}"')
+        case "mysql":
+            query = (
+                "SELECT 1 FROM information_schema.statistics"
+                " WHERE table_schema = DATABASE() AND table_name = %s AND index_name = %s"
+            )
+        case _:
+            query = (
+                "SELECT 1 FROM pg_indexes"
+                " WHERE schemaname = current_schema() AND tablename = $1 AND indexname = $2"
+            )
+    _, rows = await conn.execute_query(query, values)
+    return bool(rows)
+
+
+async def create_model_table(conn: BaseDBAsyncClient, model: type[Model]):
+    """
+    Create the table of a model (with its indexes), unless it already exists
+
+        :param conn: The connection to use
+        :param model: The model to create the table of
+    """
+    generator = conn.schema_generator(conn)
+    await conn.execute_script(generator._get_table_sql(model, safe=True)["table_creation_string"])
+
+
+async def create_model_index(
+    conn: BaseDBAsyncClient, model: type[Model], columns: list[str], /, *, unique: bool = False
+):
+    """
+    Create an index on existing columns of a model's table unless it already exists,
+    named as tortoise names the indexes given in the model's Meta
+
+        :param conn: The connection to use
+        :param model: The model the index is for
+        :param columns: The indexed column names
+        :param unique: Whether the index is for Meta.unique_together, defaults to False
+    """
+    generator = conn.schema_generator(conn)
+    table = model._meta.db_table
+    name = generator._generate_index_name("uid" if unique else "idx", table, columns)
+    if await has_index(conn, table, name):
+        return
+    await conn.execute_script(
+        "CREATE {}INDEX {} ON {} ({})".format(
+            "UNIQUE " if unique else "",
+            generator.quote(name),
+            generator.quote(table),
+            ", ".join(generator.quote(column) for column in columns),
+        )
+    )
+
+
+async def _add_widget_positions(conn: BaseDBAsyncClient):
+    # NOTE each step is checked, so a migration stopped part way can be run again
+    table = models.DashboardWidget._meta.db_table
+    if not await has_column(conn, table, "position"):
+        await conn.execute_script(f"ALTER TABLE {table} ADD COLUMN position INT NOT NULL DEFAULT 0")
+        await _set_widget_positions()
+    await create_model_index(conn, models.DashboardWidget, ["dashboard_id", "position"])
+
+
+async def _set_widget_positions():
+    # positions follow the old order, with any widgets missing from it placed last
+    # NOTE only selects columns existing at this version, as later ones may not be added yet
+    widget_ids: dict[int, list[int]] = {}
+    for widget_id, dashboard_id in await models.DashboardWidget.all().values_list(
+        "id", "dashboard_id"
+    ):
+        widget_ids.setdefault(dashboard_id, []).append(widget_id)
+    async with in_transaction():
+        for dashboard_id, widget_order in await models.Dashboard.all().values_list(
+            "id", "widget_order"
+        ):
+            order = {widget_id: i for i, widget_id in enumerate(widget_order)}
+            dashboard_widget_ids = sorted(
+                widget_ids.get(dashboard_id, ()), key=lambda x: (order.get(x, len(order)), x)
+            )
+            for position, widget_id in enumerate(dashboard_widget_ids):
+                if position != 0:
+                    await models.DashboardWidget.filter(id=widget_id).update(position=position)
+
+
+async def _add_dashboard_templates(conn: BaseDBAsyncClient):
+    table = models.Dashboard._meta.db_table
+    if not await has_column(conn, table, "name"):
+        await conn.execute_script(
+            f"ALTER TABLE {table} ADD COLUMN name VARCHAR(128) NOT NULL DEFAULT ''"
+        )
+    if not await has_column(conn, table, "template_id"):
+        await conn.execute_script(f"ALTER TABLE {table} ADD COLUMN template_id INT NULL")
+
+
+async def _add_dashboard_indexes(conn: BaseDBAsyncClient):
+    # NOTE only possible duplicates are from racing requests,
+    #      which could not be loaded (as they raise MultipleObjectsReturned)
+    seen = set()
+    duplicate_ids = []
+    for dashboard_id, owner_id, name in (
+        await models.Dashboard.all().order_by("id").values_list("id", "owner_id", "name")
+    ):
+        if (owner_id, name) in seen:
+            duplicate_ids.append(dashboard_id)
+        seen.add((owner_id, name))
+    if duplicate_ids:
+        logger.warning("removing duplicate dashboards::dashboard_ids=%s", duplicate_ids)
+        await models.DashboardWidget.filter(dashboard_id__in=duplicate_ids).delete()
+        await models.Dashboard.filter(id__in=duplicate_ids).delete()
+
+    await create_model_index(conn, models.Dashboard, ["owner_id", "name"], unique=True)
+    await create_model_index(conn, models.Dashboard, ["template_id"])
+
+
+CORE_MIGRATIONS = (
+    Migration(1, "widget positions", _add_widget_positions),
+    Migration(2, "dashboard templates", _add_dashboard_templates),
+    Migration(3, "dashboard indexes", _add_dashboard_indexes),
+)
+
+
+async def _has_app_tables(conn: BaseDBAsyncClient, app_label: str) -> bool:
+    for model in Tortoise.apps[app_label].values():
+        # NOTE tables created when first migrating do not mean the app's tables were created
+        if model in (models.SchemaVersion, models.JobLease):
+            continue
+        if await has_table(conn, model._meta.db_table):
+            return True
+    return False
+
+
+async def _get_pending_migrations(
+    conn: BaseDBAsyncClient,
+    app_label: str,
+    migrations: Collection[Migration],
+    versions: Mapping[str, int],
+) -> list[Migration] | None:
+    migrations = sorted(migrations, key=lambda x: x.version)
+    if (version := versions.get(app_label)) is None:
+        if not await _has_app_tables(conn, app_label):
+            # new app, so its tables are created as they are now
+            return None
+        # created before migrations were recorded
+        version = 0
+    return [migration for migration in migrations if migration.version > version]
+
+
+async def _set_version(app_label: str, version: int):
+    await models.SchemaVersion.update_or_create(defaults={"version": version}, app=app_label)
+
+
+async def _get_pending_work(
+    conn: BaseDBAsyncClient, migrations: Mapping[str, Collection[Migration]]
+) -> tuple[list[str], dict[str, list[Migration]]]:
+    try:
+        versions = dict(await models.SchemaVersion.all().values_list("app", "version"))
+    except OperationalError:
+        versions = {}
+        await create_model_table(conn, models.SchemaVersion)
+
+    new_apps = []
+    pending: dict[str, list[Migration]] = {}
+    for app_label in Tortoise.apps:
+        app_pending = await _get_pending_migrations(
+            conn, app_label, migrations.get(app_label, ()), versions
+        )
+        if app_pending is None:
+            new_apps.append(app_label)
+        elif app_pending or app_label not in versions:
+            pending[app_label] = app_pending
+    return new_apps, pending
+
+
+async def migrate_database(migrations: Mapping[str, Collection[Migration]], /):
+    """
+    Bring the database up to date, creating the tables of new apps and running pending
+    migrations. Must be run once connected, before anything else uses the database.
+    Only one process migrates at a time, others wait for it to finish.
+
+        :param migrations: The migrations of each app, by tortoise app label
+    """
+    conn = Tortoise.get_connection("default")
+
+    new_apps, pending = await _get_pending_work(conn, migrations)
+    if not new_apps and not pending:
+        logger.debug("database schema is up to date")
+        return
+
+    await create_model_table(conn, models.JobLease)
+    async with get_job_scheduler().hold_lease(MIGRATIONS_LEASE_KEY, MIGRATIONS_LEASE_DURATION):
+        # NOTE checked again, as another process may have migrated while this one waited
+        new_apps, pending = await _get_pending_work(conn, migrations)
+        if not new_apps and not pending:
+            logger.debug("database schema was brought up to date by another process")
+            return
+        await _apply_pending_work(migrations, new_apps, pending)
+
+
+async def _apply_pending_work(
+    migrations: Mapping[str, Collection[Migration]],
+    new_apps: list[str],
+    pending: dict[str, list[Migration]],
+):
+    for app_label, app_pending in pending.items():
+        for migration in app_pending:
+            logger.info(
+                "applying migration::app_label='%s', version=%s, name='%s'",
+                app_label,
+                migration.version,
+                migration.name,
+            )
+            async with in_transaction() as conn:
+                await migration.func(conn)
+                await _set_version(app_label, migration.version)
+        if not app_pending:
+            await _set_version(app_label, 0)
+
+    # NOTE creates tables of new apps and new models, existing tables are left as they are
+    await Tortoise.generate_schemas()
+    if new_apps:
+        logger.info("created tables of new apps::app_labels=%s", new_apps)
+        for app_label in new_apps:
+            latest = max((x.version for x in migrations.get(app_label, ())), default=0)
+            await _set_version(app_label, latest)
@@ -1,12 +1,16 @@
 from collections.abc import Iterable
+from copy import deepcopy
 from typing import Any
 
+from tortoise.expressions import F
 from tortoise.fields import (
     BinaryField,
     BooleanField,
     CharField,
+    DatetimeField,
     Field,
     ForeignKeyField,
+    ForeignKeyNullableRelation,
     ForeignKeyRelation,
     IntField,
     JSONField,
@@ -16,7 +20,10 @@ from tortoise.models import Model
 from tortoise.transactions import atomic
 from werkzeug.security import check_password_hash, generate_password_hash
 
+from ..core.cache import get_public_snapshot, get_widget_render_cache
+from ..core.config import get_settings
 from ..core.constants import PUBLIC_ACCOUNT_USERNAME
+from ..core.security import get_password_hasher
 
 
 class SystemSetting(Model):
@@ -24,6 +31,36 @@ class SystemSetting(Model):
     value = JSONField()
 
 
+class SystemSettingRevision(Model):
+    """
+    The revision a system setting was last changed at,
+    allowing each process to find which of its cached settings are stale
+    """
+
+    key = CharField(128, pk=True)
+    revision = IntField(default=0)
+
+
+class JobLease(Model):
+    """
+    Which process is running a scheduled job,
+    the lease must be renewed before it expires to keep running the job
+    """
+
+    key = CharField(256, pk=True)
+    owner = CharField(128)
+    expires_at = DatetimeField()
+
+
+class SchemaVersion(Model):
+    """
+    The latest migration applied to the tables of an app (by its tortoise app label)
+    """
+
+    app = CharField(128, pk=True)
+    version = IntField(default=0)
+
+
 class User(Model):
     id = IntField(pk=True)
     username = CharField(128, unique=True)
@@ -38,7 +75,39 @@ class User(Model):
     def set_password(self, new_password: str):
         if self.is_public_account:
             raise ValueError("Cannot set password of public account")
-        self.password_hash = generate_password_hash(new_password).encode()
+        self.password_hash = generate_password_hash(
+            new_password, get_settings().PASSWORD_HASH_METHOD
+        ).encode()
+
+    async def check_password_async(self, to_check: str) -> bool:
+        """
+        Same as check_password, but without blocking the event loop
+
+            :raises PasswordHasherBusyException: When too many passwords are being checked
+        """
+        if self.password_hash is None:
+            return False
+        return await get_password_hasher().verify(self.password_hash, to_check)
+
+    async def set_password_async(self, new_password: str):
+        """
+        Same as set_password, but without blocking the event loop
+
+            :raises PasswordHasherBusyException: When too many passwords are being hashed
+        """
+        if self.is_public_account:
+            raise ValueError("Cannot set password of public account")
+        self.password_hash = await get_password_hasher().hash(new_password)
+
+    @property
+    def needs_password_rehash(self) -> bool:
+        """
+        Check whether the password hash was created
+        with different hash parameters than currently configured
+        """
+        if self.password_hash is None:
+            return False
+        return get_password_hasher().needs_rehash(self.password_hash)
 
     @property
     def is_public_account(self):
@@ -72,75 +141,193 @@ class Widget(Model):
 class Dashboard(Model):
     id = IntField(pk=True)
     owner: ForeignKeyRelation[User] = ForeignKeyField("models.User")
+    # only templates are named, they are owned by the public account
+    name = CharField(128, default="")
+    # dashboard whose widgets are shown instead, until this dashboard is changed
+    template: ForeignKeyNullableRelation["Dashboard"] = ForeignKeyField(
+        "models.Dashboard", "inheritors", null=True
+    )
+    # NOTE no longer used, widgets are ordered by position (kept for upgrading older databases)
     widget_order: Field[list[int]] = JSONField(default=[])  # type: ignore
 
     widgets = ReverseRelation["DashboardWidget"]
+    inheritors = ReverseRelation["Dashboard"]
+
+    class Meta:
+        # NOTE not unique per owner, as templates are all owned by the public account
+        unique_together = (("owner", "name"),)
+        indexes = (("template_id",),)
+
+    @property
+    def is_template(self) -> bool:
+        return self.name != ""
+
+    @property
+    def is_inheriting(self) -> bool:
+        return self.template_id is not None  # type: ignore
 
     def widgets_sorted(self) -> Iterable["DashboardWidget"]:
-        if len(self.widget_order) == 0:
-            return self.widgets
-        order = {v: i for i, v in enumerate(self.widget_order)}
-        return sorted(self.widgets, key=lambda x: order[x.id])
+        return sorted(self.widgets, key=lambda x: (x.position, x.id))
+
+    async def get_placed_widgets(self) -> list["DashboardWidget"]:
+        """
+        Get the widgets shown on the dashboard in order, with their widget and plugin fetched.
+        When inheriting these are the template's widgets, shared with other dashboards.
+        """
+        return await (
+            DashboardWidget.filter(dashboard_id=self.template_id or self.id)  # type: ignore
+            .order_by("position", "id")
+            .select_related("widget__plugin")
+        )
+
+    async def _copy_widgets(self, from_dashboard_id: int) -> dict[int, int]:
+        copies = {}
+        widgets = await DashboardWidget.filter(dashboard_id=from_dashboard_id).order_by(
+            "position", "id"
+        )
+        for position, widget in enumerate(widgets):
+            copy = await DashboardWidget.create(
+                name=widget.name,
+                show_header=widget.show_header,
+                dashboard_id=self.id,
+                widget_id=widget.widget_id,  # type: ignore
+                config=deepcopy(widget.config),
+                position=position,
+            )
+            copies[widget.id] = copy.id
+        if copies:
+            await DashboardWidget._copy_related_rows(copies)
+        return copies
+
+    @atomic()
+    async def materialize(self) -> dict[int, int]:
+        """
+        Copy the template's widgets into this dashboard, so they can be changed
+        without changing the template. Does nothing when not inheriting.
+
+            :return: The id of each copy, by the id of the template widget it was copied from
+        """
+        template_id = self.template_id  # type: ignore
+        if template_id is None:
+            return {}
+        self.template_id = None
+        # NOTE only the request that detaches the dashboard copies,
+        # so concurrent edits do not copy the widgets twice
+        detached = await Dashboard.filter(id=self.id, template_id=template_id).update(
+            template_id=None
+        )
+        if not detached:
+            return {}
+        return await self._copy_widgets(template_id)
+
+    @atomic()
+    async def inherit(self, template: "Dashboard"):
+        """
+        Remove all placed widgets, showing the template's widgets instead
+
+            :param template: The dashboard to inherit from, must not be inheriting itself
+        """
+        await DashboardWidget.filter(dashboard_id=self.id).delete()
+        self.template_id = template.id
+        await self.save(update_fields=["template_id"])
+
+    @atomic()
+    async def replace_widgets(self, from_dashboard: "Dashboard"):
+        """
+        Replace all placed widgets with copies of the widgets shown on another dashboard
+
+            :param from_dashboard: The dashboard to copy from
+        """
+        from_dashboard_id = from_dashboard.template_id or from_dashboard.id  # type: ignore
+        if from_dashboard_id == self.id:
+            return
+        await DashboardWidget.filter(dashboard_id=self.id).delete()
+        await self._copy_widgets(from_dashboard_id)
 
     @atomic()
     async def append_widget(self, widget: "DashboardWidget"):
-        await self.fetch_related("widgets")
-        if len(self.widget_order) == 0:
-            self.widget_order = [x.id for x in self.widgets_sorted()]
+        # NOTE locks the dashboard, so widgets added at the same time are given their own position
+        await Dashboard.select_for_update().filter(id=self.id).values_list("id", flat=True)
+        last_position = (
+            await DashboardWidget.filter(dashboard_id=self.id)
+            .order_by("-position")
+            .first()
+            .values_list("position", flat=True)
+        )
+        widget.position = 0 if last_position is None else last_position + 1  # type: ignore
         await widget.save()
-        self.widget_order.append(widget.id)
-        await self.save()
+        get_widget_render_cache().invalidate_widget(widget.id)
 
     @atomic()
     async def pop_widget_by_id(self, widget_id: int):
-        if len(self.widget_order) != 0:
-            self.widget_order.remove(widget_id)
-        await self.widgets.filter(id=widget_id).delete()
-        await self.save()
+        position = (
+            await DashboardWidget.filter(dashboard_id=self.id, id=widget_id)
+            .first()
+            .values_list("position", flat=True)
+        )
+        if position is None:
+            return
+        await DashboardWidget.filter(dashboard_id=self.id, id=widget_id).delete()
+        # keep positions dense, so they match each widget's index
+        await DashboardWidget.filter(dashboard_id=self.id, position__gt=position).update(
+            position=F("position") - 1
+        )
+        get_widget_render_cache().invalidate_widget(widget_id)
+
+    @atomic()
+    async def set_widget_order(self, widget_ids: list[int]):
+        """
+        Set the order of all placed widgets at once,
+        only writing the widgets that have moved
+
+            :param widget_ids: Every placed widget's id, in the new order
+            :raises ValueError: When the ids do not match the placed widgets
+        """
+        widgets = {
+            widget.id: widget for widget in await DashboardWidget.filter(dashboard_id=self.id)
+        }
+        if len(widget_ids) != len(widgets) or set(widget_ids) != widgets.keys():
+            raise ValueError("widget ids must match the dashboard's placed widgets")
+
+        moved = []
+        for position, widget_id in enumerate(widget_ids):
+            widget = widgets[widget_id]
+            if widget.position != position:
+                widget.position = position
+                moved.append(widget)
+        if not moved:
+            return
+        await DashboardWidget.bulk_update(moved, fields=["position"])
+        get_public_snapshot().invalidate()
 
     @staticmethod
     def _shift_i_left(items: list[Any], i: int):
         if i == 0:
             items.append(items.pop(i))
         else:
-            left_i = i - 1
-            if left_i == 0:
-                items[::] = [
-                    items.pop(i),
-                    *items,
-                ]
-            else:
-                items[::] = [
-                    *items[:left_i],
-                    items.pop(i),
-                    *items[left_i:],
-                ]
-
-    async def shift_widget_left(self, widget_id: int):
-        if len(self.widget_order) == 0:
-            self.widget_order = [x.id for x in self.widgets_sorted()]
+            items.insert(i - 1, items.pop(i))
 
-        current_i = self.widget_order.index(widget_id)
-        if current_i == -1:
+    async def _get_widget_ids(self, widget_id: int) -> list[int]:
+        widget_ids = list(
+            await DashboardWidget.filter(dashboard_id=self.id)
+            .order_by("position", "id")
+            .values_list("id", flat=True)
+        )
+        if widget_id not in widget_ids:
             raise KeyError(f"widget id '{widget_id}' not found")
-        Dashboard._shift_i_left(self.widget_order, current_i)
+        return widget_ids  # type: ignore
 
-        await self.save()
+    async def shift_widget_left(self, widget_id: int):
+        widget_ids = await self._get_widget_ids(widget_id)
+        Dashboard._shift_i_left(widget_ids, widget_ids.index(widget_id))
+        await self.set_widget_order(widget_ids)
 
     async def shift_widget_right(self, widget_id: int):
-        if len(self.widget_order) == 0:
-            self.widget_order = [x.id for x in self.widgets_sorted()]
-
-        current_i = self.widget_order.index(widget_id)
-        if current_i == -1:
-            raise KeyError(f"widget id '{widget_id}' not found")
-
-        self.widget_order.reverse()
-        current_i = self.widget_order.index(widget_id)
-        Dashboard._shift_i_left(self.widget_order, current_i)
-        self.widget_order.reverse()
-
-        await self.save()
+        widget_ids = await self._get_widget_ids(widget_id)
+        widget_ids.reverse()
+        Dashboard._shift_i_left(widget_ids, widget_ids.index(widget_id))
+        widget_ids.reverse()
+        await self.set_widget_order(widget_ids)
 
 
 class DashboardWidget(Model):
@@ -150,3 +337,29 @@ class DashboardWidget(Model):
     dashboard: ForeignKeyRelation[Dashboard] = ForeignKeyField("models.Dashboard", "widgets")
     widget: ForeignKeyRelation[Widget] = ForeignKeyField("models.Widget")
     config = JSONField(null=True)
+    # index of the widget on its dashboard, kept dense (0 to n-1)
+    position = IntField(default=0)
+
+    class Meta:
+        indexes = (("dashboard_id", "position"),)
+
+    @staticmethod
+    async def _copy_related_rows(copies: dict[int, int]):
+        # NOTE rows of other models (e.g. from plugins) belonging to a widget are copied with it
+        for relation_name in DashboardWidget._meta.backward_fk_fields:
+            relation = DashboardWidget._meta.fields_map[relation_name]
+            related_model: type[Model] = relation.related_model  # type: ignore
+            source_field: str = relation.relation_field  # type: ignore
+            field_names = [
+                name
+                for name in related_model._meta.fields_db_projection
+                if name != related_model._meta.pk_attr
+            ]
+            rows = await related_model.filter(**{f"{source_field}__in": copies.keys()}).values(
+                *field_names
+            )
+            if rows:
+                await related_model.bulk_create(
+                    related_model(**(row | {source_field: copies[row[source_field]]}))
+                    for row in rows
+                )
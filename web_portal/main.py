@@ -1,21 +1,36 @@
 import logging
+from collections.abc import Collection
 from importlib import import_module
 from pathlib import Path
 from secrets import token_urlsafe
 
-from quart import Quart, flash, redirect, url_for
+from quart import Quart, flash, redirect, request, url_for
 from quart_auth import QuartAuth
 from tortoise.contrib.quart import register_tortoise
 from web_health_checker.contrib import quart as health_check
 
 from . import __version__
-from .core.auth import AuthUserEnhanced
+from .core.auth import AuthUserEnhanced, watch_principal_changes
+from .core.cache import CacheInvalidations
 from .core.config import get_settings
 from .core.constants import PUBLIC_ACCOUNT_USERNAME
 from .core.demo import do_demo_install
-from .core.helpers import get_system_setting
-from .core.plugin import PluginHandler, register_loaded_plugins
+from .core.helpers import (
+    SystemSettingCache,
+    broadcast_cache_invalidations,
+    preload_system_settings,
+)
+from .core.plugin import (
+    InjectedHeadHandler,
+    PluginHandler,
+    register_loaded_plugins,
+    start_scheduled_jobs,
+    watch_plugin_reloads,
+)
+from .core.scheduler import get_job_scheduler
+from .core.security import PasswordHasherBusyException
 from .database import models
+from .database.migrations import CORE_APP_LABEL, CORE_MIGRATIONS, Migration, migrate_database
 
 logger = logging.getLogger("web-portal")
 
@@ -30,51 +45,91 @@ async def redirect_to_login(*_):
     return redirect(url_for("login.get_login"))
 
 
+@app.errorhandler(PasswordHasherBusyException)
+async def redirect_when_busy(*_):
+    await flash("Server is busy, please try again shortly", "error")
+    return redirect(request.referrer or url_for("portal.portal"))
+
+
+async def collect_cache_invalidations():
+    # NOTE async, as sync hooks are run in another thread (and so another context)
+    CacheInvalidations.collect()
+
+
+async def send_cache_invalidations(response):
+    await broadcast_cache_invalidations()
+    return response
+
+
 async def setup_internals():
+    await migrate_database(get_db_migrations())
+
+    # NOTE must be before any settings are cached
+    await SystemSettingCache.sync(force=True)
+
     # NOTE this ensures public virtual account is always created
     await models.User.update_or_create(
         defaults={"password_hash": None}, username=PUBLIC_ACCOUNT_USERNAME
     )
 
-    await register_loaded_plugins()
+    report = await register_loaded_plugins()
+    if report.has_changes:
+        logger.info(
+            "registered plugins::created_plugins=%s, created_widgets=%s, moved_widgets=%s",
+            report.created_plugins,
+            report.created_widgets,
+            report.moved_widgets,
+        )
 
     if get_settings().UNATTENDED_DEMO_INSTALL:
         logger.info("unattended install of demo running")
         await do_demo_install()
 
-    # HACK Quart's config needs to have db loading added
-    await get_system_setting("DEMO_MODE")
+    # NOTE loads settings into Quart's config, so they are available in templates
+    await preload_system_settings()
+
+    await watch_plugin_reloads()
+    watch_principal_changes()
+
+    await InjectedHeadHandler.rebuild()
+
+    start_scheduled_jobs()
+
+
+async def stop_scheduled_jobs():
+    await get_job_scheduler().stop()
 
 
 @app.context_processor
 def context_get_head_injects():
-    # TODO: store rendered output in variable instead at app launch (performance improvement)
-    async def get_head_injects():
-        for plugin in PluginHandler.get_loaded_plugin_values():
-            if plugin.meta.get_injected_head:
-                yield await plugin.meta.get_injected_head()
-
-    return {"get_head_injects": get_head_injects}
+    return {"get_head_injects": InjectedHeadHandler.get_injects}
 
 
 def load_plugins(app: Quart) -> dict:
     db_models = {}
     for plugin in PluginHandler.load_plugins(__version__, get_settings().PLUGIN_SKIP_LIST):
         # register plugin settings
-        if plugin.meta.get_settings:
-            app.config[f"plugin__{plugin.internal_name}"] = plugin.meta.get_settings()
+        if (plugin_settings := plugin.get_settings()) is not None:
+            app.config[f"plugin__{plugin.internal_name}"] = plugin_settings
         # register quart blueprints
-        for blueprint in plugin.meta.blueprints:
+        for blueprint, blueprint_url_prefix in plugin.get_blueprints():
             url_prefix = f"/plugins/{plugin.internal_name}"
-            if blueprint.url_prefix:
-                url_prefix += blueprint.url_prefix
+            if blueprint_url_prefix:
+                url_prefix += blueprint_url_prefix
             app.register_blueprint(blueprint, url_prefix=url_prefix)
         # register database models
-        if plugin.meta.db_models:
-            db_models[plugin.internal_name] = plugin.meta.db_models
+        if plugin_models := plugin.get_db_models():
+            db_models[plugin.internal_name] = plugin_models
     return db_models
 
 
+def get_db_migrations() -> dict[str, Collection[Migration]]:
+    migrations: dict[str, Collection[Migration]] = {CORE_APP_LABEL: CORE_MIGRATIONS}
+    for plugin in PluginHandler.get_loaded_plugin_values():
+        migrations[plugin.internal_name] = plugin.get_db_migrations()
+    return migrations
+
+
 def register_blueprints(app: Quart):
     app.register_blueprint(health_check.blueprint, url_prefix="/")
 
@@ -109,7 +164,7 @@ def create_app():
     logger.debug("registering blueprints")
     register_blueprints(app)
 
-    db_models = {"models": [models]}
+    db_models = {CORE_APP_LABEL: [models]}
 
     if not get_settings().DISABLE_PLUGIN_LOADER:
         logger.debug("loading plugins")
@@ -118,11 +173,18 @@ def create_app():
     else:
         logger.warning("plugin loading has been disabled by app config")
 
+    # NOTE must be before tortoise is registered, so jobs stop before the database is closed
+    app.after_serving(stop_scheduled_jobs)
+
     logger.debug("registering tortoise-orm")
     # NOTE must be setup before any other hooks
-    register_tortoise(app, db_url=get_settings().DB_URI, modules=db_models, generate_schemas=True)
+    register_tortoise(app, db_url=get_settings().DB_URI, modules=db_models)
 
     app.before_serving(setup_internals)
+    app.before_request(SystemSettingCache.sync)
+    # NOTE after the sync, so invalidations made by other processes are not sent back to them
+    app.before_request(collect_cache_invalidations)
+    app.after_request(send_cache_invalidations)
 
     auth_manager.init_app(app)
 
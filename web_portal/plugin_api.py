@@ -14,17 +14,35 @@ from .core.auth import (
     login_required_if_secured,
     login_standard_required,
 )
+from .core.cache import PluginCache, get_plugin_cache
+from .core.dashboard import get_editable_widget_context
 from .core.helpers import redirect_using_back_to
 from .core.plugin import (
+    PlacedWidget,
     PluginMeta,
+    WidgetContext,
     WidgetDetails,
     get_plugin_data_path,
     get_plugin_system_setting,
+    get_widget_context,
     get_widget_details,
     get_widget_owner_id,
+    invalidate_plugin_widget_cache,
+    invalidate_widget_cache,
+    rebuild_injected_head,
     remove_plugin_system_setting,
     set_plugin_system_setting,
     set_widget_config,
+    update_widget_config,
+)
+from .core.scheduler import ScheduledJob
+from .database.migrations import (
+    Migration,
+    create_model_index,
+    create_model_table,
+    has_column,
+    has_index,
+    has_table,
 )
 
 PORTAL_ENDPOINT = "portal.portal"
@@ -10,4 +10,81 @@ themeToggleBnt.addEventListener("click", ThemeChanger.toggle_theme_picker);
 themeToggleBnt.classList.remove("hidden");
 
 ThemeChanger.on_load();
+
+/**
+ * (Re)load a widget's content from its render url
+ * @param {HTMLElement} widgetInner - the widget's inner element
+ */
+async function loadWidget(widgetInner) {
+    try {
+        const response = await fetch(widgetInner.dataset.widgetSrc, { credentials: "same-origin" });
+        widgetInner.innerHTML = await response.text();
+    } catch {
+        widgetInner.innerHTML = '<p class="widget-placeholder">Widget could not be loaded, try refreshing the page.</p>';
+        return;
+    }
+    // scripts added with innerHTML do not run, so they need replacing
+    widgetInner.querySelectorAll("script").forEach(oldScript => {
+        let newScript = document.createElement("script");
+        for (const attr of oldScript.attributes) {
+            newScript.setAttribute(attr.name, attr.value);
+        }
+        newScript.textContent = oldScript.textContent;
+        oldScript.replaceWith(newScript);
+    });
+}
+
+/**
+ * Reload a placed widget, without reloading the page
+ * @param {number} widgetId - the dashboard widget id
+ */
+function refreshWidget(widgetId) {
+    let widgetInner = document.querySelector(`#widget-${widgetId} [data-widget-src]`);
+    if (widgetInner) {
+        return loadWidget(widgetInner);
+    }
+}
+
+/**
+ * Allow placed widgets to be reordered by dragging them,
+ * saving the whole order at once when a widget is dropped
+ * @param {HTMLElement} widgetList - element holding the placed widgets
+ */
+function enableWidgetReorder(widgetList) {
+    let dragged = null;
+    widgetList.querySelectorAll("[data-widget-id]").forEach(widget => {
+        widget.draggable = true;
+        widget.addEventListener("dragstart", () => { dragged = widget; });
+        widget.addEventListener("dragover", event => {
+            if (dragged === null || dragged === widget) { return; }
+            event.preventDefault();
+            const rect = widget.getBoundingClientRect();
+            const isAfter = event.clientY > rect.top + rect.height / 2;
+            widget.parentElement.insertBefore(dragged, isAfter ? widget.nextSibling : widget);
+        });
+    });
+    widgetList.addEventListener("dragend", async () => {
+        if (dragged === null) { return; }
+        dragged = null;
+        const widgetIds = Array.from(
+            widgetList.querySelectorAll("[data-widget-id]"),
+            widget => Number(widget.dataset.widgetId),
+        );
+        try {
+            const response = await fetch(widgetList.dataset.widgetOrderSrc, {
+                method: "POST",
+                credentials: "same-origin",
+                headers: { "Content-Type": "application/json" },
+                body: JSON.stringify({ widget_ids: widgetIds }),
+            });
+            if (!response.ok) { throw new Error(response.statusText); }
+        } catch {
+            // show the order that is actually saved
+            location.reload();
+        }
+    });
+}
+
+document.querySelectorAll("[data-widget-lazy]").forEach(loadWidget);
+document.querySelectorAll("[data-widget-order-src]").forEach(enableWidgetReorder);
 // @license-end
@@ -1,17 +1,24 @@
 import asyncio
 
-from quart import Blueprint, flash, redirect, render_template, request, session, url_for
+from quart import Blueprint, abort, flash, redirect, render_template, request, session, url_for
 from quart_auth import login_user
 from tortoise.exceptions import IntegrityError
+from tortoise.transactions import in_transaction
 
 from ..core.auth import (
     AuthUserEnhanced,
     current_user,
+    invalidate_principal,
     login_admin_required,
     login_standard_required,
 )
 from ..core.config import get_settings
 from ..core.constants import DEFAULT_BRANDING, PUBLIC_ACCOUNT_USERNAME, SystemSettingKeys
+from ..core.dashboard import (
+    get_dashboard_template,
+    get_dashboard_templates,
+    get_public_dashboard,
+)
 from ..core.helpers import get_system_setting, set_system_setting
 from ..core.validation import check_password, is_username_allowed
 from ..database import models
@@ -51,6 +58,69 @@ async def get_switch_from_public():
     return redirect(url_for("portal.portal"))
 
 
+@blueprint.get("/dashboard-templates/")
+@login_admin_required
+async def get_dashboard_templates_index():
+    return await render_template(
+        "admin/dashboard-templates.jinja",
+        templates=await get_dashboard_templates(),
+    )
+
+
+async def get_shown_dashboard() -> models.Dashboard:
+    dashboard = await models.Dashboard.get_or_none(owner_id=current_user.auth_id, name="")
+    return dashboard or await get_public_dashboard()
+
+
+@blueprint.post("/dashboard-templates/new")
+@login_admin_required
+async def post_dashboard_templates_new():
+    name = (await request.form)["name"].strip()
+
+    if not name:
+        await flash("template name cannot be blank", "error")
+        return redirect(url_for(".get_dashboard_templates_index"))
+
+    public_user_id = await current_user.get_public_user_id()
+    if await models.Dashboard.exists(owner_id=public_user_id, name=name):
+        await flash("Template name already taken", "error")
+        return redirect(url_for(".get_dashboard_templates_index"))
+
+    async with in_transaction():
+        template = await models.Dashboard.create(owner_id=public_user_id, name=name)
+        await template.replace_widgets(await get_shown_dashboard())
+
+    await flash(f"created template '{name}'", "ok")
+    return redirect(url_for(".get_dashboard_templates_index"))
+
+
+@blueprint.get("/dashboard-templates/<int:template_id>/replace")
+@login_admin_required
+async def get_dashboard_templates_replace(template_id: int):
+    if (template := await get_dashboard_template(template_id)) is None:
+        abort(404)
+
+    await template.replace_widgets(await get_shown_dashboard())
+
+    await flash(f"replaced widgets of template '{template.name}'", "ok")
+    return redirect(url_for(".get_dashboard_templates_index"))
+
+
+@blueprint.get("/dashboard-templates/<int:template_id>/delete")
+@login_admin_required
+async def get_dashboard_templates_delete(template_id: int):
+    if (template := await get_dashboard_template(template_id)) is None:
+        abort(404)
+
+    async with in_transaction():
+        # NOTE users of the template fall back to the public dashboard
+        await models.Dashboard.filter(template_id=template.id).delete()
+        await template.delete()
+
+    await flash(f"deleted template '{template.name}'", "ok")
+    return redirect(url_for(".get_dashboard_templates_index"))
+
+
 @blueprint.get("/system-settings/")
 @login_admin_required
 async def get_system_settings():
@@ -168,8 +238,9 @@ async def post_users_new():
                 username=username,
                 is_admin=is_admin,
             )
-            user.set_password(password)
+            await user.set_password_async(password)
             await user.save()
+            await invalidate_principal(user.id)
             await flash(f"created user '{username}'", "ok")
         except IntegrityError:
             await flash("Username already taken", "error")
@@ -193,6 +264,7 @@ async def get_users_delete(user_id: int):
         await flash("You cannot delete this user while in demo mode", "error")
     else:
         await models.User.filter(id=user_id).delete()
+        await invalidate_principal(user_id)
         await flash("deleted user", "ok")
 
     return redirect(url_for(".get_users"))
@@ -219,6 +291,7 @@ async def get_users_toggle_admin(user_id: int):
 
     user.is_admin = not user.is_admin
     await user.save()
+    await invalidate_principal(user_id)
 
     if user.is_admin:
         await flash("User is now an admin", "ok")
@@ -237,7 +310,7 @@ async def post_user_force_login():
     password = form["password"]
 
     admin_user = await models.User.get(id=current_user.auth_id).only("password_hash")
-    if not admin_user.check_password(password):
+    if not await admin_user.check_password_async(password):
         await flash("admin password was incorrect", "error")
         return redirect(url_for(".get_users"))
 
@@ -56,7 +56,7 @@ async def post_admin_user():
                 username=username,
                 is_admin=True,
             )
-            user.set_password(password)
+            await user.set_password_async(password)
             await user.save()
 
             return redirect(url_for(".get_set_configs"))
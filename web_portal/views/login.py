@@ -6,6 +6,7 @@ from quart_auth import login_user, logout_user
 from ..core.auth import AuthUserEnhanced, current_user, login_standard_required
 from ..core.constants import PUBLIC_ACCOUNT_USERNAME, SystemSettingKeys
 from ..core.helpers import get_system_setting
+from ..core.security import PasswordHasherBusyException
 from ..database import models
 
 blueprint = Blueprint("login", __name__, url_prefix="/auth")
@@ -13,6 +14,16 @@ blueprint = Blueprint("login", __name__, url_prefix="/auth")
 logger = logging.getLogger("web-portal")
 
 
+async def rehash_password(user: models.User, password: str):
+    try:
+        await user.set_password_async(password)
+    except PasswordHasherBusyException:
+        # can be done on next login instead
+        return
+    await user.save(update_fields=("password_hash",))
+    logger.info("rehashed password with new hash parameters::user_id=%s", user.id)
+
+
 @blueprint.get("/login")
 async def get_login():
     if await current_user.is_authenticated:
@@ -32,7 +43,9 @@ async def post_login():
     # prevents logging in with 'public virtual' account
     if username != PUBLIC_ACCOUNT_USERNAME:
         user = await models.User.filter(username=username).get_or_none()
-        if user and user.check_password(password):
+        if user and await user.check_password_async(password):
+            if user.needs_password_rehash:
+                await rehash_password(user, password)
             login_user(AuthUserEnhanced(str(user.id)))
             return redirect(url_for("portal.portal"))
 
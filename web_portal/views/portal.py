@@ -1,6 +1,21 @@
 import asyncio
-
-from quart import Blueprint, flash, redirect, render_template, send_file, url_for
+import logging
+
+from quart import (
+    Blueprint,
+    Response,
+    abort,
+    flash,
+    get_flashed_messages,
+    make_response,
+    redirect,
+    render_template,
+    request,
+    send_file,
+    session,
+    stream_template,
+    url_for,
+)
 
 from ..core.auth import (
     current_user,
@@ -8,60 +23,109 @@ from ..core.auth import (
     login_required_if_secured,
     login_standard_required,
 )
+from ..core.cache import get_public_snapshot, make_content_etag
 from ..core.config import get_settings
-from ..core.constants import DEFAULT_BRANDING, PUBLIC_ACCOUNT_USERNAME, SystemSettingKeys
-from ..core.helpers import get_system_setting
-from ..core.plugin import PluginHandler, deconstruct_widget_name
+from ..core.constants import DEFAULT_BRANDING, SystemSettingKeys
+from ..core.dashboard import get_public_dashboard
+from ..core.helpers import get_system_setting, system_setting_prefix_filter
+from ..core.plugin import (
+    PluginException,
+    PluginHandler,
+    make_system_setting_plugin_key,
+    reload_plugin,
+)
+from ..core.rendering import (
+    WidgetRenderStatus,
+    render_dashboard_widget,
+    render_dashboard_widgets,
+    stream_dashboard_widgets,
+)
+from ..core.supervisor import get_plugin_supervisor
 from ..database import models
 
 blueprint = Blueprint("portal", __name__, url_prefix="/")
 
+logger = logging.getLogger("web-portal")
+
+
+async def get_public_snapshot_response() -> Response:
+    snapshot = get_public_snapshot()
+
+    if (public_page := snapshot.get()) is None:
+        # NOTE only one request needs to render the snapshot, others can wait for it
+        async with snapshot.lock:
+            if (public_page := snapshot.get()) is None:
+                generation = snapshot.generation
+                dashboard = await get_public_dashboard()
+                rendered_widgets = await render_dashboard_widgets(
+                    await dashboard.get_placed_widgets()
+                )
+                content = await render_template(
+                    "portal.jinja",
+                    branding=await get_system_setting(
+                        SystemSettingKeys.BRANDING, default=DEFAULT_BRANDING
+                    ),
+                    rendered_widgets=rendered_widgets,
+                )
+                if all(
+                    (widget.is_ok and widget.is_cacheable) or widget.is_deferred
+                    for widget in rendered_widgets
+                ):
+                    public_page = snapshot.set(content, generation)
+                else:
+                    # don't keep failures or widgets that must always be rendered
+                    return await make_response(content)
+
+    response = await make_response(public_page.content)
+    response.set_etag(public_page.etag)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return await response.make_conditional(request)
+
 
 @blueprint.get("/")
 @login_required_if_secured
 async def portal():
-    has_setup = await models.SystemSetting.get_or_none(key="has_setup")
-    if has_setup is None or has_setup.value is False:
+    if not await get_system_setting(SystemSettingKeys.HAS_SETUP, default=False):
         return redirect(url_for("install.get_index"))
 
     user_id = current_user.auth_id
     dashboard = None
 
+    if get_settings().PUBLIC_SNAPSHOT and user_id is None and "_flashes" not in session:
+        return await get_public_snapshot_response()
+
     # load either personal dashboard or 'public' as a fallback
     if user_id is not None:
-        dashboard = await models.Dashboard.get_or_none(owner_id=user_id).prefetch_related(
-            "widgets", "widgets__widget", "widgets__widget__plugin"
-        )
+        dashboard = await models.Dashboard.get_or_none(owner_id=user_id, name="")
     if dashboard is None:
-        public_account = await models.User.filter(username=PUBLIC_ACCOUNT_USERNAME).get()
-        dashboard = (await models.Dashboard.get_or_create(owner=public_account))[0]
-        await dashboard.fetch_related("widgets", "widgets__widget", "widgets__widget__plugin")
-
-    rendered_widgets = []
-    failed_widgets = []
-
-    for dashboard_widget in dashboard.widgets_sorted():
-        dashboard_widget: models.DashboardWidget
-        widget: models.Widget = dashboard_widget.widget
-        plugin_name = widget.plugin.internal_name
-        widget_name = deconstruct_widget_name(plugin_name, widget.internal_name)
-        loaded_plugin = PluginHandler.get_loaded_plugin(plugin_name)
-
-        if loaded_plugin is None or loaded_plugin.meta.get_rendered_widget is None:
-            # skips loading plugin and warn user
-            failed_widgets.append(dashboard_widget.name)
-            continue
-
-        try:
-            rendered_widget = await loaded_plugin.meta.get_rendered_widget(
-                widget_name,
-                dashboard_widget.id,
-                dashboard_widget.config,
-            )
-            rendered_widgets.append((dashboard_widget, rendered_widget))
-        except ValueError:
-            # skips loading widget and warn user
-            failed_widgets.append(dashboard_widget.name)
+        dashboard = await get_public_dashboard()
+    # NOTE dashboards inheriting a template share its widgets (and their cached renders)
+    placed_widgets = await dashboard.get_placed_widgets()
+
+    branding = await get_system_setting(SystemSettingKeys.BRANDING, default=DEFAULT_BRANDING)
+
+    if get_settings().STREAM_PORTAL:
+        # NOTE session is saved before the body is sent, so messages must be taken now;
+        #      failed widgets are shown in place, as it is too late to flash them
+        get_flashed_messages()
+        return await stream_template(
+            "portal.jinja",
+            branding=branding,
+            rendered_widgets=stream_dashboard_widgets(placed_widgets),
+        )
+
+    rendered_widgets = await render_dashboard_widgets(placed_widgets)
+
+    # skips showing failed widgets and warn user
+    failed_widgets = [
+        widget.dashboard_widget.name
+        for widget in rendered_widgets
+        if widget.status is WidgetRenderStatus.FAILED
+    ]
+    rendered_widgets = [
+        widget for widget in rendered_widgets if widget.status is not WidgetRenderStatus.FAILED
+    ]
 
     if failed_widgets:
         await flash(
@@ -72,11 +136,54 @@ async def portal():
 
     return await render_template(
         "portal.jinja",
-        branding=await get_system_setting(SystemSettingKeys.BRANDING, default=DEFAULT_BRANDING),
+        branding=branding,
         rendered_widgets=rendered_widgets,
     )
 
 
+@blueprint.get("/widget/<int:dashboard_widget_id>/render")
+@login_required_if_secured
+async def get_widget_render(dashboard_widget_id: int):
+    dashboard_widget = await models.DashboardWidget.get_or_none(
+        id=dashboard_widget_id
+    ).prefetch_related("dashboard", "widget", "widget__plugin")
+
+    if dashboard_widget is None:
+        abort(404)
+
+    # widgets are visible to their owner, public dashboard and template widgets are visible to all
+    owner_id = str(dashboard_widget.dashboard.owner_id)
+    if owner_id != current_user.auth_id and owner_id != await current_user.get_public_user_id():
+        abort(401)
+
+    rendered_widget = await render_dashboard_widget(
+        dashboard_widget,
+        timeout=get_settings().WIDGET_RENDER_TIMEOUT,
+    )
+
+    response = await make_response(
+        await render_template("shared/includes/widget-content.jinja", widget=rendered_widget)
+    )
+
+    match rendered_widget.status:
+        case WidgetRenderStatus.OK:
+            response.set_etag(make_content_etag(rendered_widget.content))
+            response.cache_control.private = True
+            response.cache_control.no_cache = True
+            await response.make_conditional(request)
+        case WidgetRenderStatus.TIMED_OUT:
+            response.status_code = 504
+            response.cache_control.no_store = True
+        case WidgetRenderStatus.SUSPENDED:
+            response.status_code = 503
+            response.cache_control.no_store = True
+        case _:
+            response.status_code = 500
+            response.cache_control.no_store = True
+
+    return response
+
+
 @blueprint.get("/static/custom.css")
 async def get_custom_css():
     file_path = get_settings().DATA_PATH / "custom.css"
@@ -96,13 +203,37 @@ async def get_plugins_index():
         internal_name__not_in=PluginHandler.get_loaded_plugin_names()
     ).all()
 
+    supervisor = get_plugin_supervisor()
+    plugin_health = {
+        name: supervisor.get_health(name) for name in PluginHandler.get_loaded_plugin_names()
+    }
+
     return await render_template(
         "plugins.jinja",
         loaded_plugins=loaded_plugins,
         missing_plugins=missing_plugins,
+        plugin_health=plugin_health,
     )
 
 
+@blueprint.get("/admin/plugins/reload/<plugin_name>")
+@login_admin_required
+async def get_reload_plugin(plugin_name: str):
+    if plugin_name not in PluginHandler.get_loaded_plugin_names():
+        await flash("cannot reload a plugin that is not loaded", "error")
+        return redirect(url_for(".get_plugins_index"))
+
+    try:
+        await reload_plugin(plugin_name)
+    except PluginException:
+        logger.exception("unable to reload plugin::plugin_name='%s'", plugin_name)
+        await flash("unable to reload plugin, check the logs for details", "error")
+    else:
+        await flash("reloaded plugin, changes to routes and database models need a restart", "ok")
+
+    return redirect(url_for(".get_plugins_index"))
+
+
 @blueprint.get("/admin/plugins/delete-unloaded/<plugin_name>")
 @login_admin_required
 async def get_delete_plugin_data(plugin_name: str):
@@ -114,7 +245,9 @@ async def get_delete_plugin_data(plugin_name: str):
 
     await asyncio.gather(
         models.Plugin.filter(internal_name=plugin_name).delete(),
-        models.SystemSetting.filter(key__startswith=f"plugin__{plugin_name}").delete(),
+        models.SystemSetting.filter(
+            system_setting_prefix_filter(make_system_setting_plugin_key(plugin_name, ""))
+        ).delete(),
     )
 
     await flash("deleted plugin data", "ok")
@@ -1,11 +1,26 @@
 import asyncio
 import logging
 
-from quart import Blueprint, flash, redirect, render_template, request, session, url_for
+from pydantic import ValidationError
+from quart import Blueprint, abort, flash, redirect, render_template, request, session, url_for
 from quart_auth import logout_user
-
-from ..core.auth import current_user, login_standard_required
-from ..core.plugin import PluginHandler, deconstruct_widget_name
+from tortoise.transactions import in_transaction
+
+from ..core.auth import current_user, invalidate_principal, login_standard_required
+from ..core.cache import get_public_snapshot
+from ..core.dashboard import (
+    DashboardBatch,
+    DashboardOperationException,
+    apply_dashboard_operations,
+    get_dashboard_template,
+    get_dashboard_templates,
+    get_editable_dashboard,
+    get_public_dashboard,
+    get_widget_copy_id,
+    materialize_dashboard,
+)
+from ..core.plugin import PluginException, PluginHandler, deconstruct_widget_name
+from ..core.supervisor import PluginCircuitOpenException, get_plugin_supervisor
 from ..core.validation import check_password
 from ..database import models
 
@@ -14,18 +29,54 @@ blueprint = Blueprint("settings", __name__, url_prefix="/settings")
 logger = logging.getLogger("web-portal")
 
 
+async def get_or_create_dashboard() -> tuple[models.Dashboard, bool]:
+    """
+    Get the current user's dashboard, a new dashboard inherits the public dashboard
+    """
+    dashboard, is_new_dash = await models.Dashboard.get_or_create(
+        owner_id=current_user.auth_id, name=""
+    )
+    if is_new_dash and not await current_user.is_public_user:
+        await dashboard.inherit(await get_public_dashboard())
+    return dashboard, is_new_dash
+
+
+async def get_editable_widget(widget_id: int) -> tuple[models.Dashboard, int]:
+    """
+    Get the current user's dashboard so it can be changed, with the id of a widget on it,
+    the ids of the template's widgets are swapped for the ids of their copies
+    """
+    dashboard, copies = await get_editable_dashboard()
+    if widget_id in copies:
+        return dashboard, copies[widget_id]
+    return dashboard, await get_widget_copy_id(dashboard, widget_id) or widget_id
+
+
+async def has_own_widgets(dashboard: models.Dashboard | None) -> bool:
+    """
+    Whether a dashboard has placed widgets, that would be removed by using a template
+    """
+    if dashboard is None or dashboard.is_inheriting:
+        return False
+    return await models.DashboardWidget.filter(dashboard_id=dashboard.id).exists()
+
+
 @blueprint.get("/")
 @login_standard_required
 async def get_index():
-    user, dashboard = await asyncio.gather(
+    user, dashboard, templates = await asyncio.gather(
         models.User.get(id=current_user.auth_id),
-        models.Dashboard.get_or_none(owner_id=current_user.auth_id),
+        models.Dashboard.get_or_none(owner_id=current_user.auth_id, name=""),
+        get_dashboard_templates(),
     )
 
     return await render_template(
         "settings/index.jinja",
         user=user,
         is_personal_dash=bool(dashboard),
+        dashboard=dashboard,
+        has_own_widgets=await has_own_widgets(dashboard),
+        templates=templates,
     )
 
 
@@ -53,12 +104,13 @@ async def post_change_password():
     if (message := check_password(user.username, new_password)) is not None:
         await flash(message, "error")
         return redirect(url_for(".get_user_account"))
-    if not user.check_password(current_password):
+    if not await user.check_password_async(current_password):
         await flash("your current password is not valid", "error")
         logger.warning("failed change password attempt from '%s'", request.remote_addr)
         return redirect(url_for(".get_user_account"))
-    user.set_password(new_password)
+    await user.set_password_async(new_password)
     await user.save()
+    await invalidate_principal(user.id)
     logout_user()
     session.clear()
     await flash("password changed. You have been logged out", "ok")
@@ -69,9 +121,9 @@ async def post_change_password():
 @login_standard_required
 async def get_edit_dashboard():
     widgets = await models.Widget.all()
-    dashboard, is_new_dash = await models.Dashboard.get_or_create(owner_id=current_user.auth_id)
-    await dashboard.fetch_related("widgets")
-    placed_widgets = dashboard.widgets_sorted()
+    dashboard, is_new_dash = await get_or_create_dashboard()
+    placed_widgets = await dashboard.get_placed_widgets()
+    template = await dashboard.template if dashboard.is_inheriting else None
 
     if is_new_dash:
         await flash("Created new dashboard", "ok")
@@ -80,6 +132,7 @@ async def get_edit_dashboard():
         "settings/dashboard-edit.jinja",
         widgets=widgets,
         placed_widgets=placed_widgets,
+        template=template,
     )
 
 
@@ -95,7 +148,7 @@ async def post_add_widget():
         await flash("widget name cannot be blank", "error")
         return redirect(url_for(".get_edit_dashboard"))
 
-    dashboard = await models.Dashboard.filter(owner_id=current_user.auth_id).get()
+    dashboard, _ = await get_editable_dashboard()
 
     await dashboard.append_widget(
         models.DashboardWidget(
@@ -111,16 +164,27 @@ async def post_add_widget():
 @blueprint.get("/dashboard/<int:widget_id>/edit")
 @login_standard_required
 async def get_edit_dashboard_widget(widget_id: int):
-    dashboard = await models.Dashboard.get(owner_id=current_user.auth_id)
+    dashboard, _ = await get_or_create_dashboard()
+    if not dashboard.is_inheriting and (copy_id := await get_widget_copy_id(dashboard, widget_id)):
+        # the template's widgets were copied since the page linking here was loaded
+        return redirect(url_for(".get_edit_dashboard_widget", widget_id=copy_id))
+    # NOTE an inherited widget is only copied once a change is made in the editor
     widget = (
-        await dashboard.widgets.filter(id=widget_id)
+        await models.DashboardWidget.filter(
+            id=widget_id,
+            dashboard_id=dashboard.template_id or dashboard.id,  # type: ignore
+        )
         .get()
         .prefetch_related("widget", "widget__plugin")
     )
 
     loaded_plugin = PluginHandler.get_loaded_plugin(widget.widget.plugin.internal_name)
 
-    if loaded_plugin is None or loaded_plugin.meta.get_rendered_widget_edit is None:
+    try:
+        has_editor = loaded_plugin is not None and loaded_plugin.meta.get_rendered_widget_edit
+    except PluginException:
+        has_editor = False
+    if not has_editor:
         await flash("Editor could not be loaded, please contact administrator", "error")
         return redirect(url_for(".get_edit_dashboard"))
 
@@ -131,7 +195,9 @@ async def get_edit_dashboard_widget(widget_id: int):
     back_url = url_for(".get_edit_dashboard_widget", widget_id=widget.id)
 
     try:
-        rendered_editor = await loaded_plugin.meta.get_rendered_widget_edit(
+        rendered_editor = await get_plugin_supervisor().call(
+            loaded_plugin,
+            loaded_plugin.meta.get_rendered_widget_edit,
             widget_name,
             widget.id,
             widget.config,
@@ -143,6 +209,9 @@ async def get_edit_dashboard_widget(widget_id: int):
             widget=widget,
             rendered_editor=rendered_editor,
         )
+    except PluginCircuitOpenException:
+        await flash("Editor is temporarily unavailable, please try again later", "error")
+        return redirect(url_for(".get_edit_dashboard"))
     except ValueError:
         await flash("Editor could not be loaded, please contact administrator", "error")
         return redirect(url_for(".get_edit_dashboard"))
@@ -151,9 +220,6 @@ async def get_edit_dashboard_widget(widget_id: int):
 @blueprint.post("/dashboard/<int:widget_id>/edit")
 @login_standard_required
 async def post_edit_dashboard_widget(widget_id: int):
-    dashboard = await models.Dashboard.get(owner_id=current_user.auth_id)
-    widget: models.DashboardWidget = await dashboard.widgets.filter(id=widget_id).get()
-
     form = await request.form
 
     widget_name = form["name"].strip()
@@ -163,56 +229,141 @@ async def post_edit_dashboard_widget(widget_id: int):
         await flash("widget name cannot be blank", "error")
         return redirect(url_for(".get_edit_dashboard_widget", widget_id=widget_id))
 
-    widget.name = widget_name
-    widget.show_header = show_header
-    await widget.save()
+    async with in_transaction():
+        dashboard, widget_id = await get_editable_widget(widget_id)
+        widget: models.DashboardWidget = await dashboard.widgets.filter(id=widget_id).get()
+        widget.name = widget_name
+        widget.show_header = show_header
+        await widget.save()
+    get_public_snapshot().invalidate()
 
     await flash("updated widget", "ok")
 
     return redirect(url_for(".get_edit_dashboard_widget", widget_id=widget_id))
 
 
-@blueprint.get("/dashboard/widget/<int:widget_id>/shift-left")
+@blueprint.post("/dashboard/widget/<int:widget_id>/shift-left")
 @login_standard_required
-async def get_widget_shift_left(widget_id: int):
-    dashboard = (
-        await models.Dashboard.filter(owner_id=current_user.auth_id)
-        .prefetch_related("widgets")
-        .get()
-    )
-    await dashboard.shift_widget_left(widget_id)
+async def post_widget_shift_left(widget_id: int):
+    async with in_transaction():
+        dashboard, widget_id = await get_editable_widget(widget_id)
+        await dashboard.shift_widget_left(widget_id)
 
     return redirect(url_for(".get_edit_dashboard"))
 
 
-@blueprint.get("/dashboard/widget/<int:widget_id>/shift-right")
+@blueprint.post("/dashboard/widget/<int:widget_id>/shift-right")
 @login_standard_required
-async def get_widget_shift_right(widget_id: int):
-    dashboard = (
-        await models.Dashboard.filter(owner_id=current_user.auth_id)
-        .prefetch_related("widgets")
-        .get()
-    )
-    await dashboard.shift_widget_right(widget_id)
+async def post_widget_shift_right(widget_id: int):
+    async with in_transaction():
+        dashboard, widget_id = await get_editable_widget(widget_id)
+        await dashboard.shift_widget_right(widget_id)
 
     return redirect(url_for(".get_edit_dashboard"))
 
 
-@blueprint.get("/dashboard/widget/<int:widget_id>/delete")
+@blueprint.post("/dashboard/widget/order")
 @login_standard_required
-async def get_delete_widget(widget_id: int):
-    dashboard = await models.Dashboard.filter(owner_id=current_user.auth_id).get()
+async def post_widget_order():
+    body = await request.get_json(silent=True)
+    widget_ids = body.get("widget_ids") if isinstance(body, dict) else None
+
+    if not isinstance(widget_ids, list) or not all(
+        isinstance(widget_id, int) for widget_id in widget_ids
+    ):
+        abort(400)
+
+    dashboard = await models.Dashboard.get_or_none(owner_id=current_user.auth_id, name="")
+    if dashboard is None:
+        abort(404)
 
-    await dashboard.pop_widget_by_id(widget_id)
+    try:
+        # NOTE a rejected order rolls back the copy, so the dashboard keeps inheriting
+        async with in_transaction():
+            copies = await materialize_dashboard(dashboard)
+            await dashboard.set_widget_order([copies.get(x, x) for x in widget_ids])
+    except ValueError:
+        abort(400)
+
+    return "", 204
+
+
+@blueprint.post("/dashboard/batch")
+@login_standard_required
+async def post_dashboard_batch():
+    try:
+        batch = DashboardBatch.model_validate_json(await request.get_data())
+    except ValidationError as err:
+        return {
+            "error": "invalid operations",
+            "details": err.errors(include_url=False, include_context=False, include_input=False),
+        }, 400
+
+    dashboard, _ = await get_or_create_dashboard()
+
+    try:
+        widgets, refs = await apply_dashboard_operations(dashboard, batch.operations)
+    except DashboardOperationException as err:
+        return {"error": str(err), "index": err.index}, 400
+
+    return {
+        "widgets": [
+            {
+                "id": widget.id,
+                "widget_id": widget.widget_id,
+                "name": widget.name,
+                "show_header": widget.show_header,
+                "position": widget.position,
+            }
+            for widget in widgets
+        ],
+        "refs": refs,
+    }
+
+
+@blueprint.post("/dashboard/widget/<int:widget_id>/delete")
+@login_standard_required
+async def post_delete_widget(widget_id: int):
+    async with in_transaction():
+        dashboard, widget_id = await get_editable_widget(widget_id)
+        await dashboard.pop_widget_by_id(widget_id)
 
     await flash("deleted widget", "ok")
 
     return redirect(url_for(".get_edit_dashboard"))
 
 
+@blueprint.post("/dashboard/template")
+@login_standard_required
+async def post_dashboard_template():
+    form = await request.form
+    template_id = form.get("template-id", type=int)
+
+    if await current_user.is_public_user:
+        await flash("The public dashboard cannot use a template", "error")
+        return redirect(url_for(".get_index"))
+
+    if template_id is None:
+        template = await get_public_dashboard()
+    elif (template := await get_dashboard_template(template_id)) is None:
+        abort(404)
+
+    dashboard, _ = await models.Dashboard.get_or_create(owner_id=current_user.auth_id, name="")
+    if not form.get("replace-widgets", False, bool) and await has_own_widgets(dashboard):
+        await flash(
+            "Using a template removes your placed widgets, confirm to replace them", "error"
+        )
+        return redirect(url_for(".get_index"))
+    await dashboard.inherit(template)
+
+    await flash(f"dashboard now uses the '{template.name or 'public'}' template", "ok")
+    return redirect(url_for(".get_index"))
+
+
 @blueprint.get("/dashboard/restore-defaults")
 @login_standard_required
 async def get_restore_defaults():
-    await models.Dashboard.filter(owner_id=current_user.auth_id).delete()
+    await models.Dashboard.filter(owner_id=current_user.auth_id, name="").delete()
+    get_public_snapshot().invalidate()
     await flash("Reset dashboard for account", "ok")
     return redirect(url_for(".get_index"))